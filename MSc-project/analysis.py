@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+from db import load_answer_rows
+
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_CHUNK = 100
+CI_LEVEL = 0.95
+
+
+def answer_matrices(rows) -> dict:
+    # rows of (variant_id, model_name, k_index, answer) ->
+    # {model: (variant_ids, labels, codes)} with codes a variants × k int matrix,
+    # -1 where a repeat is missing. Answers were extracted when the runs were saved.
+    if not rows:
+        return {}
+    df = pd.DataFrame(rows, columns=["variant_id", "model_name", "k_index", "answer"])
+
+    out = {}
+    for model_name, g in df.groupby("model_name", sort=True):
+        v_codes, variant_ids = pd.factorize(g["variant_id"])
+        a_codes, labels = pd.factorize(g["answer"])
+        k_cols = g["k_index"].to_numpy() - 1
+        codes = np.full((len(variant_ids), int(k_cols.max()) + 1), -1, dtype=np.int32)
+        codes[v_codes, k_cols] = a_codes
+        out[model_name] = (list(variant_ids), list(labels), codes)
+    return out
+
+
+def category_counts(codes: np.ndarray, n_labels: int) -> np.ndarray:
+    n_variants = codes.shape[0]
+    rows = np.broadcast_to(np.arange(n_variants)[:, None], codes.shape)
+    valid = codes >= 0
+    flat = rows[valid] * n_labels + codes[valid]
+    return np.bincount(flat, minlength=n_variants * n_labels).reshape(n_variants, n_labels)
+
+
+def per_variant_stats(counts: np.ndarray) -> dict:
+    n = counts.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+    p = counts / safe_n[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = np.where(p > 0, -p * np.log2(p), 0.0).sum(axis=1) + 0.0
+        # share of repeat pairs that disagree; 0 for a single repeat
+        pairs = n * (n - 1)
+        agree_pairs = (counts * (counts - 1)).sum(axis=1)
+        repeat_flip = np.where(pairs > 0, 1 - agree_pairs / np.maximum(pairs, 1), 0.0)
+    return {
+        "n": n,
+        "modal": counts.argmax(axis=1),
+        "majority_share": counts.max(axis=1) / safe_n,
+        "entropy": entropy,
+        "repeat_flip": repeat_flip,
+        "rateable": n >= 2,
+        "agree_pairs": agree_pairs,
+        "pairs": pairs,
+    }
+
+
+def fleiss_kappa(counts: np.ndarray) -> float:
+    # variants are the subjects and repeats the raters; subjects with fewer than
+    # two repeats carry no agreement information and are dropped
+    n = counts.sum(axis=1)
+    counts = counts[n >= 2]
+    n = n[n >= 2]
+    if not len(n):
+        return float("nan")
+    p_i = ((counts * (counts - 1)).sum(axis=1)) / (n * (n - 1))
+    p_j = counts.sum(axis=0) / n.sum()
+    p_e = (p_j**2).sum()
+    return float("nan") if p_e >= 1 else float((p_i.mean() - p_e) / (1 - p_e))
+
+
+def _bootstrap(counts: np.ndarray, stats: dict, flipped: np.ndarray, samples: int, seed: int) -> dict:
+    # resample variants with replacement, expressed as per-variant counts so
+    # each statistic for a whole chunk of replicates is one matrix product
+    n_variants = counts.shape[0]
+    rng = np.random.default_rng(seed)
+    rateable = stats["rateable"].astype(np.float64)
+    p_i = np.where(stats["rateable"], stats["agree_pairs"] / np.maximum(stats["pairs"], 1), 0.0)
+    per_variant = np.column_stack(
+        [flipped, stats["majority_share"], stats["entropy"], stats["repeat_flip"] * rateable, rateable, p_i]
+    )
+    rated_counts = counts * rateable[:, None]
+    results = []
+    for start in range(0, samples, BOOTSTRAP_CHUNK):
+        b = min(BOOTSTRAP_CHUNK, samples - start)
+        idx = rng.integers(0, n_variants, size=(b, n_variants))
+        idx += (np.arange(b) * n_variants)[:, None]
+        w = np.bincount(idx.ravel(), minlength=b * n_variants).reshape(b, n_variants).astype(np.float64)
+        sums = w @ per_variant
+        n_rated = np.maximum(sums[:, 4], 1)
+        p_j = w @ rated_counts
+        p_j /= np.maximum(p_j.sum(axis=1, keepdims=True), 1)
+        p_e = (p_j**2).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            kappa = (sums[:, 5] / n_rated - p_e) / (1 - p_e)
+        results.append(
+            np.column_stack(
+                [sums[:, 0] / n_variants, sums[:, 1] / n_variants, sums[:, 2] / n_variants, sums[:, 3] / n_rated, kappa]
+            )
+        )
+    boot = np.vstack(results)
+    alpha = (1 - CI_LEVEL) / 2
+    lo, hi = np.nanquantile(boot, [alpha, 1 - alpha], axis=0)
+    names = ["flip_rate", "majority_agreement", "entropy_bits", "repeat_flip_rate", "fleiss_kappa"]
+    return {name: (float(lo[i]), float(hi[i])) for i, name in enumerate(names)}
+
+
+def sensitivity_metrics(variant_ids, labels, codes: np.ndarray, samples: int = BOOTSTRAP_SAMPLES, seed: int = 0):
+    counts = category_counts(codes, len(labels))
+    stats = per_variant_stats(counts)
+    has_runs = stats["n"] > 0
+    counts, stats = counts[has_runs], {k: v[has_runs] for k, v in stats.items()}
+    variant_ids = [v for v, keep in zip(variant_ids, has_runs) if keep]
+
+    # the consensus answer is the most common one across all runs; a variant
+    # "flips" when its own modal answer differs from it
+    consensus = int(counts.sum(axis=0).argmax())
+    flipped = (stats["modal"] != consensus).astype(np.float64)
+    rated = stats["rateable"]
+
+    summary = {
+        "variants": len(variant_ids),
+        "runs": int(stats["n"].sum()),
+        "k": codes.shape[1],
+        "answers": len(labels),
+        "consensus_answer": labels[consensus],
+        "flip_rate": float(flipped.mean()),
+        "majority_agreement": float(stats["majority_share"].mean()),
+        "entropy_bits": float(stats["entropy"].mean()),
+        "repeat_flip_rate": float(stats["repeat_flip"][rated].mean()) if rated.any() else float("nan"),
+        "fleiss_kappa": fleiss_kappa(counts),
+    }
+    summary["ci"] = _bootstrap(counts, stats, flipped, samples, seed) if samples else {}
+
+    per_variant = pd.DataFrame(
+        {
+            "variant_id": variant_ids,
+            "runs": stats["n"],
+            "modal_answer": np.asarray(labels, dtype=object)[stats["modal"]],
+            "flipped": flipped.astype(bool),
+            "majority_share": stats["majority_share"],
+            "entropy_bits": stats["entropy"],
+            "repeat_flip_rate": stats["repeat_flip"],
+        }
+    )
+    return summary, per_variant
+
+
+def sensitivity_report(base_prompt_id: str, samples: int = BOOTSTRAP_SAMPLES, seed: int = 0):
+    # one summary row per model plus the per-variant breakdown for each
+    summaries, per_variant = [], {}
+    for model_name, (variant_ids, labels, codes) in answer_matrices(load_answer_rows(base_prompt_id)).items():
+        summary, table = sensitivity_metrics(variant_ids, labels, codes, samples=samples, seed=seed)
+        summaries.append({"model": model_name, **summary})
+        per_variant[model_name] = table
+    return summaries, per_variant
+
+
+def summary_table(summaries: list[dict]) -> pd.DataFrame:
+    rows = []
+    for s in summaries:
+        row = {k: s[k] for k in ("model", "variants", "runs", "k", "answers", "consensus_answer")}
+        for metric in ("flip_rate", "majority_agreement", "entropy_bits", "repeat_flip_rate", "fleiss_kappa"):
+            row[metric] = s[metric]
+            if metric in s["ci"]:
+                lo, hi = s["ci"][metric]
+                row[f"{metric} {int(CI_LEVEL * 100)}% CI"] = f"[{lo:.3f}, {hi:.3f}]"
+        rows.append(row)
+    return pd.DataFrame(rows)
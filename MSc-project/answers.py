@@ -0,0 +1,147 @@
+import json
+import re
+
+try:
+    # several times faster than json on model-sized payloads; optional
+    import orjson
+except ImportError:
+    orjson = None
+
+ANSWER_KEYS = ("answer", "decision", "label", "verdict", "result")
+
+# leading whitespace plus an optional opening fence (and its json tag)
+_FENCE_OPEN_RE = re.compile(r"\s*(```(?:json)?)?\s*", re.IGNORECASE)
+_TRAILING_PUNCT_RE = re.compile(r"[\s.!;:,\"'`*]+$")
+_SPACE_RE = re.compile(r"\s+")
+
+# YES/NO with optional markdown emphasis or quotes around it
+_YES_NO = r"\s*[*`\"'#>]*\s*(YES|NO)\b[*`\"']*"
+_YES_NO_ONLY_RE = re.compile(_YES_NO + r"[.!]?\s*", re.IGNORECASE)
+_YES_NO_REASON_RE = re.compile(_YES_NO + r"\s*[-–—]\s*\S", re.IGNORECASE)
+_YES_NO_LEAD_RE = re.compile(_YES_NO, re.IGNORECASE)
+
+
+# ---- JSON ----
+def _loads(text: str):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode("utf-8")
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def _json_bounds(text: str) -> tuple[int, int, bool]:
+    # (start, end, fenced) of the payload inside optional whitespace and a
+    # ``` fence, found by index so the body is sliced at most once
+    m = _FENCE_OPEN_RE.match(text)
+    start, fenced = m.end(), m.group(1) is not None
+    end = len(text)
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if fenced and text.endswith("```", start, end):
+        end -= 3
+        while end > start and text[end - 1].isspace():
+            end -= 1
+    return start, end, fenced
+
+
+def _span(text: str, start: int, end: int) -> str:
+    return text if start == 0 and end == len(text) else text[start:end]
+
+
+def parse_json(text: str):
+    text = text or ""
+    start, end, _ = _json_bounds(text)
+    try:
+        return _loads(_span(text, start, end)), True
+    except ValueError:
+        return None, False
+
+
+def _object_answer(obj):
+    if isinstance(obj, dict):
+        for key in ANSWER_KEYS:
+            if key in obj:
+                return normalize_answer(str(obj[key]))
+    return None
+
+
+def normalize_answer(text: str) -> str:
+    # the comparable part of a response: the answer field of a JSON object,
+    # else the first non-empty line, case- and punctuation-insensitive
+    text = text or ""
+    start, end, _ = _json_bounds(text)
+    body = _span(text, start, end)
+    if body[:1] in "{[":
+        try:
+            obj = _loads(body)
+        except ValueError:
+            obj = None
+        answer = _object_answer(obj)
+        if answer is not None:
+            return answer
+        if obj is not None:
+            return _dumps(obj)
+    line = next((ln for ln in body.splitlines() if ln.strip()), "").replace("*", "").replace("`", "")
+    return _SPACE_RE.sub(" ", _TRAILING_PUNCT_RE.sub("", line.strip().lstrip("#>- "))).upper()
+
+
+# ---- Per-format extractors ----
+# each takes the raw response and returns (answer, valid, error): the normalized
+# answer analysis compares, whether the response follows the format the variant
+# asked for, and why not. A malformed response still gets a best-effort answer.
+def _extract_free_text(text: str):
+    answer = normalize_answer(text)
+    return answer, bool(answer), None if answer else "empty response"
+
+
+def _extract_binary_only(text: str):
+    m = _YES_NO_ONLY_RE.fullmatch(text)
+    if m:
+        return m.group(1).upper(), True, None
+    m = _YES_NO_LEAD_RE.match(text)
+    if m:
+        return m.group(1).upper(), False, "extra text after YES/NO"
+    return normalize_answer(text), False, "no YES/NO answer"
+
+
+def _extract_binary_reason(text: str):
+    m = _YES_NO_REASON_RE.match(text)
+    if m:
+        return m.group(1).upper(), True, None
+    m = _YES_NO_LEAD_RE.match(text)
+    if m:
+        return m.group(1).upper(), False, "no hyphen and rationale after YES/NO"
+    return normalize_answer(text), False, "no leading YES/NO answer"
+
+
+def _extract_json(text: str):
+    start, end, fenced = _json_bounds(text)
+    try:
+        obj = _loads(_span(text, start, end))
+    except ValueError:
+        return normalize_answer(text), False, "invalid JSON"
+    answer = _object_answer(obj)
+    if answer is None:
+        if not isinstance(obj, dict):
+            return _dumps(obj), False, "JSON is not an object"
+        return _dumps(obj), False, f"no {'/'.join(ANSWER_KEYS)} field"
+    if fenced:
+        return answer, False, "JSON wrapped in a code fence"
+    return answer, True, None
+
+
+# keyed by perturbations.OUTPUT_FORMATS id; variants without a format axis
+# (or with an unknown one) are treated as free text
+EXTRACTORS = {
+    "fmt_free_text": _extract_free_text,
+    "fmt_binary_only": _extract_binary_only,
+    "fmt_binary_reason": _extract_binary_reason,
+    "fmt_json_strict": _extract_json,
+}
+
+
+def extract_answer(format_id: str | None, text: str):
+    return EXTRACTORS.get(format_id, _extract_free_text)(text or "")
@@ -1,6 +1,26 @@
+import pandas as pd
 import streamlit as st
 
-from db import list_prompt_variants, load_prompt_variant, list_runs_for_variant
+from analysis import sensitivity_report, summary_table
+from db import (
+    answer_error_counts,
+    count_prompt_variants,
+    iter_variants_with_runs,
+    list_variant_aggregates,
+    load_run_response,
+    load_variant_aggregates,
+)
+
+
+def _aggregate_line(a: dict) -> str:
+    p50 = f"{a['latency_p50_ms']:.0f}ms" if a["latency_p50_ms"] is not None else "n/a"
+    p95 = f"{a['latency_p95_ms']:.0f}ms" if a["latency_p95_ms"] is not None else "n/a"
+    answers = ", ".join(f"{k} ×{v}" for k, v in sorted(a["answers"].items(), key=lambda kv: -kv[1])[:5])
+    return (
+        f"{a['model_name']}: {a['n_runs']} runs • valid format {a['answer_valid_rate']:.0%} • "
+        f"parse_ok {a['parse_ok_rate']:.0%} • "
+        f"latency p50 {p50} / p95 {p95} • {answers}"
+    )
 
 
 def render_answers_per_variant(): # redering ui componeents 
@@ -11,23 +31,85 @@ def render_answers_per_variant(): # redering ui componeents
         st.caption("Select a Base Prompt in Step 3 to view per-variant answers.")
         return
 
-    variants = list_prompt_variants(st.session_state.active_spec_id, base_prompt_id)
-    if not variants:
+    total = count_prompt_variants(st.session_state.active_spec_id, base_prompt_id)
+    if not total:
         st.info("No variants available.")
         return
 
-    for vid, created_at, ptype, pid, strength in variants:
-        st.subheader(f"Variant {vid[:8]} • {ptype}/{pid}")
+    # computed over every run of the base prompt, so only when the panel is open
+    metrics_exp = st.expander("Sensitivity metrics", key="sensitivity_metrics", on_change="rerun")
+    with metrics_exp:
+        if metrics_exp.open:
+            summaries, per_variant = sensitivity_report(base_prompt_id)
+            if not summaries:
+                st.caption("No runs yet.")
+            else:
+                st.dataframe(summary_table(summaries), hide_index=True)
+                st.caption(
+                    "flip_rate: share of variants whose most common answer differs from the overall one • "
+                    "repeat_flip_rate: share of disagreeing pairs among a variant's k repeats • "
+                    "Fleiss' kappa treats variants as subjects and repeats as raters • "
+                    "CIs bootstrap over variants"
+                )
+                model = st.selectbox("Per-variant breakdown for", options=list(per_variant), key="sensitivity_model")
+                st.dataframe(per_variant[model], hide_index=True)
+                errors = answer_error_counts(base_prompt_id)
+                if errors:
+                    st.caption(
+                        "Responses not in the requested format: "
+                        + " • ".join(f"{error} ×{n}" for error, n in errors)
+                    )
+
+    with st.expander("Per-variant summary"):
+        aggregates = list_variant_aggregates(st.session_state.active_spec_id, base_prompt_id)
+        if not aggregates:
+            st.caption("No runs yet.")
+        else:
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        {**{k: v for k, v in a.items() if k != "answers"}, "top_answer": max(a["answers"], key=a["answers"].get)}
+                        for a in aggregates
+                    ]
+                ),
+                hide_index=True,
+            )
+
+    c1, c2 = st.columns(2)
+    with c1:
+        page_size = st.selectbox("Variants per page", options=[5, 10, 20, 50], index=1, key="answers_page_size")
+    n_pages = (total + page_size - 1) // page_size
+    with c2:
+        page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1, key="answers_page")
+    st.caption(f"{total} variants")
+
+    variants = iter_variants_with_runs(
+        st.session_state.active_spec_id,
+        base_prompt_id,
+        limit=page_size,
+        offset=(int(page) - 1) * page_size,
+    )
+    variants = list(variants)
+    aggregates = load_variant_aggregates([v["id"] for v in variants])
+    for v in variants:
+        st.subheader(f"Variant {v['id'][:8]} • {v['perturbation_type']}/{v['perturbation_id']}")
+        for a in aggregates.get(v["id"], []):
+            st.caption(_aggregate_line(a))
 
-        vrec = load_prompt_variant(vid)
         st.markdown("**Variant prompt**")
-        st.code(vrec["variant_prompt_text"], language="text")
+        st.code(v["variant_prompt_text"], language="text")
 
-        runs = list_runs_for_variant(vid)
-        if not runs:
+        if not v["runs"]:
             st.warning("No LLM runs for this variant yet.")
             continue
 
-        for k_index, response_text, parse_ok, latency_ms in runs:
-            with st.expander(f"Run k={k_index} • latency={latency_ms}ms • parse_ok={bool(parse_ok)}"):
-                st.code(response_text, language="text")
+        for run_id, k_index, parse_ok, latency_ms in v["runs"]:
+            # state-tracking expander: the body is only read from the DB once opened
+            exp = st.expander(
+                f"Run k={k_index} • latency={latency_ms}ms • parse_ok={bool(parse_ok)}",
+                key=f"answer_{run_id}",
+                on_change="rerun",
+            )
+            with exp:
+                if exp.open:
+                    st.code(load_run_response(run_id), language="text")
@@ -24,9 +24,13 @@ def get_api_key() -> str | None:
 
 api_key = get_api_key()
 
-if not api_key:
-    st.error("Missing OPENAI_API_KEY. Add it in Streamlit Cloud Secrets or set env var locally.")
-    st.stop()
+if api_key:
+    os.environ.setdefault("OPENAI_API_KEY", api_key)
+else:
+    st.warning(
+        "Missing OPENAI_API_KEY. Add it in Streamlit Cloud Secrets or set env var locally. "
+        "Until then only the simulated backend can run in Step 4."
+    )
 
 
 # session defaults
@@ -0,0 +1,149 @@
+import asyncio
+import math
+import random
+import time
+from typing import Protocol
+
+from db import sample_run_responses
+from llm import call_llm_openai, call_llm_openai_async, get_async_openai_client
+from tokens import estimate_tokens
+
+
+class LLMBackend(Protocol):
+    name: str
+
+    def call(self, prompt_text: str, model_name: str, temperature: float, top_p: float, max_tokens: int):
+        ...
+
+    async def acall(
+        self,
+        prompt_text: str,
+        model_name: str,
+        temperature: float,
+        top_p: float,
+        max_tokens: int,
+        stream: bool = False,
+        on_chunk=None,
+    ):
+        ...
+
+    async def aclose(self):
+        ...
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, max_retries: int | None = None):
+        self.max_retries = max_retries
+        self._client = None
+
+    def call(self, prompt_text, model_name, temperature, top_p, max_tokens):
+        return call_llm_openai(prompt_text, model_name, temperature, top_p, max_tokens)
+
+    async def acall(self, prompt_text, model_name, temperature, top_p, max_tokens, stream=False, on_chunk=None):
+        if self._client is None:
+            self._client = get_async_openai_client(max_retries=self.max_retries)
+        return await call_llm_openai_async(
+            prompt_text, model_name, temperature, top_p, max_tokens, client=self._client, stream=stream, on_chunk=on_chunk
+        )
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class SimulatedAPIError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"simulated API error {status_code}")
+        self.status_code = status_code
+
+
+class SimulatedBackend:
+    name = "simulated"
+
+    def __init__(
+        self,
+        latency_ms_median: float = 800,
+        latency_sigma: float = 0.5,
+        ttft_fraction: float = 0.3,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        seed: int | None = None,
+    ):
+        self.latency_ms_median = latency_ms_median
+        self.latency_sigma = latency_sigma
+        self.ttft_fraction = ttft_fraction
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._pools = {}
+
+    def _pool(self, prompt_text: str, model_name: str):
+        # replay what this exact prompt got before, else anything this model said,
+        # else anything at all
+        key = (hash(prompt_text), model_name)
+        if key not in self._pools:
+            self._pools[key] = (
+                sample_run_responses(prompt_text=prompt_text)
+                or sample_run_responses(model_name=model_name)
+                or sample_run_responses()
+                or ["SIMULATED"]
+            )
+        return self._pools[key]
+
+    def _draw(self, prompt_text: str, model_name: str):
+        if self._rng.random() < self.error_rate:
+            raise SimulatedAPIError(self.error_status)
+        latency_s = self._rng.lognormvariate(math.log(self.latency_ms_median), self.latency_sigma) / 1000
+        return self._rng.choice(self._pool(prompt_text, model_name)), latency_s
+
+    def _metrics(self, t0: float, t_first: float | None, text: str) -> dict:
+        t_end = time.perf_counter()
+        output_tokens = estimate_tokens(text)
+        gen_s = t_end - (t_first if t_first is not None else t0)
+        return {
+            "latency_ms": int((t_end - t0) * 1000),
+            "ttft_ms": int((t_first - t0) * 1000) if t_first is not None else None,
+            # left empty so simulated runs never feed the token-estimate calibration
+            "input_tokens": None,
+            "output_tokens": output_tokens,
+            "tokens_per_sec": output_tokens / gen_s if gen_s > 0 else None,
+        }
+
+    def call(self, prompt_text, model_name, temperature, top_p, max_tokens):
+        t0 = time.perf_counter()
+        text, latency_s = self._draw(prompt_text, model_name)
+        time.sleep(latency_s)
+        return text, int((time.perf_counter() - t0) * 1000)
+
+    async def acall(self, prompt_text, model_name, temperature, top_p, max_tokens, stream=False, on_chunk=None):
+        t0 = time.perf_counter()
+        text, latency_s = self._draw(prompt_text, model_name)
+        if not stream:
+            await asyncio.sleep(latency_s)
+            return text, self._metrics(t0, None, text)
+
+        await asyncio.sleep(latency_s * self.ttft_fraction)
+        t_first = time.perf_counter()
+        words = text.split(" ")
+        step_s = latency_s * (1 - self.ttft_fraction) / len(words)
+        for i, word in enumerate(words):
+            if on_chunk:
+                on_chunk(word if i == 0 else " " + word)
+            await asyncio.sleep(step_s)
+        return text, self._metrics(t0, t_first, text)
+
+    async def aclose(self):
+        pass
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "simulated": SimulatedBackend,
+}
+
+
+def get_backend(name: str, **kwargs) -> LLMBackend:
+    return BACKENDS[name](**kwargs)
@@ -0,0 +1,255 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import db
+from answers import extract_answer, parse_json
+from perturbations import OUTPUT_FORMATS, PERSONAS, generate_variants
+from prompting import generate_pqb_from_spec, replace_section
+
+PROMPT_SIZES = [1_000, 10_000, 100_000]
+DB_SIZES = [10_000, 100_000, 1_000_000]
+RUNS_PER_VARIANT = 20
+
+
+def synthetic_spec(size_chars: int, rng: random.Random) -> dict:
+    words = ["revenue", "market", "assets", "profit", "sector", "region", "risk", "policy", "audit", "rank"]
+
+    def text(n):
+        out = []
+        while sum(len(w) + 1 for w in out) < n:
+            out.append(rng.choice(words))
+        return " ".join(out)
+
+    return {
+        "task_type": "Deterministic",
+        "decision_format": "Binary",
+        "domain_context": text(size_chars // 4),
+        "task_description": text(size_chars // 2),
+        "output_format": "Return ONLY YES or NO.",
+        "compliance_rules_notes": text(size_chars // 4),
+    }
+
+
+def measure(fn, min_time_s: float = 0.5, max_iters: int = 1_000_000) -> dict:
+    fn()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    iters = 0
+    t0 = time.perf_counter()
+    while iters < max_iters:
+        fn()
+        iters += 1
+        if time.perf_counter() - t0 >= min_time_s:
+            break
+    elapsed = time.perf_counter() - t0
+    return {"ops_per_sec": iters / elapsed, "peak_kib": peak / 1024, "iters": iters}
+
+
+def bench_prompting(results: dict, rng: random.Random, min_time_s: float):
+    persona_ids = [p["id"] for p in PERSONAS]
+    fmt_ids = [f["id"] for f in OUTPUT_FORMATS]
+    for size in PROMPT_SIZES:
+        spec = synthetic_spec(size, rng)
+        prompt = generate_pqb_from_spec(spec)
+        results[f"replace_section[{size}]"] = measure(
+            lambda: replace_section(prompt, "OUTPUT FORMAT", "Return ONLY YES or NO."), min_time_s
+        )
+        results[f"generate_variants[{size}]"] = measure(
+            lambda: generate_variants(prompt, spec, persona_ids, fmt_ids, True), min_time_s
+        )
+
+
+def bench_parsing(results: dict, min_time_s: float):
+    payload = json.dumps({"answer": "YES", "rationale": "x" * 200, "scores": list(range(50))})
+    cases = {
+        "plain": payload,
+        "fenced": f"```json\n{payload}\n```",
+        "invalid": "YES - the company is in the top decile",
+    }
+    for name, text in cases.items():
+        results[f"parse_json[{name}]"] = measure(lambda: parse_json(text), min_time_s)
+    formats = {
+        "fmt_binary_only": "YES",
+        "fmt_binary_reason": "NO - the company is outside the top decile.",
+        "fmt_json_strict": cases["fenced"],
+        "fmt_free_text": "The answer is **yes**, based on revenue.",
+    }
+    for format_id, text in formats.items():
+        results[f"extract_answer[{format_id}]"] = measure(lambda: extract_answer(format_id, text), min_time_s)
+
+
+def _run(variant_id: str, k_index: int, prompt: str) -> dict:
+    return {
+        "spec_id": "bench-spec",
+        "base_prompt_id": "bench-base",
+        "variant_id": variant_id,
+        "model_name": "bench-model",
+        "temperature": 0.2,
+        "top_p": 1.0,
+        "max_tokens": 256,
+        "k_index": k_index,
+        "full_prompt_text": prompt,
+        "response_text": '{"answer": "YES"}',
+        "latency_ms": 1000,
+        "parsed_json": {"answer": "YES"},
+        "parse_ok": True,
+    }
+
+
+def _remove_db(path: str):
+    db.close_conn()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def seed_db(path: str, n_runs: int, prompt: str) -> list[str]:
+    db.DB_PATH = path
+    db.init_db()
+    conn = db.get_conn()
+    if conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0] != n_runs:
+        # missing, partly seeded, or grown by write benchmarks before those ran on a copy
+        _remove_db(path)
+        db.init_db(force=True)
+        conn = db.get_conn()
+        # 50 distinct prompt bodies, like a persona × format grid sharing one dataset block
+        for start in range(0, n_runs // RUNS_PER_VARIANT, 1000):
+            variants = [
+                {
+                    "perturbation_type": "persona+format",
+                    "perturbation_id": f"bench_{v}",
+                    "strength": "medium",
+                    "prompt_text": f"variant {v % 50}\n{prompt}",
+                    "metadata": {"persona_id": f"p{v % 5}", "format_id": f"f{v % 10}"},
+                }
+                for v in range(start, min(start + 1000, n_runs // RUNS_PER_VARIANT))
+            ]
+            ids = db.save_prompt_variants_many("bench-spec", "bench-base", variants)
+            db.save_runs_many(
+                [
+                    _run(vid, k, v["prompt_text"])
+                    for vid, v in zip(ids, variants)
+                    for k in range(1, RUNS_PER_VARIANT + 1)
+                ]
+            )
+    return [r[0] for r in conn.execute("SELECT id FROM prompt_variants LIMIT 1000")]
+
+
+def bench_db(results: dict, n_runs: int, db_dir: str, rng: random.Random, min_time_s: float):
+    prompt = generate_pqb_from_spec(synthetic_spec(10_000, rng))
+    path = os.path.join(db_dir, f"bench_{n_runs}.db")
+    t0 = time.perf_counter()
+    variant_ids = seed_db(path, n_runs, prompt)
+    print(f"  seeded {path} with {n_runs} runs in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    run_ids = [r[0] for r in db.get_conn().execute("SELECT id FROM runs LIMIT 1000")]
+    pick = lambda ids: ids[rng.randrange(len(ids))]
+    tag = f"[{n_runs}]"
+    results["list_runs_for_variant" + tag] = measure(lambda: db.list_runs_for_variant(pick(variant_ids)), min_time_s)
+    results["list_runs" + tag] = measure(lambda: db.list_runs(pick(variant_ids)), min_time_s)
+    # the SQL path, bypassing the in-process read cache, and the cached path on its own
+    results["list_prompt_variants" + tag] = measure(
+        lambda: db.list_prompt_variants.__wrapped__("bench-spec", "bench-base"), min_time_s
+    )
+    results["list_prompt_variants[cached]" + tag] = measure(
+        lambda: db.list_prompt_variants("bench-spec", "bench-base"), min_time_s
+    )
+    results["iter_variants_with_runs" + tag] = measure(
+        lambda: list(db.iter_variants_with_runs("bench-spec", "bench-base", limit=20)), min_time_s
+    )
+    results["load_run" + tag] = measure(lambda: db.load_run(pick(run_ids)), min_time_s)
+    results["load_run_response" + tag] = measure(lambda: db.load_run_response(pick(run_ids)), min_time_s)
+
+    # writes go to a throwaway copy so the seeded store keeps its size across invocations
+    db.get_conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close_conn()
+    write_path = os.path.join(db_dir, f"bench_{n_runs}.writes.db")
+    shutil.copyfile(path, write_path)
+    db.DB_PATH = write_path
+    db.init_db(force=True)
+    # fresh k indexes so every save inserts instead of hitting an existing run key
+    k_indexes = itertools.count(RUNS_PER_VARIANT + 1)
+    results["save_run" + tag] = measure(
+        lambda: db.save_run(**_run(pick(variant_ids), next(k_indexes), prompt)), min_time_s
+    )
+    results["save_runs_many[100]" + tag] = measure(
+        lambda: db.save_runs_many([_run(pick(variant_ids), next(k_indexes), prompt) for _ in range(100)]), min_time_s
+    )
+    _remove_db(write_path)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        change = r["ops_per_sec"] / base["ops_per_sec"] - 1
+        r["vs_baseline"] = change
+        if change < -threshold:
+            regressions.append(f"{name}: {base['ops_per_sec']:.0f} -> {r['ops_per_sec']:.0f} ops/s ({change:+.0%})")
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"{'benchmark':<40} {'ops/sec':>12} {'peak KiB':>10} {'vs base':>8}")
+    for name, r in results.items():
+        vs = f"{r['vs_baseline']:+.0%}" if "vs_baseline" in r else ""
+        print(f"{name:<40} {r['ops_per_sec']:>12.1f} {r['peak_kib']:>10.1f} {vs:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the prompt, perturbation, parsing and storage hot paths.")
+    parser.add_argument("--only", choices=["prompting", "parsing", "db"], action="append")
+    parser.add_argument(
+        "--db-sizes", type=int, nargs="+", default=DB_SIZES[:2], help=f"runs to seed per DB (full set: {DB_SIZES})"
+    )
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "prompt_sensitivity_bench"))
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent timing each benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write results as JSON, e.g. to use as a baseline")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --save")
+    parser.add_argument("--threshold", type=float, default=0.2, help="ops/sec drop that counts as a regression")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    only = set(args.only or ["prompting", "parsing", "db"])
+    results = {}
+    if "prompting" in only:
+        bench_prompting(results, rng, args.min_time)
+    if "parsing" in only:
+        bench_parsing(results, args.min_time)
+    if "db" in only:
+        os.makedirs(args.db_dir, exist_ok=True)
+        for n in args.db_sizes:
+            bench_db(results, n, args.db_dir, rng, args.min_time)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    print_table(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print("\nRegressions beyond threshold:")
+        for line in regressions:
+            print("  " + line)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import json
+import time
+
+from backends import OpenAIBackend
+from db import evict_cache, get_cached_response, put_cached_response
+from tokens import estimate_tokens
+
+CACHE_MAX_ENTRIES = 50000
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHE_MAX_AGE_DAYS = 30
+EVICT_EVERY_N_PUTS = 200
+
+_puts_since_evict = 0
+# (event loop id, request key) -> future of the in-flight call. Each Streamlit
+# session runs its own loop in its own thread and a future can only be awaited
+# on the loop that created it, so sessions never share entries; within a loop
+# the check-and-insert below has no await in between and needs no lock.
+_inflight = {}
+
+
+def request_key(
+    prompt_text: str,
+    model_name: str,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    k_index: int,
+    backend_name: str = "openai",
+) -> str:
+    fields = [model_name, prompt_text, float(temperature), float(top_p), int(max_tokens), int(k_index)]
+    # other backends (e.g. the simulator) get their own key space so they never
+    # serve or overwrite real API responses; openai keys predate this field
+    if backend_name != "openai":
+        fields.append(backend_name)
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _hit_metrics(latency_ms: int) -> dict:
+    return {"latency_ms": latency_ms, "ttft_ms": None, "input_tokens": None, "output_tokens": None, "tokens_per_sec": None}
+
+
+def _lookup(key: str):
+    t0 = time.perf_counter()
+    hit = get_cached_response(key)
+    if hit is None:
+        return None
+    resp_text, original_latency_ms = hit
+    lookup_ms = int((time.perf_counter() - t0) * 1000)
+    return resp_text, lookup_ms, True, max(0, original_latency_ms - lookup_ms)
+
+
+def _store(key: str, model_name: str, resp_text: str, latency_ms: int):
+    global _puts_since_evict
+    put_cached_response(key, model_name, resp_text, latency_ms)
+    _puts_since_evict += 1
+    if _puts_since_evict >= EVICT_EVERY_N_PUTS:
+        _puts_since_evict = 0
+        evict_cache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_MAX_AGE_DAYS)
+
+
+async def call_llm_cached_async(
+    prompt_text: str,
+    model_name: str,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    k_index: int,
+    bypass_cache: bool = False,
+    backend=None,
+    stream: bool = False,
+    on_chunk=None,
+    scheduler=None,
+):
+    backend = backend or OpenAIBackend()
+    key = request_key(prompt_text, model_name, temperature, top_p, max_tokens, k_index, backend.name)
+    if not bypass_cache:
+        hit = _lookup(key)
+        if hit:
+            resp_text, lookup_ms, _, saved_ms = hit
+            return resp_text, _hit_metrics(lookup_ms), True, saved_ms
+
+    # identical requests already in flight (e.g. the flip_task_type variant next
+    # to its base prompt) share one API call instead of racing to fill the cache
+    loop = asyncio.get_running_loop()
+    inflight_key = (id(loop), key)
+    while inflight_key in _inflight and not bypass_cache:
+        shared = _inflight[inflight_key]
+        t0 = time.perf_counter()
+        try:
+            resp_text, original_latency_ms = await asyncio.shield(shared)
+        except asyncio.CancelledError:
+            # only the call we were waiting on was cancelled, not us: join the
+            # next one in flight or make the call ourselves
+            if not shared.cancelled():
+                raise
+            continue
+        waited_ms = int((time.perf_counter() - t0) * 1000)
+        return resp_text, _hit_metrics(waited_ms), True, max(0, original_latency_ms - waited_ms)
+
+    fut = loop.create_future()
+    _inflight[inflight_key] = fut
+    def make_call():
+        # the scheduler calls this once per attempt and a retried stream starts
+        # over, so on_chunk(delta, restart) flags each attempt's first chunk
+        first = [True]
+
+        def chunk(delta):
+            on_chunk(delta, first[0])
+            first[0] = False
+
+        return backend.acall(
+            prompt_text, model_name, temperature, top_p, max_tokens, stream=stream, on_chunk=chunk if on_chunk else None
+        )
+
+    try:
+        if scheduler is None:
+            resp_text, metrics = await make_call()
+        else:
+            # only cache misses spend rate budget; TPM counts prompt plus the output allowance
+            resp_text, metrics = await scheduler.run(make_call, estimate_tokens(prompt_text) + int(max_tokens))
+        fut.set_result((resp_text, metrics["latency_ms"]))
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()
+        raise
+    finally:
+        # a cancelled call (BaseException) must still release its waiters
+        if not fut.done():
+            fut.cancel()
+        if _inflight.get(inflight_key) is fut:
+            del _inflight[inflight_key]
+    _store(key, model_name, resp_text, metrics["latency_ms"])
+    return resp_text, metrics, False, 0
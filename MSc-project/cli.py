@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import db
+from backends import BACKENDS, get_backend
+from costs import BudgetExceeded, apply_budget, estimate_plan, plan_summary
+from dataset import DEFAULT_BLOCK_CFG, STRATEGIES, build_dataset_block, ingest_csv, open_dataset
+from export import EXPORT_BATCH_ROWS, EXPORT_FORMATS, export_runs
+from jobs import enqueue_tasks
+from perturbations import OUTPUT_FORMATS, PERSONAS, generate_variants
+from prompting import generate_pqb_from_spec
+from ratelimit import RateLimitedScheduler
+from runner import pending_tasks
+from sweep import build_sweep_tasks, run_sweep
+
+# Headless counterpart of steps 1-4: resolve (or create) a spec and base prompt,
+# optionally generate and save variants, then sweep variants × models × k through
+# the same runner and store the app uses, printing progress to stdout.
+
+
+def _log(msg: str):
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+
+def _resolve_spec(args):
+    if args.spec_file:
+        with open(args.spec_file) as f:
+            spec = json.load(f)
+        handle = ingest_csv(args.dataset) if args.dataset else None
+        dataset_hash = handle["hash"] if handle else None
+        # the same file (and dataset) resolves to the same spec, so re-running a
+        # command resumes its runs instead of starting over under new ids
+        spec_id = db.find_spec(spec, dataset_hash)
+        if spec_id is not None:
+            _log(f"reusing spec {spec_id}, identical to {args.spec_file}")
+        else:
+            spec_id = db.save_spec(spec, dataset_hash=dataset_hash)
+            _log(f"saved spec {spec_id} from {args.spec_file}")
+        return spec_id, spec, handle
+    raw = db.load_spec(args.spec_id)
+    if raw is None:
+        raise SystemExit(f"spec {args.spec_id} not found in {db.DB_PATH}")
+    spec = json.loads(raw)
+    handle = ingest_csv(args.dataset) if args.dataset else open_dataset(db.load_spec_dataset_hash(args.spec_id))
+    return args.spec_id, spec, handle
+
+
+def _resolve_base_prompt(args, spec_id: str, spec: dict):
+    if args.base_prompt_id:
+        text = db.load_base_prompt(args.base_prompt_id)
+        if text is None:
+            raise SystemExit(f"base prompt {args.base_prompt_id} not found in {db.DB_PATH}")
+        return args.base_prompt_id, text
+    text = generate_pqb_from_spec(spec)
+    base_prompt_id = db.find_base_prompt(spec_id, text)
+    if base_prompt_id is not None:
+        _log(f"reusing base prompt {base_prompt_id}")
+    else:
+        base_prompt_id = db.save_base_prompt(spec_id, text)
+        _log(f"saved base prompt {base_prompt_id}")
+    return base_prompt_id, text
+
+
+def _dataset_block(args, handle) -> str:
+    if handle is None or args.no_dataset:
+        return ""
+    cfg = {
+        **DEFAULT_BLOCK_CFG,
+        "strategy": args.dataset_strategy,
+        "max_tokens": args.dataset_tokens,
+        "max_rows": args.dataset_rows,
+        "stratify_by": args.stratify_by,
+        "seed": args.seed,
+    }
+    info = build_dataset_block(handle, **cfg)
+    _log(f"dataset {handle['name']}: {info['rows']}/{info['total_rows']} rows • ~{info['est_tokens']} tokens per prompt")
+    return info["block"]
+
+
+def cmd_run(args) -> int:
+    db.DB_PATH = args.db
+    db.init_db()
+    spec_id, spec, handle = _resolve_spec(args)
+    base_prompt_id, base_prompt_text = _resolve_base_prompt(args, spec_id, spec)
+
+    if args.personas or args.formats or args.flip_task_type:
+        variants = generate_variants(
+            base_prompt_text, spec, args.personas or [], args.formats or [], args.flip_task_type
+        )
+        # re-running the same command reuses the stored variants (and their run keys)
+        n_before = db.count_prompt_variants(spec_id, base_prompt_id)
+        db.save_prompt_variants_many(spec_id, base_prompt_id, variants)
+        n_new = db.count_prompt_variants(spec_id, base_prompt_id) - n_before
+        _log(f"saved {n_new} new variants ({len(variants) - n_new} already stored)")
+    n_variants = db.count_prompt_variants(spec_id, base_prompt_id)
+    if not n_variants:
+        _log("no variants to run; pass --personas/--formats to generate some")
+        return 1
+
+    models = [
+        {
+            "model_name": name,
+            "temperature": args.temperature,
+            "top_p": args.top_p,
+            "max_tokens": args.max_tokens,
+            "max_concurrency": args.model_concurrency,
+        }
+        for name in args.models
+    ]
+    dataset_block = _dataset_block(args, handle)
+    tasks = build_sweep_tasks(spec_id, base_prompt_id, models, args.k, dataset_block=dataset_block)
+    tasks, n_stored = pending_tasks(tasks)
+    if n_stored:
+        _log(f"{n_stored} runs already stored, resuming with the {len(tasks)} missing")
+    plan = estimate_plan(tasks, concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm)
+    _log(f"spec {spec_id} • base prompt {base_prompt_id} • {n_variants} variants × {len(models)} models × k={args.k}")
+    _log(f"projected: {plan_summary(plan)}")
+    if args.dry_run or not tasks:
+        return 0
+
+    budget = None
+    if args.max_cost_usd or args.max_total_tokens:
+        budget = {"max_cost_usd": args.max_cost_usd, "max_tokens": args.max_total_tokens, "mode": args.budget_mode}
+    backend_kwargs = {"max_retries": 0} if args.backend == "openai" else {"seed": args.seed}
+    if args.queue:
+        try:
+            queued = apply_budget(tasks, concurrency=args.concurrency, **budget)[0] if budget else tasks
+        except BudgetExceeded as e:
+            _log(str(e))
+            return 2
+        params = {
+            "backend": args.backend,
+            "backend_kwargs": backend_kwargs,
+            "concurrency": args.concurrency,
+            "model_concurrency": {m["model_name"]: m["max_concurrency"] for m in models},
+            "rpm": args.rpm,
+            "tpm": args.tpm,
+            "max_retries": args.max_retries,
+            "bypass_cache": args.bypass_cache,
+        }
+        batch_id = enqueue_tasks(spec_id, base_prompt_id, queued, params, dataset_block)
+        _log(f"queued {len(queued)} runs as batch {batch_id}; start workers with `python jobs.py work`")
+        return 0
+    scheduler = RateLimitedScheduler(rpm=args.rpm, tpm=args.tpm, max_retries=args.max_retries)
+    last = [0.0]
+
+    def on_progress(progress, result):
+        now = time.monotonic()
+        if now - last[0] >= args.progress_every or progress.done == progress.total:
+            last[0] = now
+            _log(f"{progress.summary()} • {scheduler.summary()}")
+
+    try:
+        _, progress = run_sweep(
+            spec_id=spec_id,
+            base_prompt_id=base_prompt_id,
+            models=models,
+            k=args.k,
+            concurrency=args.concurrency,
+            dataset_block=dataset_block,
+            bypass_cache=args.bypass_cache,
+            scheduler=scheduler,
+            backend=get_backend(args.backend, **backend_kwargs),
+            on_progress=on_progress,
+            budget=budget,
+            resume=False,
+            tasks=tasks,
+        )
+    except BudgetExceeded as e:
+        _log(str(e))
+        return 2
+    _log(f"finished in {progress.elapsed_s:.1f}s • {progress.summary()}")
+    return 1 if progress.failed else 0
+
+
+def cmd_export(args) -> int:
+    db.DB_PATH = args.db
+    db.init_db()
+    t0 = time.monotonic()
+    last = [t0]
+
+    def on_batch(n):
+        now = time.monotonic()
+        if now - last[0] >= args.progress_every:
+            last[0] = now
+            _log(f"{n:,} runs written")
+
+    n = export_runs(
+        args.out,
+        args.format,
+        include_text=not args.no_text,
+        batch_rows=args.batch_rows,
+        on_batch=on_batch,
+        spec_id=args.spec_id,
+        base_prompt_id=args.base_prompt_id,
+        model_names=args.models,
+        since=args.since,
+        until=args.until,
+    )
+    _log(f"exported {n:,} runs to {args.out} in {time.monotonic() - t0:.1f}s")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run prompt-sensitivity sweeps without the Streamlit UI.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="generate variants (optional) and sweep them × models × k")
+    source = run.add_mutually_exclusive_group(required=True)
+    source.add_argument("--spec-id", help="an existing TaskSpec in the store")
+    source.add_argument("--spec-file", help="TaskSpec JSON; reuses a stored spec with the same content and dataset")
+    run.add_argument(
+        "--base-prompt-id", help="default: the spec's generated base prompt, saved on first use and reused after"
+    )
+    run.add_argument("--db", default=db.DB_PATH, help="path to the SQLite store")
+
+    grid = run.add_argument_group("variants")
+    grid.add_argument("--personas", nargs="+", choices=[p["id"] for p in PERSONAS])
+    grid.add_argument("--formats", nargs="+", choices=[f["id"] for f in OUTPUT_FORMATS])
+    grid.add_argument("--flip-task-type", action="store_true")
+
+    models = run.add_argument_group("models")
+    models.add_argument("--models", nargs="+", default=["gpt-4.1-mini"])
+    models.add_argument("--k", type=int, default=3)
+    models.add_argument("--temperature", type=float, default=0.2)
+    models.add_argument("--top-p", type=float, default=1.0)
+    models.add_argument("--max-tokens", type=int, default=512)
+
+    execution = run.add_argument_group("execution")
+    execution.add_argument("--backend", choices=list(BACKENDS), default="openai")
+    execution.add_argument("--concurrency", type=int, default=8, help="global max concurrent calls")
+    execution.add_argument("--model-concurrency", type=int, default=4, help="per-model max concurrent calls")
+    execution.add_argument("--rpm", type=float, help="requests/min limit")
+    execution.add_argument("--tpm", type=float, help="tokens/min limit")
+    execution.add_argument("--max-retries", type=int, default=5)
+    execution.add_argument("--bypass-cache", action="store_true")
+    execution.add_argument("--seed", type=int, default=0, help="dataset sampling and simulated backend seed")
+    execution.add_argument("--progress-every", type=float, default=5.0, help="seconds between progress lines")
+    execution.add_argument("--dry-run", action="store_true", help="print the plan and exit")
+    execution.add_argument("--queue", action="store_true", help="enqueue the runs for `jobs.py work` instead of running them")
+
+    data = run.add_argument_group("dataset")
+    data.add_argument("--dataset", help="CSV to ingest and attach (default: the spec's dataset)")
+    data.add_argument("--no-dataset", action="store_true", help="send prompts without the dataset block")
+    data.add_argument("--dataset-strategy", choices=list(STRATEGIES), default=DEFAULT_BLOCK_CFG["strategy"])
+    data.add_argument("--dataset-tokens", type=int, default=DEFAULT_BLOCK_CFG["max_tokens"])
+    data.add_argument("--dataset-rows", type=int, default=DEFAULT_BLOCK_CFG["max_rows"])
+    data.add_argument("--stratify-by")
+
+    budget = run.add_argument_group("budget")
+    budget.add_argument("--max-cost-usd", type=float)
+    budget.add_argument("--max-total-tokens", type=int)
+    budget.add_argument("--budget-mode", choices=["refuse", "trim"], default="refuse")
+
+    export = sub.add_parser("export", help="stream runs with their variant axes to Parquet, Arrow or CSV")
+    export.add_argument("out", help=f"output file; the format follows the extension ({', '.join(EXPORT_FORMATS)})")
+    export.add_argument("--format", choices=sorted(set(EXPORT_FORMATS.values())), help="override the extension")
+    export.add_argument("--db", default=db.DB_PATH, help="path to the SQLite store")
+    export.add_argument("--spec-id")
+    export.add_argument("--base-prompt-id")
+    export.add_argument("--models", nargs="+", help="only runs of these models")
+    export.add_argument("--since", help="ISO date/time, inclusive (UTC)")
+    export.add_argument("--until", help="ISO date/time, exclusive (UTC)")
+    export.add_argument("--no-text", action="store_true", help="leave out response_text")
+    export.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS, help="runs read and written per batch")
+    export.add_argument("--progress-every", type=float, default=5.0, help="seconds between progress lines")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        if args.format is None and os.path.splitext(args.out)[1].lower() not in EXPORT_FORMATS:
+            parser.error(f"can't tell the format of {args.out}; pass --format")
+        return cmd_export(args)
+    if args.command == "run":
+        if args.backend == "openai" and not (args.dry_run or args.queue) and not os.getenv("OPENAI_API_KEY"):
+            parser.error("OPENAI_API_KEY is not set; export it or use --backend simulated")
+        return cmd_run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+from db import list_variant_token_estimates, recent_latency_ms, token_estimate_totals
+from tokens import estimate_tokens
+
+# USD per 1M tokens (input, output); longest-prefix match so dated snapshots
+# like gpt-4.1-mini-2025-04-14 resolve to their family
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "o4-mini": (1.10, 4.40),
+}
+# used for time estimates until a model has real runs in the store
+FALLBACK_BASE_LATENCY_MS = 500
+FALLBACK_TOKENS_PER_SEC = 50
+# below this many estimated tokens of history the calibration is too noisy to use
+MIN_CALIBRATION_TOKENS = 5000
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, message: str, plan: dict):
+        super().__init__(message)
+        self.plan = plan
+
+
+def price_for(model_name: str, prices: dict | None = None):
+    prices = prices or MODEL_PRICES
+    matches = [name for name in prices if model_name == name or model_name.startswith(name + "-")]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def calibration_factor() -> float:
+    est, actual = token_estimate_totals()
+    return actual / est if est >= MIN_CALIBRATION_TOKENS else 1.0
+
+
+def _task_usage(task: dict, factor: float, prices: dict | None):
+    est = task.get("est_input_tokens")
+    if est is None:
+        est = estimate_tokens(task["prompt_text"])
+    input_tokens = int(round(est * factor))
+    output_tokens = int(task["max_tokens"])
+    price = price_for(task["model_name"], prices)
+    cost = None if price is None else (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+    return input_tokens, output_tokens, cost
+
+
+def estimate_plan(
+    tasks: list[dict],
+    concurrency: int = 5,
+    rpm: float | None = None,
+    tpm: float | None = None,
+    prices: dict | None = None,
+) -> dict:
+    # an upper bound: every call is assumed to miss the cache and use all of max_tokens
+    factor = calibration_factor()
+    by_model = {}
+    for task in tasks:
+        input_tokens, output_tokens, cost = _task_usage(task, factor, prices)
+        m = by_model.setdefault(
+            task["model_name"],
+            {"calls": 0, "input_tokens": 0, "max_output_tokens": 0, "max_cost_usd": 0.0, "priced": cost is not None},
+        )
+        m["calls"] += 1
+        m["input_tokens"] += input_tokens
+        m["max_output_tokens"] += output_tokens
+        m["max_cost_usd"] += cost or 0.0
+
+    latency_ms = 0.0
+    for name, m in by_model.items():
+        per_call = recent_latency_ms(name)
+        if per_call is None:
+            per_call = FALLBACK_BASE_LATENCY_MS + m["max_output_tokens"] / m["calls"] / FALLBACK_TOKENS_PER_SEC * 1000
+        latency_ms += per_call * m["calls"]
+
+    calls = len(tasks)
+    total_tokens = sum(m["input_tokens"] + m["max_output_tokens"] for m in by_model.values())
+    time_s = latency_ms / 1000 / max(1, int(concurrency))
+    if rpm:
+        time_s = max(time_s, calls / rpm * 60)
+    if tpm:
+        time_s = max(time_s, total_tokens / tpm * 60)
+
+    return {
+        "calls": calls,
+        "input_tokens": sum(m["input_tokens"] for m in by_model.values()),
+        "max_output_tokens": sum(m["max_output_tokens"] for m in by_model.values()),
+        "max_cost_usd": sum(m["max_cost_usd"] for m in by_model.values()),
+        "unpriced_models": [name for name, m in by_model.items() if not m["priced"]],
+        "est_time_s": time_s,
+        "calibration": factor,
+        "by_model": by_model,
+    }
+
+
+def _usd(amount: float) -> str:
+    return f"${amount:.2f}" if amount >= 1 else f"${amount:.4f}"
+
+
+def plan_summary(plan: dict) -> str:
+    cost = f"≤{_usd(plan['max_cost_usd'])}"
+    if plan["unpriced_models"]:
+        cost += f" (no price for {', '.join(plan['unpriced_models'])})"
+    return (
+        f"{plan['calls']} calls • ~{plan['input_tokens']:,} input + ≤{plan['max_output_tokens']:,} output tokens • "
+        f"{cost} • ~{plan['est_time_s'] / 60:.1f} min"
+    )
+
+
+def _over_budget(plan: dict, max_cost_usd, max_tokens, max_calls):
+    if max_calls and plan["calls"] > max_calls:
+        return f"{plan['calls']} calls exceed the limit of {max_calls}"
+    if max_tokens and plan["input_tokens"] + plan["max_output_tokens"] > max_tokens:
+        return f"{plan['input_tokens'] + plan['max_output_tokens']:,} tokens exceed the limit of {max_tokens:,}"
+    if max_cost_usd:
+        if plan["unpriced_models"]:
+            return f"no price known for {', '.join(plan['unpriced_models'])}, so the cost limit cannot be checked"
+        if plan["max_cost_usd"] > max_cost_usd:
+            return f"{_usd(plan['max_cost_usd'])} exceeds the limit of {_usd(max_cost_usd)}"
+    return None
+
+
+def apply_budget(
+    tasks: list[dict],
+    max_cost_usd: float | None = None,
+    max_tokens: int | None = None,
+    max_calls: int | None = None,
+    mode: str = "refuse",
+    **plan_kwargs,
+):
+    plan = estimate_plan(tasks, **plan_kwargs)
+    reason = _over_budget(plan, max_cost_usd, max_tokens, max_calls)
+    if reason is None:
+        return tasks, plan
+    if mode != "trim" or (plan["unpriced_models"] and max_cost_usd):
+        raise BudgetExceeded(f"Planned run is over budget: {reason}", plan)
+
+    # keep whole (variant, model) groups in order so no variant ends up with a
+    # partial set of k repeats
+    factor = plan["calibration"]
+    kept, group = [], []
+    calls = tokens = g_calls = g_tokens = 0
+    cost = g_cost = 0.0
+    for i, task in enumerate(tasks):
+        input_tokens, output_tokens, task_cost = _task_usage(task, factor, plan_kwargs.get("prices"))
+        group.append(task)
+        g_calls += 1
+        g_tokens += input_tokens + output_tokens
+        g_cost += task_cost or 0.0
+        nxt = tasks[i + 1] if i + 1 < len(tasks) else None
+        if nxt is not None and (nxt["variant_id"], nxt["model_name"]) == (task["variant_id"], task["model_name"]):
+            continue
+        if (
+            (max_calls and calls + g_calls > max_calls)
+            or (max_tokens and tokens + g_tokens > max_tokens)
+            or (max_cost_usd and cost + g_cost > max_cost_usd)
+        ):
+            break
+        kept.extend(group)
+        calls, tokens, cost = calls + g_calls, tokens + g_tokens, cost + g_cost
+        group, g_calls, g_tokens, g_cost = [], 0, 0, 0.0
+
+    if not kept:
+        raise BudgetExceeded(f"Planned run is over budget and not even one variant fits: {reason}", plan)
+    return kept, estimate_plan(kept, **plan_kwargs)
+
+
+def plan_for_sweep(
+    spec_id: str,
+    base_prompt_id: str,
+    models: list[dict],
+    k: int,
+    dataset_block: str = "",
+    **plan_kwargs,
+) -> dict:
+    # built from the estimates stored on each variant, so the projection does not
+    # load every prompt body the way build_sweep_tasks does
+    block_tokens = estimate_tokens(dataset_block) if dataset_block else 0
+    tasks = [
+        {
+            "variant_id": variant_id,
+            "model_name": m["model_name"],
+            "max_tokens": m["max_tokens"],
+            "est_input_tokens": est + block_tokens,
+        }
+        for variant_id, est in list_variant_token_estimates(spec_id, base_prompt_id)
+        for m in models
+        for _ in range(int(k))
+    ]
+    return estimate_plan(tasks, **plan_kwargs)
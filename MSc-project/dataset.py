@@ -1,14 +1,266 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import streamlit as st
 
+from db import load_dataset, save_dataset
+from tokens import estimate_tokens
 
-def dataset_block_for_prompt() -> str:
-    df = st.session_state.get("uploaded_df")
-    if df is None:
-        return ""
-
-    sample_csv = df.head(80).to_csv(index=False)
-    return (
-        "\n\nDATASET (CSV):\n"
-        + sample_csv
-        + "\n\nIf the question refers to the dataset, use ONLY this data.\n"
+DATASET_DIR = "datasets"
+CSV_CHUNK_ROWS = 50_000
+HASH_CHUNK_BYTES = 1 << 20
+
+STRATEGIES = {
+    "head": "First rows",
+    "random": "Random rows (seeded)",
+    "stratified": "Stratified by a column (seeded)",
+}
+DEFAULT_BLOCK_CFG = {
+    "strategy": "head",
+    # sized to fit max_rows of a typical numeric CSV (the Forbes sample: 79 rows)
+    "max_tokens": 3500,
+    "max_rows": 80,
+    "columns": None,
+    "stratify_by": None,
+    "seed": 0,
+}
+BLOCK_CACHE_MAX = 64
+
+BLOCK_HEADER = "\n\nDATASET (CSV):\n"
+BLOCK_FOOTER = "\n\nIf the question refers to the dataset, use ONLY this data.\n"
+
+_block_cache = OrderedDict()
+
+
+# ---- Ingestion ----
+# an upload is read in chunks, written once to DATASET_DIR/<content hash>.parquet
+# and from then on referred to by a small handle dict; sessions never hold the frame
+def _content_hash(src) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    f = open(src, "rb") if isinstance(src, str) else src
+    try:
+        f.seek(0)
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(block)
+    finally:
+        if f is not src:
+            f.close()
+    return h.hexdigest()
+
+
+def _merge_dtype(a, b):
+    if a is None or a == b:
+        return b
+    if a.kind in "biuf" and b.kind in "biuf":
+        # e.g. an int column that has a blank cell in a later chunk becomes float
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+
+def _infer_dtypes(src, chunk_rows: int) -> dict:
+    dtypes = {}
+    for chunk in pd.read_csv(src, chunksize=chunk_rows):
+        for col, dt in chunk.dtypes.items():
+            dtypes[col] = _merge_dtype(dtypes.get(col), dt)
+    return dtypes
+
+
+def _arrow_schema(dtypes: dict) -> pa.Schema:
+    return pa.schema(
+        [(str(col), pa.string() if dt.kind == "O" else pa.from_numpy_dtype(dt)) for col, dt in dtypes.items()]
+    )
+
+
+def _rewind(src):
+    if not isinstance(src, str):
+        src.seek(0)
+    return src
+
+
+def ingest_csv(src, name: str | None = None, chunk_rows: int = CSV_CHUNK_ROWS) -> dict:
+    # src is a path or a binary file object (e.g. a Streamlit UploadedFile)
+    name = name or (os.path.basename(src) if isinstance(src, str) else getattr(src, "name", "upload.csv"))
+    dataset_hash = _content_hash(src)
+    path = os.path.join(DATASET_DIR, f"{dataset_hash}.parquet")
+
+    if not os.path.exists(path):
+        # pass 1 settles one dtype per column across all chunks, pass 2 writes with it
+        dtypes = _infer_dtypes(_rewind(src), chunk_rows)
+        schema = _arrow_schema(dtypes)
+        read_dtypes = {col: (str if dt.kind == "O" else dt) for col, dt in dtypes.items()}
+        os.makedirs(DATASET_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with pq.ParquetWriter(tmp, schema) as writer:
+            for chunk in pd.read_csv(_rewind(src), chunksize=chunk_rows, dtype=read_dtypes):
+                chunk.columns = [str(c) for c in chunk.columns]
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        # atomic, so two sessions ingesting the same file never see a partial one
+        os.replace(tmp, path)
+
+    meta = pq.ParquetFile(path).metadata
+    columns = [meta.schema.column(i).name for i in range(meta.num_columns)]
+    save_dataset(dataset_hash, name, path, meta.num_rows, columns, os.path.getsize(path))
+    return open_dataset(dataset_hash)
+
+
+def open_dataset(dataset_hash: str | None) -> dict | None:
+    if not dataset_hash:
+        return None
+    handle = load_dataset(dataset_hash)
+    if handle is None or not os.path.exists(handle["path"]):
+        return None
+    return handle
+
+
+def read_rows(handle: dict, columns: list[str] | None = None, limit: int | None = None) -> pd.DataFrame:
+    pf = pq.ParquetFile(handle["path"], memory_map=True)
+    if limit is None:
+        return pf.read(columns=columns).to_pandas()
+    batches, n = [], 0
+    for batch in pf.iter_batches(batch_size=min(limit, CSV_CHUNK_ROWS), columns=columns):
+        batches.append(batch)
+        n += batch.num_rows
+        if n >= limit:
+            break
+    if not batches:
+        return pf.schema_arrow.empty_table().select(columns or pf.schema_arrow.names).to_pandas()
+    return pa.Table.from_batches(batches).slice(0, limit).to_pandas()
+
+
+# ---- Dataset block ----
+def _ordered_rows(df: pd.DataFrame, strategy: str, stratify_by: str | None, seed: int) -> pd.DataFrame:
+    if strategy == "head":
+        return df
+    shuffled = df.sample(frac=1.0, random_state=seed)
+    if strategy == "random":
+        return shuffled
+    if strategy == "stratified":
+        if not stratify_by or stratify_by not in df.columns:
+            raise ValueError("stratified sampling needs a stratify_by column from the dataset")
+        # round-robin over groups: any prefix holds every group in near-equal counts
+        rank = shuffled.groupby(stratify_by, dropna=False, sort=False).cumcount()
+        return shuffled.iloc[rank.to_numpy().argsort(kind="stable")]
+    raise ValueError(f"unknown sampling strategy: {strategy}")
+
+
+def _fit_rows(df: pd.DataFrame, max_tokens: int, max_rows: int) -> tuple[str, int]:
+    # serialize the candidate rows once, then keep the longest prefix within budget
+    lines = df.head(max_rows).to_csv(index=False).splitlines(keepends=True)
+    budget = max_tokens - estimate_tokens(BLOCK_HEADER + BLOCK_FOOTER)
+    used = estimate_tokens(lines[0])
+    n = 0
+    for line in lines[1:]:
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        used += cost
+        n += 1
+    if n == 0:
+        return "", 0
+    return "".join(lines[: n + 1]), n
+
+
+def build_dataset_block(
+    handle: dict,
+    strategy: str = DEFAULT_BLOCK_CFG["strategy"],
+    max_tokens: int = DEFAULT_BLOCK_CFG["max_tokens"],
+    max_rows: int = DEFAULT_BLOCK_CFG["max_rows"],
+    columns: list[str] | None = DEFAULT_BLOCK_CFG["columns"],
+    stratify_by: str | None = DEFAULT_BLOCK_CFG["stratify_by"],
+    seed: int = DEFAULT_BLOCK_CFG["seed"],
+) -> dict:
+    # the content hash already fingerprints the data, so no need to hash rows here
+    key = (
+        handle["hash"],
+        strategy,
+        int(max_tokens),
+        int(max_rows),
+        tuple(columns or ()),
+        stratify_by if strategy == "stratified" else None,
+        int(seed) if strategy != "head" else 0,
     )
+    hit = _block_cache.get(key)
+    if hit is not None:
+        _block_cache.move_to_end(key)
+        return hit
+
+    columns = [c for c in (columns or []) if c in handle["columns"]] or None
+    needed = columns
+    if columns and strategy == "stratified" and stratify_by and stratify_by not in columns:
+        needed = columns + [stratify_by]
+    # head only needs its first rows; sampling reads the projected columns in full
+    df = read_rows(handle, needed, limit=int(max_rows) if strategy == "head" else None)
+    rows = _ordered_rows(df, strategy, stratify_by, int(seed))
+    if columns:
+        rows = rows[columns]
+    sample_csv, n_rows = _fit_rows(rows, int(max_tokens), int(max_rows))
+    block = BLOCK_HEADER + sample_csv + BLOCK_FOOTER if n_rows else ""
+    info = {"block": block, "rows": n_rows, "total_rows": handle["rows"], "est_tokens": estimate_tokens(block) if block else 0}
+
+    _block_cache[key] = info
+    if len(_block_cache) > BLOCK_CACHE_MAX:
+        _block_cache.popitem(last=False)
+    return info
+
+
+def dataset_block_info() -> dict | None:
+    handle = st.session_state.get("dataset_handle")
+    if handle is None:
+        return None
+    cfg = {**DEFAULT_BLOCK_CFG, **st.session_state.get("dataset_block_cfg", {})}
+    return build_dataset_block(handle, **cfg)
+
+
+def dataset_block_for_prompt() -> str:
+    info = dataset_block_info()
+    return info["block"] if info else ""
+
+
+def render_dataset_block_settings():
+    handle = st.session_state.get("dataset_handle")
+    if handle is None:
+        return
+
+    cfg = {**DEFAULT_BLOCK_CFG, **st.session_state.get("dataset_block_cfg", {})}
+    with st.expander("Dataset block sent with each prompt"):
+        d1, d2, d3 = st.columns(3)
+        with d1:
+            cfg["strategy"] = st.selectbox(
+                "Sampling", options=list(STRATEGIES), format_func=STRATEGIES.get,
+                index=list(STRATEGIES).index(cfg["strategy"]), key="dataset_strategy",
+            )
+        with d2:
+            cfg["max_tokens"] = st.number_input(
+                "token budget", min_value=100, max_value=100000, value=int(cfg["max_tokens"]), step=250,
+                key="dataset_max_tokens",
+            )
+        with d3:
+            cfg["max_rows"] = st.number_input(
+                "max rows", min_value=1, max_value=100000, value=int(cfg["max_rows"]), step=10, key="dataset_max_rows"
+            )
+
+        d4, d5 = st.columns([3, 1])
+        with d4:
+            cfg["columns"] = st.multiselect(
+                "Columns to include (empty = all)", options=handle["columns"],
+                default=[c for c in (cfg["columns"] or []) if c in handle["columns"]], key="dataset_columns",
+            ) or None
+        with d5:
+            cfg["seed"] = st.number_input(
+                "seed", min_value=0, value=int(cfg["seed"]), step=1, key="dataset_seed",
+                disabled=cfg["strategy"] == "head",
+            )
+        if cfg["strategy"] == "stratified":
+            cfg["stratify_by"] = st.selectbox("Stratify by", options=handle["columns"], key="dataset_stratify_by")
+
+        st.session_state["dataset_block_cfg"] = cfg
+        info = build_dataset_block(handle, **cfg)
+        if info["rows"]:
+            st.caption(f"{info['rows']}/{info['total_rows']} rows • ~{info['est_tokens']} tokens per prompt")
+        else:
+            st.warning("No rows fit in this token budget; prompts will be sent without the dataset.")
@@ -1,21 +1,203 @@
+import functools
+import hashlib
 import json
 import sqlite3
+import threading
+import time
 import uuid
-from datetime import datetime, timezone
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from answers import extract_answer
+from sketch import sketch_add, sketch_dumps, sketch_loads, sketch_merge, sketch_quantile
+from tokens import estimate_tokens
 
 DB_PATH = "spec_store.db"
+BUSY_TIMEOUT_S = 30
+
+_local = threading.local()
+
+
+def _connect(path: str):
+    # autocommit mode: reads need no transaction, writes go through transaction()
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_S, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-32000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
 
 
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        conn = conns[DB_PATH] = _connect(DB_PATH)
+    return conn
+
+
+def close_conn():
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
+
+
+@contextmanager
+def transaction():
+    conn = get_conn()
+    if conn.in_transaction:
+        # nested use joins the outer transaction
+        yield conn
+        return
+    # take the write lock up front so concurrent writers queue on busy_timeout
+    # instead of failing with "database is locked" on a lock upgrade
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _chunked_in(conn, sql: str, values, params: tuple = (), size: int = 500):
+    # rows of sql run over values in chunks that stay under SQLite's bound
+    # parameter limit; sql has a single "IN ({})" for the placeholders, after
+    # any other parameters
+    values = list(values)
+    for i in range(0, len(values), size):
+        chunk = values[i : i + size]
+        yield from conn.execute(sql.format(",".join("?" * len(chunk))), (*params, *chunk))
 
 
 def _utc_now():
     return datetime.now(timezone.utc).isoformat()
 
 
-def init_db():
-    conn = get_conn()
+# ---- Read cache ----
+# process-wide, so every Streamlit session and rerun shares it. Specs, base
+# prompts, variants and datasets are never changed after insert, so lookups by
+# id stay cached until evicted. List/count queries are tagged with the tables
+# they read and dropped when a save_* in this process bumps that table; the TTL
+# bounds how stale they can be after a write from another process (CLI, workers).
+READ_CACHE_MAX_BYTES = 64 << 20
+READ_CACHE_TTL_S = 10.0
+
+_read_cache = OrderedDict()
+_read_cache_bytes = [0]
+_read_cache_lock = threading.Lock()
+_table_versions = {}
+
+
+def _approx_size(value) -> int:
+    if isinstance(value, str):
+        return 50 + len(value)
+    if isinstance(value, dict):
+        return 100 + sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 60 + sum(_approx_size(v) for v in value)
+    return 30
+
+
+def _read_through(*tables):
+    # no tables: an immutable lookup by id; a miss (None) is not cached since the
+    # row may be inserted later
+    def wrap(fn):
+        @functools.wraps(fn)
+        def cached(*args, **kwargs):
+            key = (DB_PATH, fn.__name__, args, tuple(sorted(kwargs.items())))
+            versions = tuple(_table_versions.get((DB_PATH, t), 0) for t in tables)
+            now = time.monotonic()
+            with _read_cache_lock:
+                hit = _read_cache.get(key)
+                if hit is not None and hit[0] == versions and (not tables or now - hit[1] < READ_CACHE_TTL_S):
+                    _read_cache.move_to_end(key)
+                    return hit[2]
+            value = fn(*args, **kwargs)
+            if value is None and not tables:
+                return value
+            size = _approx_size(value)
+            with _read_cache_lock:
+                old = _read_cache.pop(key, None)
+                if old is not None:
+                    _read_cache_bytes[0] -= old[3]
+                _read_cache[key] = (versions, now, value, size)
+                _read_cache_bytes[0] += size
+                while _read_cache_bytes[0] > READ_CACHE_MAX_BYTES and len(_read_cache) > 1:
+                    _read_cache_bytes[0] -= _read_cache.popitem(last=False)[1][3]
+            return value
+
+        return cached
+
+    return wrap
+
+
+def _invalidate(*tables):
+    # call after the write has committed, so a concurrent read cannot cache the
+    # old rows under the new version
+    with _read_cache_lock:
+        for t in tables:
+            _table_versions[(DB_PATH, t)] = _table_versions.get((DB_PATH, t), 0) + 1
+
+
+def clear_read_cache():
+    with _read_cache_lock:
+        _read_cache.clear()
+        _read_cache_bytes[0] = 0
+
+
+def _ensure_columns(conn, table: str, columns: dict):
+    existing = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+# DB_PATHs whose schema and migrations are done in this process. app.py calls
+# init_db on every rerun; only the first call per store does any work.
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def init_db(force: bool = False):
+    # force: the file at DB_PATH was replaced (e.g. deleted and recreated)
+    if DB_PATH in _initialized and not force:
+        return
+    with _init_lock:
+        if DB_PATH in _initialized and not force:
+            return
+        _init_db()
+        _initialized.add(DB_PATH)
+
+
+def _has_rows(sql: str) -> bool:
+    # read-only probe, so a backfill with nothing to do never takes the write lock
+    return get_conn().execute(sql).fetchone() is not None
+
+
+def _init_db():
+    with transaction() as conn:
+        _create_tables(conn)
+    backfill_content_hashes()
+    backfill_variant_token_estimates()
+    backfill_variant_prompt_hashes()
+    # aggregates count the extracted answers, so rebuild them once old runs have one
+    if backfill_run_answers() or aggregates_missing():
+        rebuild_variant_aggregates()
+    if migrate_prompt_blobs():
+        get_conn().execute("VACUUM")
+        get_conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    # run keys hash the prompt, so after the blob migration has set prompt_hash
+    backfill_run_keys()
+    get_conn().execute("PRAGMA optimize")
+
+
+def _create_tables(conn):
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS specs (
@@ -25,6 +207,20 @@ def init_db():
         );
         """
     )
+    _ensure_columns(conn, "specs", {"dataset_hash": "TEXT", "content_hash": "TEXT"})
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS datasets (
+            hash TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            name TEXT NOT NULL,
+            path TEXT NOT NULL,
+            n_rows INTEGER NOT NULL,
+            columns_json TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL
+        );
+        """
+    )
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS base_prompts (
@@ -36,6 +232,7 @@ def init_db():
         );
         """
     )
+    _ensure_columns(conn, "base_prompts", {"prompt_hash": "TEXT"})
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS prompt_variants (
@@ -53,6 +250,7 @@ def init_db():
         );
         """
     )
+    _ensure_columns(conn, "prompt_variants", {"est_input_tokens": "INTEGER", "prompt_hash": "TEXT"})
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS runs (
@@ -77,53 +275,305 @@ def init_db():
         );
         """
     )
-    conn.commit()
-    conn.close()
+    _ensure_columns(
+        conn,
+        "runs",
+        {
+            "cache_hit": "INTEGER NOT NULL DEFAULT 0",
+            "saved_latency_ms": "INTEGER NOT NULL DEFAULT 0",
+            "prompt_hash": "TEXT",
+            "ttft_ms": "INTEGER",
+            "output_tokens": "INTEGER",
+            "tokens_per_sec": "REAL",
+            "est_input_tokens": "INTEGER",
+            "input_tokens": "INTEGER",
+            "answer_format": "TEXT",
+            "answer": "TEXT",
+            "answer_valid": "INTEGER",
+            "answer_error": "TEXT",
+            "run_key": "TEXT",
+        },
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS variant_aggregates (
+            variant_id TEXT NOT NULL,
+            model_name TEXT NOT NULL,
+            spec_id TEXT NOT NULL,
+            base_prompt_id TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            n_runs INTEGER NOT NULL,
+            n_parse_ok INTEGER NOT NULL,
+            n_cache_hit INTEGER NOT NULL,
+            latency_sum_ms INTEGER NOT NULL,
+            latency_sketch TEXT NOT NULL,
+            answer_counts_json TEXT NOT NULL,
+            PRIMARY KEY (variant_id, model_name)
+        );
+        """
+    )
+    _ensure_columns(conn, "variant_aggregates", {"n_answer_valid": "INTEGER NOT NULL DEFAULT 0"})
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_batches (
+            id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            spec_id TEXT NOT NULL,
+            base_prompt_id TEXT NOT NULL,
+            params_json TEXT NOT NULL,
+            dataset_block TEXT NOT NULL,
+            n_tasks INTEGER NOT NULL,
+            FOREIGN KEY(spec_id) REFERENCES specs(id),
+            FOREIGN KEY(base_prompt_id) REFERENCES base_prompts(id)
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            batch_id TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            tasks_json TEXT NOT NULL,
+            n_tasks INTEGER NOT NULL,
+            n_done INTEGER NOT NULL DEFAULT 0,
+            n_failed INTEGER NOT NULL DEFAULT 0,
+            n_cache_hit INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires_at REAL,
+            error TEXT,
+            FOREIGN KEY(batch_id) REFERENCES job_batches(id)
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS prompt_blobs (
+            hash TEXT PRIMARY KEY,
+            size_bytes INTEGER NOT NULL,
+            body BLOB NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            last_used_at TEXT NOT NULL,
+            model_name TEXT NOT NULL,
+            response_text TEXT NOT NULL,
+            latency_ms INTEGER NOT NULL,
+            size_bytes INTEGER NOT NULL
+        );
+        """
+    )
+    _create_indexes(conn)
 
 
-# ---- Specs ----
-def save_spec(spec: dict) -> str:
-    spec_id = str(uuid.uuid4())
-    conn = get_conn()
+def _create_indexes(conn):
+    # column order follows each list_* query: equality filters, then the ORDER BY
+    # column, then the selected columns so the lookup never touches the table
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_specs_created ON specs (created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_base_prompts_spec ON base_prompts (spec_id, created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_specs_content ON specs (content_hash, dataset_hash, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_base_prompts_hash ON base_prompts (spec_id, prompt_hash, created_at)")
     conn.execute(
-        "INSERT INTO specs (id, created_at, spec_json) VALUES (?, ?, ?)",
-        (spec_id, _utc_now(), json.dumps(spec, ensure_ascii=False)),
+        """
+        CREATE INDEX IF NOT EXISTS idx_variants_spec_base
+        ON prompt_variants (spec_id, base_prompt_id, created_at, id, perturbation_type, perturbation_id, strength)
+        """
     )
-    conn.commit()
-    conn.close()
+    # runs indexes dominate the file at high k: each one serves a read in
+    # _read_queries, and reads of one variant's or one prompt's runs sort that
+    # handful of rows instead of keeping a second ordering of the table
+    conn.execute("DROP INDEX IF EXISTS idx_runs_variant_created")
+    conn.execute("DROP INDEX IF EXISTS idx_runs_variant_k")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_runs_variant_k_summary
+        ON runs (variant_id, k_index, id, parse_ok, latency_ms)
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_unmigrated ON runs (id) WHERE prompt_hash IS NULL")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_variants_no_estimate ON prompt_variants (id) WHERE est_input_tokens IS NULL"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_variants_dedup ON prompt_variants (base_prompt_id, prompt_hash, perturbation_id)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_variants_no_hash ON prompt_variants (id) WHERE prompt_hash IS NULL")
+    conn.execute("DROP INDEX IF EXISTS idx_runs_prompt_created")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_prompt_hash ON runs (prompt_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_model ON runs (model_name, created_at)")
+    # spec filters go through the spec's base prompts (idx_runs_base_answers)
+    conn.execute("DROP INDEX IF EXISTS idx_runs_spec")
+    conn.execute("DROP INDEX IF EXISTS idx_runs_base_prompt")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_runs_base_answers
+        ON runs (base_prompt_id, created_at, variant_id, model_name, k_index, answer)
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_runs_answer_errors ON runs (base_prompt_id, answer_error) WHERE answer_valid = 0"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_no_answer ON runs (id) WHERE answer_valid IS NULL")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_runs_run_key ON runs (run_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_no_key ON runs (created_at) WHERE run_key IS NULL")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_runs_token_usage
+        ON runs (created_at, est_input_tokens, input_tokens)
+        WHERE input_tokens IS NOT NULL AND est_input_tokens IS NOT NULL
+        """
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_aggregates_base")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_aggregates_base_variant
+        ON variant_aggregates (base_prompt_id, spec_id, variant_id, model_name)
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_batches_base ON job_batches (base_prompt_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (created_at) WHERE status = 'queued'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_leases ON jobs (lease_expires_at) WHERE status = 'running'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at, size_bytes)")
+
+
+# ---- Specs ----
+def _spec_hash(spec: dict) -> str:
+    # key order does not change what a spec asks for
+    return _prompt_hash(json.dumps(spec, ensure_ascii=False, sort_keys=True))
+
+
+def save_spec(spec: dict, dataset_hash: str | None = None) -> str:
+    spec_id = str(uuid.uuid4())
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO specs (id, created_at, spec_json, dataset_hash, content_hash) VALUES (?, ?, ?, ?, ?)",
+            (spec_id, _utc_now(), json.dumps(spec, ensure_ascii=False), dataset_hash, _spec_hash(spec)),
+        )
+    _invalidate("specs")
     return spec_id
 
 
+def find_spec(spec: dict, dataset_hash: str | None = None) -> str | None:
+    # the oldest stored spec with the same content and dataset, if any
+    row = get_conn().execute(
+        "SELECT id FROM specs WHERE content_hash = ? AND dataset_hash IS ? ORDER BY created_at LIMIT 1",
+        (_spec_hash(spec), dataset_hash),
+    ).fetchone()
+    return row[0] if row else None
+
+
+@_read_through("specs")
 def list_specs(limit: int = 200):
     conn = get_conn()
     rows = conn.execute(
         "SELECT id, created_at FROM specs ORDER BY created_at DESC LIMIT ?",
         (limit,),
     ).fetchall()
-    conn.close()
     return rows
 
 
+@_read_through()
 def load_spec(spec_id: str):
     conn = get_conn()
     row = conn.execute("SELECT spec_json FROM specs WHERE id = ?", (spec_id,)).fetchone()
-    conn.close()
     return row[0] if row else None
 
 
+@_read_through()
+def load_spec_dataset_hash(spec_id: str):
+    conn = get_conn()
+    row = conn.execute("SELECT dataset_hash FROM specs WHERE id = ?", (spec_id,)).fetchone()
+    return row[0] if row else None
+
+
+# ---- Datasets ----
+# the rows live in a Parquet file under dataset.DATASET_DIR; this table only
+# records where, so specs can point at an upload by its content hash
+def save_dataset(dataset_hash: str, name: str, path: str, n_rows: int, columns: list[str], size_bytes: int):
+    with transaction() as conn:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO datasets (hash, created_at, name, path, n_rows, columns_json, size_bytes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (dataset_hash, _utc_now(), name, path, n_rows, json.dumps(columns, ensure_ascii=False), size_bytes),
+        )
+    _invalidate("datasets")
+
+
+@_read_through()
+def load_dataset(dataset_hash: str):
+    conn = get_conn()
+    row = conn.execute(
+        "SELECT hash, name, path, n_rows, columns_json, size_bytes FROM datasets WHERE hash = ?",
+        (dataset_hash,),
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "hash": row[0],
+        "name": row[1],
+        "path": row[2],
+        "rows": row[3],
+        "columns": json.loads(row[4]),
+        "size_bytes": row[5],
+    }
+
+
 # ---- Base prompts ----
 def save_base_prompt(spec_id: str, prompt_text: str) -> str:
     prompt_id = str(uuid.uuid4())
-    conn = get_conn()
-    conn.execute(
-        "INSERT INTO base_prompts (id, spec_id, created_at, prompt_text) VALUES (?, ?, ?, ?)",
-        (prompt_id, spec_id, _utc_now(), prompt_text),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO base_prompts (id, spec_id, created_at, prompt_text, prompt_hash) VALUES (?, ?, ?, ?, ?)",
+            (prompt_id, spec_id, _utc_now(), prompt_text, _prompt_hash(prompt_text)),
+        )
+    _invalidate("base_prompts")
     return prompt_id
 
 
+def find_base_prompt(spec_id: str, prompt_text: str) -> str | None:
+    # the oldest stored base prompt of the spec with this exact text, if any
+    row = get_conn().execute(
+        "SELECT id FROM base_prompts WHERE spec_id = ? AND prompt_hash = ? ORDER BY created_at LIMIT 1",
+        (spec_id, _prompt_hash(prompt_text)),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def backfill_content_hashes() -> int:
+    # specs and base prompts saved before they could be looked up by content
+    filled = 0
+    if _has_rows("SELECT 1 FROM specs WHERE content_hash IS NULL LIMIT 1"):
+        with transaction() as conn:
+            rows = conn.execute("SELECT id, spec_json FROM specs WHERE content_hash IS NULL").fetchall()
+            conn.executemany(
+                "UPDATE specs SET content_hash = ? WHERE id = ?",
+                [(_spec_hash(json.loads(text)), spec_id) for spec_id, text in rows],
+            )
+        filled += len(rows)
+    if _has_rows("SELECT 1 FROM base_prompts WHERE prompt_hash IS NULL LIMIT 1"):
+        with transaction() as conn:
+            rows = conn.execute("SELECT id, prompt_text FROM base_prompts WHERE prompt_hash IS NULL").fetchall()
+            conn.executemany(
+                "UPDATE base_prompts SET prompt_hash = ? WHERE id = ?",
+                [(_prompt_hash(text), prompt_id) for prompt_id, text in rows],
+            )
+        filled += len(rows)
+    return filled
+
+
+@_read_through("base_prompts")
 def list_base_prompts(spec_id: str, limit: int = 50):
     conn = get_conn()
     rows = conn.execute(
@@ -136,18 +586,74 @@ def list_base_prompts(spec_id: str, limit: int = 50):
         """,
         (spec_id, limit),
     ).fetchall()
-    conn.close()
     return rows
 
 
+@_read_through()
 def load_base_prompt(prompt_id: str):
     conn = get_conn()
     row = conn.execute("SELECT prompt_text FROM base_prompts WHERE id = ?", (prompt_id,)).fetchone()
-    conn.close()
     return row[0] if row else None
 
 
 # ---- Variants ----
+def _variant_row(spec_id: str, base_prompt_id: str, variant: dict) -> tuple:
+    return (
+        str(uuid.uuid4()),
+        spec_id,
+        base_prompt_id,
+        _utc_now(),
+        variant["perturbation_type"],
+        variant["perturbation_id"],
+        variant["strength"],
+        variant["prompt_text"],
+        json.dumps(variant["metadata"], ensure_ascii=False),
+        estimate_tokens(variant["prompt_text"]),
+        _prompt_hash(variant["prompt_text"]),
+    )
+
+
+def _stored_variant_ids(conn, base_prompt_id: str, prompt_hashes) -> dict:
+    # {(perturbation_id, prompt_hash): variant id} under a base prompt
+    rows = _chunked_in(
+        conn,
+        "SELECT perturbation_id, prompt_hash, id FROM prompt_variants WHERE base_prompt_id = ? AND prompt_hash IN ({})",
+        prompt_hashes,
+        params=(base_prompt_id,),
+    )
+    return {(pid, h): vid for pid, h, vid in rows}
+
+
+def save_prompt_variants_many(spec_id: str, base_prompt_id: str, variants: list[dict]) -> list[str]:
+    # idempotent: a variant with the same perturbation and prompt text as one
+    # already stored under the base prompt (or earlier in the list) is not
+    # inserted again, and the stored id is returned in its place, so re-saving
+    # a grid never creates new variant ids (and with them new run keys)
+    keys = [(v["perturbation_id"], _prompt_hash(v["prompt_text"])) for v in variants]
+    with transaction() as conn:
+        stored = _stored_variant_ids(conn, base_prompt_id, {h for _, h in keys})
+        rows = []
+        for v, key in zip(variants, keys):
+            if key in stored:
+                continue
+            row = _variant_row(spec_id, base_prompt_id, v)
+            stored[key] = row[0]
+            rows.append(row)
+        conn.executemany(
+            """
+            INSERT INTO prompt_variants (
+                id, spec_id, base_prompt_id, created_at,
+                perturbation_type, perturbation_id, strength,
+                variant_prompt_text, metadata_json, est_input_tokens, prompt_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+    if rows:
+        _invalidate("prompt_variants")
+    return [stored[key] for key in keys]
+
+
 def save_prompt_variant(
     spec_id: str,
     base_prompt_id: str,
@@ -157,33 +663,17 @@ def save_prompt_variant(
     variant_prompt_text: str,
     metadata: dict,
 ) -> str:
-    variant_id = str(uuid.uuid4())
-    conn = get_conn()
-    conn.execute(
-        """
-        INSERT INTO prompt_variants (
-            id, spec_id, base_prompt_id, created_at,
-            perturbation_type, perturbation_id, strength,
-            variant_prompt_text, metadata_json
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            variant_id,
-            spec_id,
-            base_prompt_id,
-            _utc_now(),
-            perturbation_type,
-            perturbation_id,
-            strength,
-            variant_prompt_text,
-            json.dumps(metadata, ensure_ascii=False),
-        ),
-    )
-    conn.commit()
-    conn.close()
-    return variant_id
+    variant = {
+        "perturbation_type": perturbation_type,
+        "perturbation_id": perturbation_id,
+        "strength": strength,
+        "prompt_text": variant_prompt_text,
+        "metadata": metadata,
+    }
+    return save_prompt_variants_many(spec_id, base_prompt_id, [variant])[0]
 
 
+@_read_through("prompt_variants")
 def list_prompt_variants(spec_id: str, base_prompt_id: str, limit: int = 200):
     conn = get_conn()
     rows = conn.execute(
@@ -196,10 +686,88 @@ def list_prompt_variants(spec_id: str, base_prompt_id: str, limit: int = 200):
         """,
         (spec_id, base_prompt_id, limit),
     ).fetchall()
-    conn.close()
     return rows
 
 
+@_read_through("prompt_variants")
+def list_variant_token_estimates(spec_id: str, base_prompt_id: str):
+    # every variant under the base prompt, for cost projections
+    conn = get_conn()
+    rows = conn.execute(
+        """
+        SELECT id, est_input_tokens
+        FROM prompt_variants
+        WHERE spec_id = ? AND base_prompt_id = ?
+        ORDER BY created_at DESC
+        """,
+        (spec_id, base_prompt_id),
+    ).fetchall()
+    return rows
+
+
+def iter_variant_prompts(spec_id: str, base_prompt_id: str):
+    # (variant_id, prompt text) of every variant under the base prompt, streamed
+    # from one cursor so a sweep over a large grid never holds the rows twice
+    cur = get_conn().execute(
+        """
+        SELECT id, variant_prompt_text
+        FROM prompt_variants
+        WHERE spec_id = ? AND base_prompt_id = ?
+        ORDER BY created_at DESC
+        """,
+        (spec_id, base_prompt_id),
+    )
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+
+def backfill_variant_token_estimates(batch_size: int = 1000) -> int:
+    # variants saved before est_input_tokens existed
+    filled = 0
+    if not _has_rows("SELECT 1 FROM prompt_variants WHERE est_input_tokens IS NULL LIMIT 1"):
+        return filled
+    while True:
+        with transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, variant_prompt_text FROM prompt_variants WHERE est_input_tokens IS NULL LIMIT ?",
+                (batch_size,),
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                "UPDATE prompt_variants SET est_input_tokens = ? WHERE id = ?",
+                [(estimate_tokens(text), variant_id) for variant_id, text in rows],
+            )
+        filled += len(rows)
+    if filled:
+        _invalidate("prompt_variants")
+    return filled
+
+
+def backfill_variant_prompt_hashes(batch_size: int = 1000) -> int:
+    # variants saved before saves were deduplicated by prompt hash
+    filled = 0
+    if not _has_rows("SELECT 1 FROM prompt_variants WHERE prompt_hash IS NULL LIMIT 1"):
+        return filled
+    while True:
+        with transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, variant_prompt_text FROM prompt_variants WHERE prompt_hash IS NULL LIMIT ?",
+                (batch_size,),
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                "UPDATE prompt_variants SET prompt_hash = ? WHERE id = ?",
+                [(_prompt_hash(text), variant_id) for variant_id, text in rows],
+            )
+        filled += len(rows)
+    return filled
+
+
+@_read_through()
 def load_prompt_variant(variant_id: str):
     conn = get_conn()
     row = conn.execute(
@@ -210,13 +778,216 @@ def load_prompt_variant(variant_id: str):
         """,
         (variant_id,),
     ).fetchone()
-    conn.close()
     if not row:
         return None
     return {"variant_prompt_text": row[0], "metadata": json.loads(row[1])}
 
 
+# ---- Prompt blobs ----
+# runs reference full prompt bodies by hash; the k repeats of a variant (and
+# variants sharing a prompt) store the dataset-heavy text once, compressed
+def _prompt_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _put_prompt_blobs(conn, blobs: dict):
+    hashes = list(blobs)
+    existing = {r[0] for r in _chunked_in(conn, "SELECT hash FROM prompt_blobs WHERE hash IN ({})", hashes)}
+    rows = []
+    for h in hashes:
+        if h in existing:
+            continue
+        raw = blobs[h].encode("utf-8")
+        rows.append((h, len(raw), zlib.compress(raw, 6)))
+    conn.executemany("INSERT OR IGNORE INTO prompt_blobs (hash, size_bytes, body) VALUES (?, ?, ?)", rows)
+
+
+def migrate_prompt_blobs(batch_size: int = 1000) -> int:
+    moved = 0
+    if not _has_rows("SELECT 1 FROM runs WHERE prompt_hash IS NULL LIMIT 1"):
+        return moved
+    while True:
+        with transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, full_prompt_text FROM runs WHERE prompt_hash IS NULL LIMIT ?",
+                (batch_size,),
+            ).fetchall()
+            if not rows:
+                break
+            blobs = {}
+            updates = []
+            for run_id, text in rows:
+                h = _prompt_hash(text)
+                blobs[h] = text
+                updates.append((h, run_id))
+            _put_prompt_blobs(conn, blobs)
+            conn.executemany("UPDATE runs SET prompt_hash = ?, full_prompt_text = '' WHERE id = ?", updates)
+        moved += len(rows)
+    return moved
+
+
 # ---- Runs ----
+# a run is identified by what was asked: variant, model, sampling params, the
+# exact prompt sent (variant text plus dataset block) and the repeat index.
+# The unique key makes saves idempotent and lets an interrupted batch resume.
+def run_key(
+    variant_id: str,
+    model_name: str,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    k_index: int,
+    prompt_hash: str,
+) -> str:
+    ident = f"{variant_id}\x1f{model_name}\x1f{float(temperature)!r}\x1f{float(top_p)!r}\x1f{int(max_tokens)}\x1f{int(k_index)}\x1f{prompt_hash}"
+    return hashlib.blake2b(ident.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def task_run_key(task: dict) -> str:
+    return run_key(
+        task["variant_id"], task["model_name"], task["temperature"], task["top_p"], task["max_tokens"],
+        task["k_index"], _prompt_hash(task["prompt_text"]),
+    )
+
+
+def existing_run_keys(keys: list[str]) -> dict:
+    # {run_key: run id} of the keys already stored
+    return dict(_chunked_in(get_conn(), "SELECT run_key, id FROM runs WHERE run_key IN ({})", keys))
+
+
+def backfill_run_keys(batch_size: int = 1000) -> int:
+    # runs saved before run_key existed, newest first so that when a batch was
+    # re-run and stored twice the latest copy takes the key; older copies get
+    # a key of their own and stay out of the way of resumes
+    filled = 0
+    if not _has_rows("SELECT 1 FROM runs WHERE run_key IS NULL LIMIT 1"):
+        return filled
+    while True:
+        with transaction() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, variant_id, model_name, temperature, top_p, max_tokens, k_index, prompt_hash
+                FROM runs
+                WHERE run_key IS NULL
+                ORDER BY created_at DESC
+                LIMIT ?
+                """,
+                (batch_size,),
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                "UPDATE OR IGNORE runs SET run_key = ? WHERE id = ?",
+                [(run_key(*r[1:7], r[7] or ""), r[0]) for r in rows],
+            )
+            conn.executemany(
+                "UPDATE runs SET run_key = 'superseded:' || id WHERE id = ? AND run_key IS NULL",
+                [(r[0],) for r in rows],
+            )
+        filled += len(rows)
+    return filled
+
+
+def _run_row(run: dict, prompt_hash: str) -> tuple:
+    return (
+        run.get("id") or str(uuid.uuid4()),
+        _utc_now(),
+        run["spec_id"],
+        run["base_prompt_id"],
+        run["variant_id"],
+        run["model_name"],
+        float(run["temperature"]),
+        float(run["top_p"]),
+        int(run["max_tokens"]),
+        int(run["k_index"]),
+        "",
+        prompt_hash,
+        run["response_text"],
+        int(run["latency_ms"]),
+        json.dumps(run.get("parsed_json") or {}, ensure_ascii=False),
+        1 if run["parse_ok"] else 0,
+        1 if run.get("cache_hit") else 0,
+        int(run.get("saved_latency_ms") or 0),
+        run.get("ttft_ms"),
+        run.get("output_tokens"),
+        run.get("tokens_per_sec"),
+        run.get("est_input_tokens"),
+        run.get("input_tokens"),
+        run.get("answer_format"),
+        run["answer"],
+        1 if run["answer_valid"] else 0,
+        run["answer_error"],
+        run["run_key"],
+    )
+
+
+def _variant_formats(conn, variant_ids) -> dict:
+    # output format each variant asked for, from the format axis metadata
+    return dict(
+        _chunked_in(
+            conn,
+            """
+            SELECT id, json_extract(metadata_json, '$.format_id')
+            FROM prompt_variants
+            WHERE id IN ({})
+            """,
+            variant_ids,
+        )
+    )
+
+
+def _extract_answers(conn, runs: list[dict]):
+    formats = _variant_formats(conn, {r["variant_id"] for r in runs if "answer_format" not in r})
+    for r in runs:
+        if "answer_format" not in r:
+            r["answer_format"] = formats.get(r["variant_id"])
+        r["answer"], r["answer_valid"], r["answer_error"] = extract_answer(r["answer_format"], r["response_text"])
+
+
+def save_runs_many(runs: list[dict]) -> list[str]:
+    # idempotent: a run whose key is already stored (or repeated in the batch)
+    # is not inserted again, and its stored id is returned in its place
+    _extract_answers(get_conn(), runs)
+    blobs = {}
+    for r in runs:
+        h = _prompt_hash(r["full_prompt_text"])
+        blobs[h] = r["full_prompt_text"]
+        if not r.get("run_key"):
+            r["run_key"] = run_key(
+                r["variant_id"], r["model_name"], r["temperature"], r["top_p"], r["max_tokens"], r["k_index"], h
+            )
+        r["prompt_hash"] = h
+    with transaction() as conn:
+        keys = [r["run_key"] for r in runs]
+        stored = existing_run_keys(keys)
+        new_runs, rows = [], []
+        for r in runs:
+            if r["run_key"] in stored:
+                continue
+            row = _run_row(r, r["prompt_hash"])
+            stored[r["run_key"]] = row[0]
+            new_runs.append(r)
+            rows.append(row)
+        _put_prompt_blobs(conn, blobs)
+        conn.executemany(
+            """
+            INSERT INTO runs (
+                id, created_at, spec_id, base_prompt_id, variant_id,
+                model_name, temperature, top_p, max_tokens, k_index,
+                full_prompt_text, prompt_hash, response_text,
+                latency_ms, parsed_json, parse_ok,
+                cache_hit, saved_latency_ms,
+                ttft_ms, output_tokens, tokens_per_sec,
+                est_input_tokens, input_tokens,
+                answer_format, answer, answer_valid, answer_error, run_key
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        _update_aggregates(conn, new_runs)
+    return [stored[k] for k in keys]
+
+
 def save_run(
     spec_id: str,
     base_prompt_id: str,
@@ -231,39 +1002,81 @@ def save_run(
     latency_ms: int,
     parsed_json: dict | None,
     parse_ok: bool,
+    cache_hit: bool = False,
+    saved_latency_ms: int = 0,
+    ttft_ms: int | None = None,
+    output_tokens: int | None = None,
+    tokens_per_sec: float | None = None,
+    est_input_tokens: int | None = None,
+    input_tokens: int | None = None,
+    run_key: str | None = None,
 ) -> str:
-    run_id = str(uuid.uuid4())
-    conn = get_conn()
-    conn.execute(
-        """
-        INSERT INTO runs (
-            id, created_at, spec_id, base_prompt_id, variant_id,
-            model_name, temperature, top_p, max_tokens, k_index,
-            full_prompt_text, response_text,
-            latency_ms, parsed_json, parse_ok
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            run_id,
-            _utc_now(),
-            spec_id,
-            base_prompt_id,
-            variant_id,
-            model_name,
-            float(temperature),
-            float(top_p),
-            int(max_tokens),
-            int(k_index),
-            full_prompt_text,
-            response_text,
-            int(latency_ms),
-            json.dumps(parsed_json or {}, ensure_ascii=False),
-            1 if parse_ok else 0,
-        ),
-    )
-    conn.commit()
-    conn.close()
-    return run_id
+    run = {
+        "spec_id": spec_id,
+        "base_prompt_id": base_prompt_id,
+        "variant_id": variant_id,
+        "model_name": model_name,
+        "temperature": temperature,
+        "top_p": top_p,
+        "max_tokens": max_tokens,
+        "k_index": k_index,
+        "full_prompt_text": full_prompt_text,
+        "response_text": response_text,
+        "latency_ms": latency_ms,
+        "parsed_json": parsed_json,
+        "parse_ok": parse_ok,
+        "cache_hit": cache_hit,
+        "saved_latency_ms": saved_latency_ms,
+        "ttft_ms": ttft_ms,
+        "output_tokens": output_tokens,
+        "tokens_per_sec": tokens_per_sec,
+        "est_input_tokens": est_input_tokens,
+        "input_tokens": input_tokens,
+        "run_key": run_key,
+    }
+    return save_runs_many([run])[0]
+
+
+class RunWriter:
+    def __init__(self, batch_size: int = 200, flush_interval_s: float = 2.0):
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, **run) -> str:
+        run_id = run.get("id") or str(uuid.uuid4())
+        run["id"] = run_id
+        with self._lock:
+            self._buffer.append(run)
+            due = (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval_s
+            )
+        if due:
+            self.flush()
+        return run_id
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not batch:
+            return
+        try:
+            save_runs_many(batch)
+        except Exception:
+            # keep the batch buffered so a later flush can retry it
+            with self._lock:
+                self._buffer[:0] = batch
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
 
 
 def list_runs(variant_id: str, limit: int = 50):
@@ -278,7 +1091,6 @@ def list_runs(variant_id: str, limit: int = 50):
         """,
         (variant_id, limit),
     ).fetchall()
-    conn.close()
     return rows
 
 
@@ -293,26 +1105,818 @@ def list_runs_for_variant(variant_id: str):
         """,
         (variant_id,),
     ).fetchall()
-    conn.close()
     return rows
 
 
-def load_run(run_id: str):
+@_read_through("prompt_variants")
+def count_prompt_variants(spec_id: str, base_prompt_id: str) -> int:
     conn = get_conn()
     row = conn.execute(
+        "SELECT COUNT(*) FROM prompt_variants WHERE spec_id = ? AND base_prompt_id = ?",
+        (spec_id, base_prompt_id),
+    ).fetchone()
+    return row[0]
+
+
+def iter_variants_with_runs(spec_id: str, base_prompt_id: str, limit: int = 20, offset: int = 0):
+    # one page of variants with their run summaries in a single query; response
+    # bodies stay in the table (see load_run_response) and the variant prompt is
+    # only selected on the first joined row of each variant
+    conn = get_conn()
+    cur = conn.execute(
+        """
+        SELECT
+            v.id, v.perturbation_type, v.perturbation_id,
+            CASE WHEN ROW_NUMBER() OVER (PARTITION BY v.id ORDER BY r.k_index) = 1
+                 THEN v.variant_prompt_text END,
+            r.id, r.k_index, r.parse_ok, r.latency_ms
+        FROM (
+            SELECT id, created_at, perturbation_type, perturbation_id, variant_prompt_text
+            FROM prompt_variants
+            WHERE spec_id = ? AND base_prompt_id = ?
+            ORDER BY created_at DESC
+            LIMIT ? OFFSET ?
+        ) v
+        LEFT JOIN runs r ON r.variant_id = v.id
+        ORDER BY v.created_at DESC, v.id, r.k_index
+        """,
+        (spec_id, base_prompt_id, limit, offset),
+    )
+    current = None
+    for vid, ptype, pid, prompt_text, run_id, k_index, parse_ok, latency_ms in cur:
+        if current is None or current["id"] != vid:
+            if current is not None:
+                yield current
+            current = {
+                "id": vid,
+                "perturbation_type": ptype,
+                "perturbation_id": pid,
+                "variant_prompt_text": prompt_text,
+                "runs": [],
+            }
+        if run_id is not None:
+            current["runs"].append((run_id, k_index, parse_ok, latency_ms))
+    if current is not None:
+        yield current
+
+
+def load_answer_rows(base_prompt_id: str):
+    # every run under a base prompt, oldest first so a re-run of the same
+    # (variant, model, k) overwrites the earlier one when building the matrix
+    conn = get_conn()
+    return conn.execute(
         """
-        SELECT full_prompt_text, response_text, parsed_json, parse_ok
+        SELECT variant_id, model_name, k_index, answer
         FROM runs
-        WHERE id = ?
+        WHERE base_prompt_id = ?
+        ORDER BY created_at
+        """,
+        (base_prompt_id,),
+    ).fetchall()
+
+
+# (name, SQL expression) of every exported column, in output order
+EXPORT_COLUMNS = [
+    ("run_id", "r.id"),
+    ("created_at", "r.created_at"),
+    ("spec_id", "r.spec_id"),
+    ("base_prompt_id", "r.base_prompt_id"),
+    ("variant_id", "r.variant_id"),
+    ("perturbation_type", "v.perturbation_type"),
+    ("perturbation_id", "v.perturbation_id"),
+    ("strength", "v.strength"),
+    ("persona_id", "json_extract(v.metadata_json, '$.persona_id')"),
+    ("format_id", "json_extract(v.metadata_json, '$.format_id')"),
+    ("paraphrase_id", "json_extract(v.metadata_json, '$.paraphrase_id')"),
+    ("section_order_id", "json_extract(v.metadata_json, '$.section_order_id')"),
+    ("model_name", "r.model_name"),
+    ("temperature", "r.temperature"),
+    ("top_p", "r.top_p"),
+    ("max_tokens", "r.max_tokens"),
+    ("k_index", "r.k_index"),
+    ("answer", "r.answer"),
+    ("answer_valid", "r.answer_valid"),
+    ("answer_error", "r.answer_error"),
+    ("parse_ok", "r.parse_ok"),
+    ("cache_hit", "r.cache_hit"),
+    ("latency_ms", "r.latency_ms"),
+    ("ttft_ms", "r.ttft_ms"),
+    ("est_input_tokens", "r.est_input_tokens"),
+    ("input_tokens", "r.input_tokens"),
+    ("output_tokens", "r.output_tokens"),
+    ("tokens_per_sec", "r.tokens_per_sec"),
+    ("response_text", "r.response_text"),
+]
+
+
+def iter_export_runs(
+    spec_id: str | None = None,
+    base_prompt_id: str | None = None,
+    model_names: list[str] | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    columns: list[str] | None = None,
+    batch_size: int = 10000,
+):
+    # runs joined with their variant's axes, yielded as lists of row tuples.
+    # The cursor is stepped batch by batch, so memory is bounded by batch_size
+    # whatever the size of the result. There is deliberately no ORDER BY: rows
+    # come in the order of the index picked for the filters (or insertion
+    # order), where sorting would build the whole result in a temp b-tree.
+    # since is inclusive and until exclusive, compared against the ISO created_at.
+    exprs = dict(EXPORT_COLUMNS)
+    columns = columns or [name for name, _ in EXPORT_COLUMNS]
+    where, params = [], []
+    if spec_id is not None:
+        # through the spec's base prompts, so idx_runs_base_answers serves
+        # spec filters (and their since/until) too; a spec without any gets
+        # IN (NULL), which matches no run
+        rows = get_conn().execute("SELECT id FROM base_prompts WHERE spec_id = ?", (spec_id,)).fetchall()
+        base_ids = [row[0] for row in rows] or [None]
+        where.append(f"r.base_prompt_id IN ({','.join('?' * len(base_ids))})")
+        params.extend(base_ids)
+    for clause, value in (
+        ("r.base_prompt_id = ?", base_prompt_id),
+        ("r.created_at >= ?", since),
+        ("r.created_at < ?", until),
+    ):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    if model_names:
+        where.append(f"r.model_name IN ({','.join('?' * len(model_names))})")
+        params.extend(model_names)
+    cur = get_conn().execute(
+        f"""
+        SELECT {', '.join(exprs[c] for c in columns)}
+        FROM runs r
+        LEFT JOIN prompt_variants v ON v.id = r.variant_id
+        WHERE {' AND '.join(where) or '1 = 1'}
+        """,
+        params,
+    )
+    try:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def answer_error_counts(base_prompt_id: str):
+    conn = get_conn()
+    return conn.execute(
+        """
+        SELECT answer_error, COUNT(*)
+        FROM runs
+        WHERE base_prompt_id = ? AND answer_valid = 0
+        GROUP BY answer_error
+        ORDER BY COUNT(*) DESC
+        """,
+        (base_prompt_id,),
+    ).fetchall()
+
+
+def backfill_run_answers(batch_size: int = 1000) -> int:
+    # runs saved before answers were extracted at save time
+    filled = 0
+    if not _has_rows("SELECT 1 FROM runs WHERE answer_valid IS NULL LIMIT 1"):
+        return filled
+    while True:
+        with transaction() as conn:
+            rows = conn.execute(
+                """
+                SELECT r.id, r.response_text, json_extract(v.metadata_json, '$.format_id')
+                FROM runs r
+                LEFT JOIN prompt_variants v ON v.id = r.variant_id
+                WHERE r.answer_valid IS NULL
+                LIMIT ?
+                """,
+                (batch_size,),
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for run_id, text, format_id in rows:
+                answer, valid, error = extract_answer(format_id, text)
+                updates.append((format_id, answer, 1 if valid else 0, error, run_id))
+            conn.executemany(
+                "UPDATE runs SET answer_format = ?, answer = ?, answer_valid = ?, answer_error = ? WHERE id = ?",
+                updates,
+            )
+        filled += len(rows)
+    return filled
+
+
+def load_run_response(run_id: str):
+    conn = get_conn()
+    row = conn.execute("SELECT response_text FROM runs WHERE id = ?", (run_id,)).fetchone()
+    return row[0] if row else None
+
+
+def sample_run_responses(prompt_text: str | None = None, model_name: str | None = None, limit: int = 200):
+    conn = get_conn()
+    if prompt_text is not None:
+        where, params = "prompt_hash = ?", (_prompt_hash(prompt_text),)
+    elif model_name is not None:
+        where, params = "model_name = ?", (model_name,)
+    else:
+        where, params = "1 = 1", ()
+    rows = conn.execute(
+        f"SELECT response_text FROM runs WHERE {where} AND response_text != '' ORDER BY created_at DESC LIMIT ?",
+        (*params, limit),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def load_run(run_id: str):
+    conn = get_conn()
+    row = conn.execute(
+        """
+        SELECT r.full_prompt_text, r.response_text, r.parsed_json, r.parse_ok, b.body,
+               r.latency_ms, r.ttft_ms, r.output_tokens, r.tokens_per_sec,
+               r.est_input_tokens, r.input_tokens,
+               r.answer_format, r.answer, r.answer_valid, r.answer_error
+        FROM runs r
+        LEFT JOIN prompt_blobs b ON b.hash = r.prompt_hash
+        WHERE r.id = ?
         """,
         (run_id,),
     ).fetchone()
-    conn.close()
     if not row:
         return None
     return {
-        "full_prompt_text": row[0],
+        "full_prompt_text": zlib.decompress(row[4]).decode("utf-8") if row[4] is not None else row[0],
         "response_text": row[1],
         "parsed_json": json.loads(row[2]) if row[2] else {},
         "parse_ok": bool(row[3]),
+        "latency_ms": row[5],
+        "ttft_ms": row[6],
+        "output_tokens": row[7],
+        "tokens_per_sec": row[8],
+        "est_input_tokens": row[9],
+        "input_tokens": row[10],
+        "answer_format": row[11],
+        "answer": row[12],
+        "answer_valid": bool(row[13]),
+        "answer_error": row[14],
+    }
+
+
+# ---- Per-variant aggregates ----
+# one row per (variant, model), updated in the same transaction as the runs it
+# summarizes so dashboards read O(variants) rows instead of scanning runs.
+# Latency is only sketched for real calls; cache hits would drag p50 to ~0.
+AGGREGATE_MAX_ANSWERS = 20
+OTHER_ANSWER = "(other)"
+
+
+def _empty_aggregate() -> dict:
+    return {
+        "n_runs": 0, "n_parse_ok": 0, "n_answer_valid": 0, "n_cache_hit": 0, "latency_sum_ms": 0,
+        "sketch": {}, "answers": {},
     }
+
+
+def _add_to_aggregate(agg: dict, answer: str, answer_valid, parse_ok, cache_hit, latency_ms: int):
+    agg["n_runs"] += 1
+    agg["n_parse_ok"] += 1 if parse_ok else 0
+    agg["n_answer_valid"] += 1 if answer_valid else 0
+    if cache_hit:
+        agg["n_cache_hit"] += 1
+    else:
+        agg["latency_sum_ms"] += int(latency_ms)
+        sketch_add(agg["sketch"], latency_ms)
+    agg["answers"][answer] = agg["answers"].get(answer, 0) + 1
+
+
+def _cap_answers(answers: dict) -> dict:
+    # free-text answers can be unique per run; keep the distribution bounded
+    if len(answers) <= AGGREGATE_MAX_ANSWERS:
+        return answers
+    ranked = sorted(answers.items(), key=lambda kv: (kv[0] == OTHER_ANSWER, -kv[1]))
+    kept = dict(ranked[: AGGREGATE_MAX_ANSWERS - 1])
+    kept[OTHER_ANSWER] = sum(c for _, c in ranked[AGGREGATE_MAX_ANSWERS - 1 :])
+    return kept
+
+
+def _write_aggregates(conn, groups: dict, now: str):
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO variant_aggregates (
+            variant_id, model_name, spec_id, base_prompt_id, updated_at,
+            n_runs, n_parse_ok, n_answer_valid, n_cache_hit, latency_sum_ms, latency_sketch, answer_counts_json
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                variant_id, model_name, agg["spec_id"], agg["base_prompt_id"], now,
+                agg["n_runs"], agg["n_parse_ok"], agg["n_answer_valid"], agg["n_cache_hit"], agg["latency_sum_ms"],
+                sketch_dumps(agg["sketch"]), json.dumps(_cap_answers(agg["answers"]), ensure_ascii=False, sort_keys=True),
+            )
+            for (variant_id, model_name), agg in groups.items()
+        ],
+    )
+
+
+def _update_aggregates(conn, runs: list[dict]):
+    # fold the batch into per-group deltas first, then one read-merge-write per group
+    deltas = {}
+    for r in runs:
+        key = (r["variant_id"], r["model_name"])
+        if key not in deltas:
+            deltas[key] = {**_empty_aggregate(), "spec_id": r["spec_id"], "base_prompt_id": r["base_prompt_id"]}
+        _add_to_aggregate(
+            deltas[key], r["answer"], r["answer_valid"], r["parse_ok"], r.get("cache_hit"), r["latency_ms"]
+        )
+
+    for (variant_id, model_name), delta in deltas.items():
+        row = conn.execute(
+            """
+            SELECT n_runs, n_parse_ok, n_answer_valid, n_cache_hit, latency_sum_ms, latency_sketch, answer_counts_json
+            FROM variant_aggregates
+            WHERE variant_id = ? AND model_name = ?
+            """,
+            (variant_id, model_name),
+        ).fetchone()
+        if row is None:
+            continue
+        delta["n_runs"] += row[0]
+        delta["n_parse_ok"] += row[1]
+        delta["n_answer_valid"] += row[2]
+        delta["n_cache_hit"] += row[3]
+        delta["latency_sum_ms"] += row[4]
+        sketch_merge(delta["sketch"], sketch_loads(row[5]))
+        for answer, c in json.loads(row[6]).items():
+            delta["answers"][answer] = delta["answers"].get(answer, 0) + c
+    _write_aggregates(conn, deltas, _utc_now())
+
+
+def aggregates_missing() -> bool:
+    # an existing database that predates the aggregates table
+    conn = get_conn()
+    has_runs = conn.execute("SELECT 1 FROM runs LIMIT 1").fetchone() is not None
+    return has_runs and conn.execute("SELECT 1 FROM variant_aggregates LIMIT 1").fetchone() is None
+
+
+def rebuild_variant_aggregates(batch_size: int = 5000) -> int:
+    # recompute every aggregate from runs in one transaction; runs come in
+    # variant order (index order, no sort) and groups are written out in batches
+    # at variant boundaries, so memory stays bounded on large stores
+    n_groups = 0
+    now = _utc_now()
+    with transaction() as conn:
+        conn.execute("DELETE FROM variant_aggregates")
+        cur = conn.execute(
+            """
+            SELECT variant_id, model_name, spec_id, base_prompt_id,
+                   answer, answer_valid, parse_ok, cache_hit, latency_ms
+            FROM runs
+            ORDER BY variant_id
+            """
+        )
+        pending, current = {}, None
+        for variant_id, model_name, spec_id, base_prompt_id, answer, valid, parse_ok, cache_hit, latency_ms in cur:
+            if variant_id != current and len(pending) >= batch_size:
+                _write_aggregates(conn, pending, now)
+                n_groups += len(pending)
+                pending = {}
+            current = variant_id
+            agg = pending.get((variant_id, model_name))
+            if agg is None:
+                agg = pending[(variant_id, model_name)] = {
+                    **_empty_aggregate(), "spec_id": spec_id, "base_prompt_id": base_prompt_id
+                }
+            _add_to_aggregate(agg, answer, valid, parse_ok, cache_hit, latency_ms)
+        _write_aggregates(conn, pending, now)
+        n_groups += len(pending)
+    return n_groups
+
+
+def _aggregate_summary(row) -> dict:
+    variant_id, model_name, n_runs, n_parse_ok, n_answer_valid, n_cache_hit, latency_sum_ms, sketch_text, answers_json = row
+    sketch = sketch_loads(sketch_text)
+    n_real = n_runs - n_cache_hit
+    return {
+        "variant_id": variant_id,
+        "model_name": model_name,
+        "n_runs": n_runs,
+        "parse_ok_rate": n_parse_ok / n_runs if n_runs else None,
+        "answer_valid_rate": n_answer_valid / n_runs if n_runs else None,
+        "cache_hit_rate": n_cache_hit / n_runs if n_runs else None,
+        "latency_mean_ms": latency_sum_ms / n_real if n_real else None,
+        "latency_p50_ms": sketch_quantile(sketch, 0.5),
+        "latency_p95_ms": sketch_quantile(sketch, 0.95),
+        "answers": json.loads(answers_json),
+    }
+
+
+def list_variant_aggregates(spec_id: str, base_prompt_id: str):
+    conn = get_conn()
+    rows = conn.execute(
+        """
+        SELECT variant_id, model_name, n_runs, n_parse_ok, n_answer_valid, n_cache_hit,
+               latency_sum_ms, latency_sketch, answer_counts_json
+        FROM variant_aggregates
+        WHERE base_prompt_id = ? AND spec_id = ?
+        ORDER BY variant_id, model_name
+        """,
+        (base_prompt_id, spec_id),
+    ).fetchall()
+    return [_aggregate_summary(r) for r in rows]
+
+
+def load_variant_aggregates(variant_ids: list[str]):
+    out = {}
+    rows = _chunked_in(
+        get_conn(),
+        """
+        SELECT variant_id, model_name, n_runs, n_parse_ok, n_answer_valid, n_cache_hit,
+               latency_sum_ms, latency_sketch, answer_counts_json
+        FROM variant_aggregates
+        WHERE variant_id IN ({})
+        ORDER BY variant_id, model_name
+        """,
+        variant_ids,
+    )
+    for r in rows:
+        out.setdefault(r[0], []).append(_aggregate_summary(r))
+    return out
+
+
+# ---- Job queue ----
+# step 4 (or the CLI) enqueues a batch of runs split into jobs; worker processes
+# (jobs.py) claim one job at a time under a lease they keep renewing. A job whose
+# worker died is handed out again once the lease runs out; since saves are
+# idempotent on run_key, the retry only makes the calls that were still missing.
+JOB_LEASE_S = 60
+JOB_MAX_ATTEMPTS = 3
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+
+def enqueue_job_batch(
+    spec_id: str, base_prompt_id: str, params: dict, dataset_block: str, job_tasks: list[list]
+) -> str:
+    batch_id = str(uuid.uuid4())
+    now = _utc_now()
+    with transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO job_batches (id, created_at, spec_id, base_prompt_id, params_json, dataset_block, n_tasks)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (batch_id, now, spec_id, base_prompt_id, json.dumps(params), dataset_block, sum(map(len, job_tasks))),
+        )
+        conn.executemany(
+            """
+            INSERT INTO jobs (id, batch_id, created_at, updated_at, status, tasks_json, n_tasks)
+            VALUES (?, ?, ?, ?, 'queued', ?, ?)
+            """,
+            [(str(uuid.uuid4()), batch_id, now, now, json.dumps(tasks), len(tasks)) for tasks in job_tasks],
+        )
+    return batch_id
+
+
+def claim_job(worker_id: str, lease_s: float = JOB_LEASE_S, max_attempts: int = JOB_MAX_ATTEMPTS):
+    # BEGIN IMMEDIATE serializes claims across worker processes
+    now = time.time()
+    with transaction() as conn:
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= ? THEN 'lease expired on every attempt' ELSE error END,
+                lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE status = 'running' AND lease_expires_at < ?
+            """,
+            (max_attempts, max_attempts, _utc_now(), now),
+        )
+        row = conn.execute(
+            "SELECT id, batch_id, tasks_json FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'running', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1,
+                n_done = 0, n_failed = 0, n_cache_hit = 0, updated_at = ?
+            WHERE id = ?
+            """,
+            (worker_id, now + lease_s, _utc_now(), row[0]),
+        )
+        batch = conn.execute(
+            "SELECT spec_id, base_prompt_id, params_json, dataset_block FROM job_batches WHERE id = ?",
+            (row[1],),
+        ).fetchone()
+    return {
+        "id": row[0],
+        "batch_id": row[1],
+        "tasks": json.loads(row[2]),
+        "spec_id": batch[0],
+        "base_prompt_id": batch[1],
+        "params": json.loads(batch[2]),
+        "dataset_block": batch[3],
+    }
+
+
+def heartbeat_job(job_id: str, worker_id: str, progress: dict, lease_s: float = JOB_LEASE_S) -> bool:
+    # False when the job is no longer ours: cancelled, or re-leased after we stalled
+    with transaction() as conn:
+        cur = conn.execute(
+            """
+            UPDATE jobs
+            SET lease_expires_at = ?, n_done = ?, n_failed = ?, n_cache_hit = ?, updated_at = ?
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """,
+            (time.time() + lease_s, progress["done"], progress["failed"], progress["cache_hits"], _utc_now(),
+             job_id, worker_id),
+        )
+    return cur.rowcount == 1
+
+
+def finish_job(job_id: str, worker_id: str, status: str, progress: dict, error: str | None = None) -> bool:
+    with transaction() as conn:
+        cur = conn.execute(
+            """
+            UPDATE jobs
+            SET status = ?, n_done = ?, n_failed = ?, n_cache_hit = ?, error = ?,
+                lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """,
+            (status, progress["done"], progress["failed"], progress["cache_hits"], error, _utc_now(),
+             job_id, worker_id),
+        )
+    return cur.rowcount == 1
+
+
+def release_job(job_id: str, worker_id: str):
+    # a worker shutting down cleanly hands its job straight back, without
+    # counting the attempt
+    with transaction() as conn:
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'queued', attempts = attempts - 1, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """,
+            (_utc_now(), job_id, worker_id),
+        )
+
+
+def cancel_job_batch(batch_id: str) -> int:
+    with transaction() as conn:
+        cur = conn.execute(
+            """
+            UPDATE jobs SET status = 'cancelled', lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE batch_id = ? AND status IN ('queued', 'running')
+            """,
+            (_utc_now(), batch_id),
+        )
+    return cur.rowcount
+
+
+def list_job_batches(base_prompt_id: str, limit: int = 10):
+    conn = get_conn()
+    batches = conn.execute(
+        """
+        SELECT id, created_at, n_tasks
+        FROM job_batches
+        WHERE base_prompt_id = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+        """,
+        (base_prompt_id, limit),
+    ).fetchall()
+    if not batches:
+        return []
+    ids = [b[0] for b in batches]
+    stats = {}
+    for batch_id, status, n_jobs, done, failed, hits, last_update in conn.execute(
+        f"""
+        SELECT batch_id, status, COUNT(*), SUM(n_done), SUM(n_failed), SUM(n_cache_hit), MAX(updated_at)
+        FROM jobs
+        WHERE batch_id IN ({",".join("?" * len(ids))})
+        GROUP BY batch_id, status
+        """,
+        ids,
+    ):
+        s = stats.setdefault(
+            batch_id, {"jobs": dict.fromkeys(JOB_STATUSES, 0), "done": 0, "failed": 0, "cache_hits": 0, "updated_at": ""}
+        )
+        s["jobs"][status] = n_jobs
+        s["done"] += done
+        s["failed"] += failed
+        s["cache_hits"] += hits
+        s["updated_at"] = max(s["updated_at"], last_update)
+    return [
+        {"id": batch_id, "created_at": created_at, "n_tasks": n_tasks, **stats.get(batch_id, {})}
+        for batch_id, created_at, n_tasks in batches
+    ]
+
+
+# ---- Usage history (for cost/time estimates) ----
+def token_estimate_totals(limit: int = 1000):
+    # (estimated, actual) input tokens summed over recent runs that have both
+    conn = get_conn()
+    row = conn.execute(
+        """
+        SELECT SUM(est_input_tokens), SUM(input_tokens)
+        FROM (
+            SELECT est_input_tokens, input_tokens
+            FROM runs
+            WHERE input_tokens IS NOT NULL AND est_input_tokens IS NOT NULL
+            ORDER BY created_at DESC
+            LIMIT ?
+        )
+        """,
+        (limit,),
+    ).fetchone()
+    return row[0] or 0, row[1] or 0
+
+
+def recent_latency_ms(model_name: str, limit: int = 200):
+    # mean latency of recent real calls (cache hits excluded); None without history
+    conn = get_conn()
+    row = conn.execute(
+        """
+        SELECT AVG(latency_ms), COUNT(*)
+        FROM (
+            SELECT latency_ms
+            FROM runs
+            WHERE model_name = ? AND cache_hit = 0
+            ORDER BY created_at DESC
+            LIMIT ?
+        )
+        """,
+        (model_name, limit),
+    ).fetchone()
+    return row[0] if row[1] else None
+
+
+# ---- LLM response cache ----
+# last_used_at only orders eviction, which never looks finer than this, so a
+# hit rewrites it (taking the write lock) at most once per interval per entry
+CACHE_TOUCH_INTERVAL_S = 3600
+
+
+def get_cached_response(key: str):
+    conn = get_conn()
+    row = conn.execute(
+        "SELECT response_text, latency_ms, last_used_at FROM llm_cache WHERE key = ?", (key,)
+    ).fetchone()
+    if not row:
+        return None
+    now = datetime.now(timezone.utc)
+    if row[2] < (now - timedelta(seconds=CACHE_TOUCH_INTERVAL_S)).isoformat():
+        with transaction() as conn:
+            conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now.isoformat(), key))
+    return row[0], row[1]
+
+
+def put_cached_response(key: str, model_name: str, response_text: str, latency_ms: int):
+    now = _utc_now()
+    with transaction() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO llm_cache (
+                key, created_at, last_used_at, model_name, response_text, latency_ms, size_bytes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (key, now, now, model_name, response_text, int(latency_ms), len(response_text.encode("utf-8"))),
+        )
+
+
+def evict_cache(max_entries: int, max_bytes: int, max_age_days: float):
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat()
+    with transaction() as conn:
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (cutoff,))
+        # least recently used entries go first once over the count or size limit
+        conn.execute(
+            """
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key,
+                           ROW_NUMBER() OVER (ORDER BY last_used_at DESC) AS rn,
+                           SUM(size_bytes) OVER (ORDER BY last_used_at DESC) AS running_bytes
+                    FROM llm_cache
+                )
+                WHERE rn > ? OR running_bytes > ?
+            )
+            """,
+            (int(max_entries), int(max_bytes)),
+        )
+
+
+def cache_stats():
+    conn = get_conn()
+    row = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_cache").fetchone()
+    return {"entries": row[0], "bytes": row[1]}
+
+
+# ---- Query plans ----
+def _read_queries():
+    return {
+        "list_specs": lambda: list_specs(),
+        "load_spec": lambda: load_spec("x"),
+        "load_spec_dataset_hash": lambda: load_spec_dataset_hash("x"),
+        "find_spec": lambda: find_spec({}, "x"),
+        "find_base_prompt": lambda: find_base_prompt("x", "x"),
+        "load_dataset": lambda: load_dataset("x"),
+        "list_base_prompts": lambda: list_base_prompts("x"),
+        "load_base_prompt": lambda: load_base_prompt("x"),
+        "list_prompt_variants": lambda: list_prompt_variants("x", "x"),
+        "load_prompt_variant": lambda: load_prompt_variant("x"),
+        "list_variant_token_estimates": lambda: list_variant_token_estimates("x", "x"),
+        "list_runs": lambda: list_runs("x"),
+        "list_runs_for_variant": lambda: list_runs_for_variant("x"),
+        "load_run": lambda: load_run("x"),
+        "token_estimate_totals": lambda: token_estimate_totals(),
+        "recent_latency_ms": lambda: recent_latency_ms("x"),
+        "count_prompt_variants": lambda: count_prompt_variants("x", "x"),
+        "iter_variants_with_runs": lambda: list(iter_variants_with_runs("x", "x")),
+        "iter_variant_prompts": lambda: list(iter_variant_prompts("x", "x")),
+        "load_run_response": lambda: load_run_response("x"),
+        "load_answer_rows": lambda: load_answer_rows("x"),
+        "existing_run_keys": lambda: existing_run_keys(["x", "y"]),
+        "stored_variant_ids": lambda: _stored_variant_ids(get_conn(), "x", ["x", "y"]),
+        "answer_error_counts": lambda: answer_error_counts("x"),
+        "iter_export_runs[base_prompt]": lambda: list(iter_export_runs(base_prompt_id="x")),
+        "iter_export_runs[spec, since]": lambda: list(iter_export_runs(spec_id="x", since="2026-01-01")),
+        "iter_export_runs[models]": lambda: list(iter_export_runs(model_names=["x", "y"])),
+        "list_variant_aggregates": lambda: list_variant_aggregates("x", "x"),
+        "load_variant_aggregates": lambda: load_variant_aggregates(["x", "y"]),
+        "sample_run_responses(prompt)": lambda: sample_run_responses(prompt_text="x"),
+        "sample_run_responses(model)": lambda: sample_run_responses(model_name="x"),
+        "get_cached_response": lambda: get_cached_response("x"),
+        "list_job_batches": lambda: list_job_batches("x"),
+    }
+
+
+def explain_read_queries() -> dict:
+    conn = get_conn()
+    plans = {}
+    for name, call in _read_queries().items():
+        # a cached read would run no SQL to explain
+        clear_read_cache()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        plans[name] = statements
+    # explained on a fresh connection: EXPLAIN does not check the schema version,
+    # so a statement cached before an index change would report the old plan
+    explain_conn = _connect(DB_PATH)
+    try:
+        for name, statements in plans.items():
+            plans[name] = [
+                row[3] for sql in statements for row in explain_conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+            ]
+    finally:
+        explain_conn.close()
+    return plans
+
+
+# reads whose ORDER BY sorts a bounded input, not the table: one page of
+# variants and their runs, the runs of one variant or one prompt, and the
+# groups of distinct answer errors
+BOUNDED_SORTS = {"iter_variants_with_runs", "list_runs", "sample_run_responses(prompt)", "answer_error_counts"}
+
+
+def find_table_scans() -> dict:
+    # a bare "SCAN <table or alias>", or a temp b-tree sort an index should have
+    # provided; scans of a bounded subquery (a CO-ROUTINE or MATERIALIZE step of
+    # the same plan) are fine
+    bad = {}
+    for name, details in explain_read_queries().items():
+        subqueries = {d.split(" ", 1)[1] for d in details if d.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+        offending = [
+            d for d in details
+            if (d.startswith("SCAN ") and " INDEX " not in d and d[5:] not in subqueries and not d[5:].startswith("("))
+            or ("TEMP B-TREE" in d and name not in BOUNDED_SORTS)
+        ]
+        if offending:
+            bad[name] = offending
+    return bad
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintenance commands for the spec store.")
+    parser.add_argument("command", choices=["rebuild-aggregates"])
+    parser.add_argument("--db", default=DB_PATH, help="path to the SQLite store")
+    args = parser.parse_args()
+
+    DB_PATH = args.db
+    with transaction() as conn:
+        _create_tables(conn)
+    if args.command == "rebuild-aggregates":
+        t0 = time.perf_counter()
+        backfill_run_answers()
+        n = rebuild_variant_aggregates()
+        print(f"rebuilt {n} variant aggregates in {time.perf_counter() - t0:.1f}s")
@@ -0,0 +1,107 @@
+import os
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+import db
+
+# Streams runs out of the store in record batches, so an export of any size
+# holds at most one batch (plus the writer's buffers) in memory.
+EXPORT_BATCH_ROWS = 10000
+EXPORT_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".csv": "csv"}
+
+SCHEMA = pa.schema(
+    [
+        ("run_id", pa.string()),
+        ("created_at", pa.string()),
+        ("spec_id", pa.string()),
+        ("base_prompt_id", pa.string()),
+        ("variant_id", pa.string()),
+        ("perturbation_type", pa.string()),
+        ("perturbation_id", pa.string()),
+        ("strength", pa.string()),
+        ("persona_id", pa.string()),
+        ("format_id", pa.string()),
+        ("paraphrase_id", pa.string()),
+        ("section_order_id", pa.string()),
+        ("model_name", pa.string()),
+        ("temperature", pa.float64()),
+        ("top_p", pa.float64()),
+        ("max_tokens", pa.int32()),
+        ("k_index", pa.int32()),
+        ("answer", pa.string()),
+        ("answer_valid", pa.bool_()),
+        ("answer_error", pa.string()),
+        ("parse_ok", pa.bool_()),
+        ("cache_hit", pa.bool_()),
+        ("latency_ms", pa.int64()),
+        ("ttft_ms", pa.int64()),
+        ("est_input_tokens", pa.int64()),
+        ("input_tokens", pa.int64()),
+        ("output_tokens", pa.int64()),
+        ("tokens_per_sec", pa.float64()),
+        ("response_text", pa.string()),
+    ]
+)
+
+
+def _column(values, field: pa.Field) -> pa.Array:
+    if field.type == pa.bool_():
+        # stored as 0/1 integers
+        return pa.array(values, type=pa.int8()).cast(pa.bool_())
+    return pa.array(values, type=field.type)
+
+
+def iter_record_batches(schema: pa.Schema = SCHEMA, batch_rows: int = EXPORT_BATCH_ROWS, **filters):
+    for rows in db.iter_export_runs(columns=schema.names, batch_size=batch_rows, **filters):
+        columns = zip(*rows)
+        yield pa.RecordBatch.from_arrays([_column(list(c), f) for c, f in zip(columns, schema)], schema=schema)
+
+
+WRITERS = {
+    "parquet": lambda path, schema: pq.ParquetWriter(path, schema, compression="zstd"),
+    "arrow": lambda path, schema: pa.ipc.new_file(path, schema),
+    "csv": lambda path, schema: pa_csv.CSVWriter(path, schema),
+}
+
+
+def export_format(path: str) -> str:
+    fmt = EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"can't tell the export format of {path}; use one of {', '.join(EXPORT_FORMATS)}")
+    return fmt
+
+
+def export_runs(
+    path: str,
+    fmt: str | None = None,
+    include_text: bool = True,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    on_batch=None,
+    **filters,
+) -> int:
+    # filters are those of db.iter_export_runs (spec_id, base_prompt_id,
+    # model_names, since, until); returns the number of runs written
+    fmt = fmt or export_format(path)
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    schema = SCHEMA if include_text else SCHEMA.remove(SCHEMA.get_field_index("response_text"))
+
+    # written under a temp name and moved into place, so a failed export never
+    # leaves a truncated file behind under the requested name
+    tmp_path = f"{path}.part"
+    n = 0
+    try:
+        with WRITERS[fmt](tmp_path, schema) as writer:
+            for batch in iter_record_batches(schema, batch_rows, **filters):
+                writer.write_batch(batch)
+                n += batch.num_rows
+                if on_batch is not None:
+                    on_batch(n)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return n
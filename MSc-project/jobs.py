@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+import uuid
+
+import db
+from backends import get_backend
+from costs import apply_budget
+from ratelimit import RateLimitedScheduler
+from runner import make_task, pending_tasks, run_tasks_async
+from sweep import build_sweep_tasks
+
+# tasks per job: small enough that a lost lease repeats little work, large
+# enough that claiming stays cheap next to the calls themselves
+JOB_TASKS = 50
+HEARTBEAT_S = 10
+POLL_S = 2.0
+
+
+# ---- Enqueue ----
+def enqueue_tasks(spec_id: str, base_prompt_id: str, tasks: list[dict], params: dict, dataset_block: str = "") -> str | None:
+    # a job stores each task as [variant_id, model index, k_index]; the worker
+    # rebuilds the prompt from the variant and the batch's dataset block
+    if not tasks:
+        return None
+    models, refs = [], []
+    for t in tasks:
+        m = {k: t[k] for k in ("model_name", "temperature", "top_p", "max_tokens")}
+        if m not in models:
+            models.append(m)
+        refs.append([t["variant_id"], models.index(m), t["k_index"]])
+    job_tasks = [refs[i : i + JOB_TASKS] for i in range(0, len(refs), JOB_TASKS)]
+    return db.enqueue_job_batch(spec_id, base_prompt_id, {**params, "models": models}, dataset_block, job_tasks)
+
+
+def enqueue_sweep(
+    spec_id: str,
+    base_prompt_id: str,
+    models: list[dict],
+    k: int,
+    params: dict,
+    dataset_block: str = "",
+    budget: dict | None = None,
+):
+    # the budget is checked here, against the runs still missing, so a queued
+    # batch never goes over it
+    tasks, _ = pending_tasks(build_sweep_tasks(spec_id, base_prompt_id, models, k, dataset_block=dataset_block))
+    if budget and tasks:
+        tasks, _ = apply_budget(tasks, concurrency=params.get("concurrency", 8), **budget)
+    params = {**params, "model_concurrency": {m["model_name"]: m.get("max_concurrency") for m in models}}
+    return enqueue_tasks(spec_id, base_prompt_id, tasks, params, dataset_block), len(tasks)
+
+
+# ---- Worker ----
+def _job_tasks(job: dict) -> list[dict]:
+    models = job["params"]["models"]
+    prompts = {}
+    tasks = []
+    for variant_id, model_index, k_index in job["tasks"]:
+        if variant_id not in prompts:
+            vrec = db.load_prompt_variant(variant_id)
+            prompts[variant_id] = vrec["variant_prompt_text"].strip() + job["dataset_block"] if vrec else None
+        if prompts[variant_id] is None:
+            continue
+        m = models[model_index]
+        tasks.append(
+            make_task(variant_id, prompts[variant_id], m["model_name"], m["temperature"], m["top_p"], m["max_tokens"], k_index)
+        )
+    return tasks
+
+
+async def run_job_async(job: dict, worker_id: str) -> str:
+    params = job["params"]
+    tasks, n_stored = pending_tasks(_job_tasks(job))
+    progress = {"done": n_stored, "failed": 0, "cache_hits": 0}
+
+    def on_result(result):
+        progress["done"] += 1
+        progress["failed"] += result["error"] is not None
+        progress["cache_hits"] += bool(result.get("cache_hit"))
+
+    backend_name = params.get("backend", "openai")
+    backend_kwargs = {"max_retries": 0} if backend_name == "openai" else params.get("backend_kwargs", {})
+    scheduler = RateLimitedScheduler(
+        rpm=params.get("rpm"), tpm=params.get("tpm"), max_retries=params.get("max_retries", 5)
+    )
+    with db.RunWriter() as writer:
+        run = asyncio.ensure_future(
+            run_tasks_async(
+                job["spec_id"],
+                job["base_prompt_id"],
+                tasks,
+                concurrency=params.get("concurrency", 8),
+                model_concurrency=params.get("model_concurrency"),
+                bypass_cache=params.get("bypass_cache", False),
+                writer=writer,
+                scheduler=scheduler,
+                backend=get_backend(backend_name, **backend_kwargs),
+                on_result=on_result,
+                resume=False,
+            )
+        )
+        while not run.done():
+            await asyncio.wait([run], timeout=HEARTBEAT_S)
+            if not run.done() and not db.heartbeat_job(job["id"], worker_id, progress):
+                # cancelled from the UI, or the lease was lost to another worker
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+                return "stopped"
+        run.result()
+    # failed calls leave their runs missing; enqueueing the batch again retries just those
+    error = f"{progress['failed']} of {len(tasks)} calls failed" if progress["failed"] else None
+    db.finish_job(job["id"], worker_id, "done", progress, error)
+    return "done" if error is None else f"done ({error})"
+
+
+def work(worker_id: str | None = None, poll_s: float = POLL_S, max_jobs: int | None = None, exit_when_idle: bool = False):
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    db.init_db()
+    n_jobs = 0
+    while max_jobs is None or n_jobs < max_jobs:
+        job = db.claim_job(worker_id)
+        if job is None:
+            if exit_when_idle:
+                break
+            time.sleep(poll_s)
+            continue
+        n_jobs += 1
+        t0 = time.monotonic()
+        print(f"[{worker_id}] job {job['id'][:8]} ({len(job['tasks'])} runs) claimed", flush=True)
+        try:
+            status = asyncio.run(run_job_async(job, worker_id))
+        except KeyboardInterrupt:
+            db.release_job(job["id"], worker_id)
+            raise
+        except Exception as e:
+            db.finish_job(job["id"], worker_id, "failed", {"done": 0, "failed": 0, "cache_hits": 0}, repr(e))
+            status = f"failed: {e!r}"
+        print(f"[{worker_id}] job {job['id'][:8]} {status} in {time.monotonic() - t0:.1f}s", flush=True)
+    return n_jobs
+
+
+def _work_process(db_path: str, poll_s: float, exit_when_idle: bool):
+    db.DB_PATH = db_path
+    try:
+        work(poll_s=poll_s, exit_when_idle=exit_when_idle)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker processes that execute queued run jobs.")
+    parser.add_argument("command", choices=["work"])
+    parser.add_argument("--db", default=db.DB_PATH, help="path to the SQLite store")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start on this machine")
+    parser.add_argument("--poll", type=float, default=POLL_S, help="seconds between polls of an empty queue")
+    parser.add_argument("--exit-when-idle", action="store_true", help="stop once the queue is empty")
+    args = parser.parse_args(argv)
+
+    if args.processes <= 1:
+        _work_process(args.db, args.poll, args.exit_when_idle)
+        return 0
+    procs = [
+        multiprocessing.Process(target=_work_process, args=(args.db, args.poll, args.exit_when_idle))
+        for _ in range(args.processes)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,42 @@
-import json
 import time
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 
 def get_openai_client() -> OpenAI:
     return OpenAI()
 
 
+def get_async_openai_client(max_retries: int | None = None) -> AsyncOpenAI:
+    if max_retries is None:
+        return AsyncOpenAI()
+    return AsyncOpenAI(max_retries=max_retries)
+
+
+def _usage(resp) -> tuple:
+    usage = getattr(resp, "usage", None)
+    if not usage:
+        return None, None
+    return getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None)
+
+
+def _metrics(t0: float, t_first: float | None, usage: tuple = (None, None)) -> dict:
+    # latency is measured on the monotonic clock; tokens/sec covers generation
+    # only (after the first token) when streaming, the whole call otherwise
+    t_end = time.perf_counter()
+    gen_s = t_end - (t_first if t_first is not None else t0)
+    input_tokens, output_tokens = usage
+    return {
+        "latency_ms": int((t_end - t0) * 1000),
+        "ttft_ms": int((t_first - t0) * 1000) if t_first is not None else None,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "tokens_per_sec": output_tokens / gen_s if output_tokens and gen_s > 0 else None,
+    }
+
+
 def call_llm_openai(prompt_text: str, model_name: str, temperature: float, top_p: float, max_tokens: int):
     client = get_openai_client()
-    t0 = time.time()
+    t0 = time.perf_counter()
     resp = client.responses.create(
         model=model_name,
         input=prompt_text,
@@ -17,17 +44,52 @@ def call_llm_openai(prompt_text: str, model_name: str, temperature: float, top_p
         temperature=temperature,
         top_p=top_p,
     )
-    latency_ms = int((time.time() - t0) * 1000)
+    latency_ms = int((time.perf_counter() - t0) * 1000)
     return resp.output_text, latency_ms
 
 
-def try_parse_json(text: str):
-    text = (text or "").strip()
-    if text.startswith("```"):
-        text = text.strip("`").strip()
-        if text.lower().startswith("json"):
-            text = text[4:].strip()
-    try:
-        return json.loads(text), True
-    except Exception:
-        return None, False
+async def call_llm_openai_async(
+    prompt_text: str,
+    model_name: str,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    client: AsyncOpenAI | None = None,
+    stream: bool = False,
+    on_chunk=None,
+):
+    client = client or get_async_openai_client()
+    t0 = time.perf_counter()
+    if not stream:
+        resp = await client.responses.create(
+            model=model_name,
+            input=prompt_text,
+            max_output_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+        )
+        return resp.output_text, _metrics(t0, None, _usage(resp))
+
+    events = await client.responses.create(
+        model=model_name,
+        input=prompt_text,
+        max_output_tokens=max_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stream=True,
+    )
+    chunks = []
+    t_first = None
+    usage = (None, None)
+    async for event in events:
+        if event.type == "response.output_text.delta":
+            if t_first is None:
+                t_first = time.perf_counter()
+            chunks.append(event.delta)
+            if on_chunk:
+                on_chunk(event.delta)
+        elif event.type in ("response.completed", "response.incomplete"):
+            usage = _usage(event.response)
+        elif event.type in ("response.failed", "error"):
+            raise RuntimeError(f"streamed response failed: {event}")
+    return "".join(chunks), _metrics(t0, t_first, usage)
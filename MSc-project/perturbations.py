@@ -1,4 +1,8 @@
-from prompting import replace_section
+import hashlib
+import itertools
+import random
+
+from prompting import PromptDocument, replace_section
 
 PERSONAS = [
     {"id": "persona_default", "label": "Default (precise & reliable)", "role_text": "You are a precise and reliable assistant."},
@@ -21,6 +25,21 @@ OUTPUT_FORMATS = [
 ]
 
 
+SECTION_ORDERS = [
+    {"id": "order_default", "label": "Default (ROLE → CONTEXT → TASK → CONSTRAINTS → OUTPUT FORMAT)", "order": ["ROLE", "CONTEXT", "TASK", "CONSTRAINTS", "OUTPUT FORMAT"]},
+    {"id": "order_task_first", "label": "Task first", "order": ["TASK", "ROLE", "CONTEXT", "CONSTRAINTS", "OUTPUT FORMAT"]},
+    {"id": "order_format_first", "label": "Output format first", "order": ["OUTPUT FORMAT", "ROLE", "CONTEXT", "TASK", "CONSTRAINTS"]},
+    {"id": "order_context_last", "label": "Context last", "order": ["ROLE", "TASK", "CONSTRAINTS", "OUTPUT FORMAT", "CONTEXT"]},
+]
+
+PARAPHRASE_TEMPLATES = [
+    {"id": "para_none", "label": "Unchanged", "template": "{body}"},
+    {"id": "para_imperative", "label": "Imperative", "template": "Do the following: {body}"},
+    {"id": "para_polite", "label": "Polite request", "template": "Could you please help with this task? {body}"},
+    {"id": "para_goal", "label": "Goal framing", "template": "Your goal is to complete this task accurately. {body}"},
+]
+
+
 def apply_persona(base_prompt: str, persona: dict) -> str:
     return replace_section(base_prompt, "ROLE", persona["role_text"] + "\n")
 
@@ -29,6 +48,41 @@ def apply_output_format(base_prompt: str, fmt: dict) -> str:
     return replace_section(base_prompt, "OUTPUT FORMAT", fmt["text"].strip() + "\n")
 
 
+def _paraphrase_doc(doc: PromptDocument, template: dict):
+    body = doc.get("TASK")
+    if body is not None:
+        doc.set("TASK", template["template"].format(body=body))
+
+
+def apply_paraphrase(base_prompt: str, template: dict) -> str:
+    doc = PromptDocument.parse(base_prompt)
+    _paraphrase_doc(doc, template)
+    return doc.render()
+
+
+def inject_typos(text: str, rate: float, seed: int) -> str:
+    # swap two adjacent letters inside a word, at roughly `rate` of the words
+    rng = random.Random(seed)
+    words = text.split(" ")
+    for i, w in enumerate(words):
+        if len(w) > 3 and rng.random() < rate:
+            j = rng.randrange(1, len(w) - 2)
+            words[i] = w[:j] + w[j + 1] + w[j] + w[j + 2:]
+    return " ".join(words)
+
+
+def _typos_doc(doc: PromptDocument, rate: float, seed: int):
+    body = doc.get("TASK")
+    if body is not None and rate > 0:
+        doc.set("TASK", inject_typos(body, rate, seed))
+
+
+def apply_typos(base_prompt: str, rate: float, seed: int) -> str:
+    doc = PromptDocument.parse(base_prompt)
+    _typos_doc(doc, rate, seed)
+    return doc.render()
+
+
 def apply_task_type_flip(spec: dict) -> dict:
     flipped = dict(spec)
     current = (spec.get("task_type") or "").strip().lower()
@@ -41,58 +95,159 @@ def apply_task_type_flip(spec: dict) -> dict:
     return flipped
 
 
-def generate_variants(
-    base_prompt: str,
-    spec: dict,
-    selected_persona_ids: list[str],
-    selected_format_ids: list[str],
-    flip_task_type: bool,
-):
-    variants = []
+# ---- Axes ----
+# An axis is a named list of options; each option edits a parsed PromptDocument in
+# place and says what to record about itself. Variants are the lazy cartesian
+# product of axes: the base prompt is parsed once and each variant rendered once.
+def persona_axis(persona_ids: list[str]) -> dict:
     persona_map = {p["id"]: p for p in PERSONAS}
+    return {
+        "name": "persona",
+        "options": [
+            {
+                "id": pid,
+                "apply": lambda doc, p=persona_map[pid]: doc.set("ROLE", p["role_text"]),
+                "metadata": {"persona_id": pid, "persona_label": persona_map[pid]["label"]},
+            }
+            for pid in persona_ids
+        ],
+    }
+
+
+def format_axis(format_ids: list[str]) -> dict:
     fmt_map = {f["id"]: f for f in OUTPUT_FORMATS}
+    return {
+        "name": "format",
+        "options": [
+            {
+                "id": fid,
+                "apply": lambda doc, f=fmt_map[fid]: doc.set("OUTPUT FORMAT", f["text"]),
+                "metadata": {"format_id": fid, "format_label": fmt_map[fid]["label"]},
+            }
+            for fid in format_ids
+        ],
+    }
 
-    for pid in selected_persona_ids:
-        p = persona_map[pid]
-        for fid in selected_format_ids:
-            f = fmt_map[fid]
-
-            v_text = base_prompt
-            v_text = apply_persona(v_text, p)
-            v_text = apply_output_format(v_text, f)
-
-            variants.append(
-                {
-                    "perturbation_type": "persona+format",
-                    "perturbation_id": f"{p['id']}__{f['id']}",
-                    "strength": "medium",
-                    "prompt_text": v_text,
-                    "metadata": {
-                        "persona_id": p["id"],
-                        "persona_label": p["label"],
-                        "format_id": f["id"],
-                        "format_label": f["label"],
-                        "original_task_type": spec.get("task_type"),
-                    },
-                }
-            )
 
+def section_order_axis(order_ids: list[str]) -> dict:
+    order_map = {o["id"]: o for o in SECTION_ORDERS}
+    return {
+        "name": "section_order",
+        "options": [
+            {
+                "id": oid,
+                "apply": lambda doc, o=order_map[oid]: doc.reorder(o["order"]),
+                "metadata": {"section_order_id": oid, "section_order": order_map[oid]["order"]},
+            }
+            for oid in order_ids
+        ],
+    }
 
-    if flip_task_type:
-        flipped_spec = apply_task_type_flip(spec)
-        variants.append(
+
+def paraphrase_axis(template_ids: list[str]) -> dict:
+    template_map = {t["id"]: t for t in PARAPHRASE_TEMPLATES}
+    return {
+        "name": "paraphrase",
+        "options": [
             {
-                "perturbation_type": "task_framing",
-                "perturbation_id": "flip_task_type",
-                "strength": "low",
-                "prompt_text": base_prompt,
-                "metadata": {
-                    "original_task_type": spec.get("task_type"),
-                    "flipped_task_type": flipped_spec.get("task_type"),
-                    "note": "Spec-level framing perturbation; prompt text unchanged.",
-                },
+                "id": tid,
+                "apply": lambda doc, t=template_map[tid]: _paraphrase_doc(doc, t),
+                "metadata": {"paraphrase_id": tid, "paraphrase_label": template_map[tid]["label"]},
             }
-        )
+            for tid in template_ids
+        ],
+    }
+
 
+def typo_axis(rates: list[float], seeds: list[int]) -> dict:
+    return {
+        "name": "typos",
+        "options": [
+            {
+                "id": f"typo_{rate:g}_s{seed}",
+                "apply": lambda doc, rate=rate, seed=seed: _typos_doc(doc, rate, seed),
+                "metadata": {"typo_rate": rate, "typo_seed": seed},
+            }
+            for rate in rates
+            for seed in (seeds if rate > 0 else seeds[:1])
+        ],
+    }
+
+
+def count_variants(axes: list[dict]) -> int:
+    n = 1
+    for axis in axes:
+        n *= len(axis["options"])
+    return n
+
+
+def iter_variants(base_prompt: str, spec: dict, axes: list[dict], strength: str = "medium", dedup: bool = True):
+    axes = [a for a in axes if a["options"]]
+    if not axes:
+        return
+    perturbation_type = "+".join(a["name"] for a in axes)
+    base_doc = PromptDocument.parse(base_prompt)
+    seen = set()
+    for combo in itertools.product(*(a["options"] for a in axes)):
+        doc = base_doc.copy()
+        for opt in combo:
+            opt["apply"](doc)
+        v_text = doc.render()
+
+        if dedup:
+            digest = hashlib.blake2b(v_text.encode("utf-8"), digest_size=16).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+
+        metadata = {}
+        for opt in combo:
+            metadata.update(opt["metadata"])
+        metadata["original_task_type"] = spec.get("task_type")
+        yield {
+            "perturbation_type": perturbation_type,
+            "perturbation_id": "__".join(opt["id"] for opt in combo),
+            "strength": strength,
+            "prompt_text": v_text,
+            "metadata": metadata,
+        }
+
+
+def iter_chunks(variants, size: int = 500):
+    it = iter(variants)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def task_flip_variant(base_prompt: str, spec: dict) -> dict:
+    flipped_spec = apply_task_type_flip(spec)
+    return {
+        "perturbation_type": "task_framing",
+        "perturbation_id": "flip_task_type",
+        "strength": "low",
+        "prompt_text": base_prompt,
+        "metadata": {
+            "original_task_type": spec.get("task_type"),
+            "flipped_task_type": flipped_spec.get("task_type"),
+            "note": "Spec-level framing perturbation; prompt text unchanged.",
+        },
+    }
+
+
+def generate_variants(
+    base_prompt: str,
+    spec: dict,
+    selected_persona_ids: list[str],
+    selected_format_ids: list[str],
+    flip_task_type: bool,
+):
+    # persona × format combinations are always distinct, so no dedup here
+    axes = [persona_axis(selected_persona_ids), format_axis(selected_format_ids)]
+    variants = list(iter_variants(base_prompt, spec, axes, dedup=False)) if all(a["options"] for a in axes) else []
+    if flip_task_type:
+        variants.append(task_flip_variant(base_prompt, spec))
     return variants
 
@@ -1,3 +1,6 @@
+SECTION_NAMES = ["ROLE", "CONTEXT", "TASK", "CONSTRAINTS", "OUTPUT FORMAT"]
+
+
 def generate_pqb_from_spec(spec: dict) -> str:
     domain = (spec.get("domain_context") or "").strip()
     task_desc = (spec.get("task_description") or "").strip()
@@ -22,14 +25,75 @@ def generate_pqb_from_spec(spec: dict) -> str:
     return "\n".join(parts).strip()
 
 
+def _header_spans(prompt: str, section_names) -> list[tuple[int, int, str]]:
+    # str.find per name keeps the scan in C; a hit counts only if it is alone on its line
+    spans = []
+    for name in section_names:
+        i = prompt.find(name)
+        while i != -1:
+            end = i + len(name)
+            start = i
+            while start > 0 and prompt[start - 1] in " \t":
+                start -= 1
+            stop = end
+            while stop < len(prompt) and prompt[stop] in " \t":
+                stop += 1
+            if (start == 0 or prompt[start - 1] == "\n") and (stop == len(prompt) or prompt[stop] in "\r\n"):
+                spans.append((start, stop, name))
+            i = prompt.find(name, end)
+    spans.sort()
+    return spans
+
+
+class PromptDocument:
+    # A prompt split into named sections. A section starts at a line that is exactly
+    # its name and runs to the next such line, so bodies may contain blank lines.
+    def __init__(self, preamble: str, sections: list[list[str]]):
+        self.preamble = preamble
+        self.sections = sections
+
+    @classmethod
+    def parse(cls, prompt: str, section_names=SECTION_NAMES) -> "PromptDocument":
+        headers = _header_spans(prompt, section_names)
+        if not headers:
+            return cls(prompt.strip(), [])
+        ends = [start for start, _, _ in headers[1:]] + [len(prompt)]
+        sections = [[name, prompt[stop:end].strip()] for (_, stop, name), end in zip(headers, ends)]
+        return cls(prompt[:headers[0][0]].strip(), sections)
+
+    def copy(self) -> "PromptDocument":
+        return PromptDocument(self.preamble, [list(s) for s in self.sections])
+
+    def get(self, name: str):
+        for section in self.sections:
+            if section[0] == name:
+                return section[1]
+        return None
+
+    def set(self, name: str, body: str) -> "PromptDocument":
+        for section in self.sections:
+            if section[0] == name:
+                section[1] = body.strip()
+                return self
+        self.sections.append([name, body.strip()])
+        return self
+
+    def reorder(self, order: list[str]) -> "PromptDocument":
+        rank = {name: i for i, name in enumerate(order)}
+        # sections missing from `order` keep their relative place after the ordered ones
+        self.sections.sort(key=lambda s: rank.get(s[0], len(order)))
+        return self
+
+    def render(self) -> str:
+        parts = [self.preamble] if self.preamble else []
+        parts.extend(f"{name}\n{body}" for name, body in self.sections)
+        return "\n\n".join(parts).strip()
+
+
 def replace_section(prompt: str, section_name: str, new_body: str) -> str:
-    marker = f"{section_name}\n"
-    if marker not in prompt:
-        return (prompt.strip() + f"\n\n{section_name}\n{new_body.strip()}\n").strip()
-
-    before, after = prompt.split(marker, 1)
-    parts = after.split("\n\n", 1)
-    if len(parts) == 1:
-        return (before + marker + new_body.strip() + "\n").strip()
-    remainder = parts[1]
-    return (before + marker + new_body.strip() + "\n\n" + remainder).strip()
+    names = SECTION_NAMES if section_name in SECTION_NAMES else [*SECTION_NAMES, section_name]
+    return PromptDocument.parse(prompt, names).set(section_name, new_body).render()
+
+
+def reorder_sections(prompt: str, order: list[str]) -> str:
+    return PromptDocument.parse(prompt).reorder(order).render()
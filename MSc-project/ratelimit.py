@@ -0,0 +1,127 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from openai import APIConnectionError, APITimeoutError
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float) -> float:
+        # a request larger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= amount
+        return waited
+
+
+def _status(e):
+    # APIStatusError and the simulated backend's errors both carry status_code
+    return getattr(e, "status_code", None)
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, (APITimeoutError, APIConnectionError)):
+        return True
+    return _status(e) in RETRYABLE_STATUS
+
+
+def retry_after_s(e: Exception) -> float | None:
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedScheduler:
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_retries: int = 5,
+        base_delay_s: float = 1.0,
+        max_delay_s: float = 60.0,
+    ):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_retries = max_retries
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.counters = {"calls": 0, "throttled": 0, "rate_limited": 0, "retried": 0, "failed": 0}
+
+    async def _acquire(self, est_tokens: int):
+        waited = 0.0
+        if self.requests:
+            waited += await self.requests.acquire(1)
+        if self.tokens:
+            waited += await self.tokens.acquire(est_tokens)
+        if waited > 0:
+            self.counters["throttled"] += 1
+
+    def _backoff_s(self, attempt: int, e: Exception) -> float:
+        hinted = retry_after_s(e)
+        if hinted is not None:
+            return hinted + random.uniform(0, self.base_delay_s)
+        # full jitter keeps retries from many concurrent calls from re-colliding
+        return random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** attempt))
+
+    async def run(self, make_call, est_tokens: int):
+        attempt = 0
+        while True:
+            await self._acquire(est_tokens)
+            self.counters["calls"] += 1
+            try:
+                return await make_call()
+            except Exception as e:
+                if _status(e) == 429:
+                    self.counters["rate_limited"] += 1
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    self.counters["failed"] += 1
+                    raise
+                self.counters["retried"] += 1
+                await asyncio.sleep(self._backoff_s(attempt, e))
+                attempt += 1
+
+    def summary(self) -> str:
+        c = self.counters
+        return (
+            f"{c['calls']} API calls • {c['throttled']} throttled locally • "
+            f"{c['rate_limited']} rate-limited (429) • {c['retried']} retried • {c['failed']} failed"
+        )
@@ -0,0 +1,212 @@
+import asyncio
+
+from answers import parse_json
+from backends import OpenAIBackend
+from cache import call_llm_cached_async
+from costs import apply_budget
+from db import existing_run_keys, save_run, task_run_key
+from tokens import estimate_tokens
+
+
+def make_task(variant_id: str, prompt_text: str, model_name: str, temperature: float, top_p: float, max_tokens: int, k_index: int) -> dict:
+    task = {
+        "variant_id": variant_id,
+        "prompt_text": prompt_text,
+        "model_name": model_name,
+        "temperature": float(temperature),
+        "top_p": float(top_p),
+        "max_tokens": int(max_tokens),
+        "k_index": int(k_index),
+        "est_input_tokens": estimate_tokens(prompt_text),
+    }
+    task["run_key"] = task_run_key(task)
+    return task
+
+
+def pending_tasks(tasks: list[dict]) -> tuple[list[dict], int]:
+    # the requested runs minus those already stored (and duplicates within the
+    # request), so re-running an interrupted batch only makes the missing calls
+    done = existing_run_keys([t["run_key"] for t in tasks])
+    pending, seen = [], set()
+    for t in tasks:
+        if t["run_key"] not in done and t["run_key"] not in seen:
+            seen.add(t["run_key"])
+            pending.append(t)
+    return pending, len(tasks) - len(pending)
+
+
+async def _call_one(sems, backend, task: dict, bypass_cache: bool, stream: bool, on_chunk, scheduler):
+    # acquire the per-model slot before the global one so a saturated model
+    # never sits on global capacity other models could use
+    async with sems[0], sems[1]:
+        try:
+            resp_text, metrics, cache_hit, saved_latency_ms = await call_llm_cached_async(
+                prompt_text=task["prompt_text"],
+                model_name=task["model_name"],
+                temperature=task["temperature"],
+                top_p=task["top_p"],
+                max_tokens=task["max_tokens"],
+                k_index=task["k_index"],
+                bypass_cache=bypass_cache,
+                backend=backend,
+                stream=stream,
+                on_chunk=(lambda delta, restart: on_chunk(task, delta, restart)) if on_chunk else None,
+                scheduler=scheduler,
+            )
+        except Exception as e:
+            return task, (None, {"latency_ms": 0}, False, 0), e
+    return task, (resp_text, metrics, cache_hit, saved_latency_ms), None
+
+
+def _save_result(spec_id: str, base_prompt_id: str, task: dict, call: tuple, error, writer=None):
+    resp_text, metrics, cache_hit, saved_latency_ms = call
+    result = {
+        "variant_id": task["variant_id"],
+        "model_name": task["model_name"],
+        "k_index": task["k_index"],
+        "run_id": None,
+        "response_text": resp_text,
+        "latency_ms": metrics["latency_ms"],
+        "ttft_ms": metrics.get("ttft_ms"),
+        "output_tokens": metrics.get("output_tokens"),
+        "tokens_per_sec": metrics.get("tokens_per_sec"),
+        "est_input_tokens": task.get("est_input_tokens"),
+        "input_tokens": metrics.get("input_tokens"),
+        "parse_ok": False,
+        "cache_hit": cache_hit,
+        "saved_latency_ms": saved_latency_ms,
+        "error": error,
+    }
+    if error is not None:
+        return result
+    try:
+        parsed, ok = parse_json(resp_text)
+        result["parse_ok"] = ok
+        result["run_id"] = (writer.add if writer else save_run)(
+            spec_id=spec_id,
+            base_prompt_id=base_prompt_id,
+            variant_id=task["variant_id"],
+            model_name=task["model_name"],
+            temperature=task["temperature"],
+            top_p=task["top_p"],
+            max_tokens=task["max_tokens"],
+            k_index=task["k_index"],
+            full_prompt_text=task["prompt_text"],
+            response_text=resp_text,
+            latency_ms=metrics["latency_ms"],
+            parsed_json=parsed,
+            parse_ok=ok,
+            cache_hit=cache_hit,
+            saved_latency_ms=saved_latency_ms,
+            ttft_ms=metrics.get("ttft_ms"),
+            output_tokens=metrics.get("output_tokens"),
+            tokens_per_sec=metrics.get("tokens_per_sec"),
+            est_input_tokens=task.get("est_input_tokens"),
+            input_tokens=metrics.get("input_tokens"),
+            run_key=task.get("run_key"),
+        )
+    except Exception as e:
+        result["error"] = e
+    return result
+
+
+async def run_tasks_async(
+    spec_id: str,
+    base_prompt_id: str,
+    tasks: list[dict],
+    concurrency: int = 5,
+    model_concurrency: dict | None = None,
+    bypass_cache: bool = False,
+    writer=None,
+    stream: bool = False,
+    on_chunk=None,
+    scheduler=None,
+    backend=None,
+    on_result=None,
+    budget: dict | None = None,
+    resume: bool = True,
+):
+    if resume:
+        tasks, _ = pending_tasks(tasks)
+    if budget:
+        # raises costs.BudgetExceeded before any call is made, or trims the plan
+        tasks, _ = apply_budget(tasks, concurrency=concurrency, **budget)
+
+    global_sem = asyncio.Semaphore(max(1, int(concurrency)))
+    model_sems = {}
+    for task in tasks:
+        name = task["model_name"]
+        if name not in model_sems:
+            cap = (model_concurrency or {}).get(name) or concurrency
+            model_sems[name] = asyncio.Semaphore(max(1, int(cap)))
+
+    # the scheduler owns retries, so the client must not retry on its own as well
+    backend = backend or OpenAIBackend(max_retries=0 if scheduler else None)
+    pending = [
+        asyncio.create_task(
+            _call_one(
+                (model_sems[t["model_name"]], global_sem), backend, t, bypass_cache, stream, on_chunk, scheduler
+            )
+        )
+        for t in tasks
+    ]
+
+    results = []
+    try:
+        # save and report each run as soon as its call returns, not in submission order
+        for fut in asyncio.as_completed(pending):
+            task, call, error = await fut
+            result = _save_result(spec_id, base_prompt_id, task, call, error, writer)
+            results.append(result)
+            if on_result:
+                on_result(result)
+    finally:
+        for p in pending:
+            p.cancel()
+        await backend.aclose()
+
+    return results
+
+
+async def run_k_async(
+    spec_id: str,
+    base_prompt_id: str,
+    variant_id: str,
+    full_prompt: str,
+    model_name: str,
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    k: int,
+    concurrency: int = 5,
+    bypass_cache: bool = False,
+    stream: bool = False,
+    on_chunk=None,
+    scheduler=None,
+    backend=None,
+    on_result=None,
+    budget: dict | None = None,
+    resume: bool = True,
+):
+    tasks = [
+        make_task(variant_id, full_prompt, model_name, temperature, top_p, max_tokens, i)
+        for i in range(1, int(k) + 1)
+    ]
+    return await run_tasks_async(
+        spec_id,
+        base_prompt_id,
+        tasks,
+        concurrency=concurrency,
+        bypass_cache=bypass_cache,
+        stream=stream,
+        on_chunk=on_chunk,
+        scheduler=scheduler,
+        backend=backend,
+        on_result=on_result,
+        budget=budget,
+        resume=resume,
+    )
+
+
+def run_k(*args, **kwargs):
+    return asyncio.run(run_k_async(*args, **kwargs))
@@ -1,7 +1,8 @@
 import json
 import streamlit as st
 
-from db import list_specs, load_spec, list_base_prompts, load_base_prompt
+from dataset import open_dataset
+from db import list_specs, load_spec, list_base_prompts, load_base_prompt, load_spec_dataset_hash
 
 
 def render_sidebar():
@@ -22,6 +23,7 @@ def render_sidebar():
         if st.button("Open TaskSpec"):
             st.session_state.active_spec_id = chosen_spec
             st.session_state.step = 2
+            st.session_state["dataset_handle"] = open_dataset(load_spec_dataset_hash(chosen_spec))
 
         if not st.session_state.get("active_spec_id"):
             return
@@ -0,0 +1,60 @@
+import json
+import math
+
+# Log-bucketed quantile sketch (the DDSketch idea): a value v > 0 lands in bucket
+# ceil(log_gamma(v)), so any quantile read back is within RELATIVE_ACCURACY of
+# the true value. Sketches are plain {bucket: count} dicts; merging two is
+# adding their counts, which is what lets aggregates be updated per batch.
+RELATIVE_ACCURACY = 0.01
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+ZERO_BUCKET = -(2**31)
+
+
+def _bucket(value: float) -> int:
+    return ZERO_BUCKET if value <= 0 else math.ceil(math.log(value) / _LOG_GAMMA)
+
+
+def _bucket_value(bucket: int) -> float:
+    if bucket == ZERO_BUCKET:
+        return 0.0
+    # midpoint (in relative terms) of (gamma^(b-1), gamma^b]
+    return 2 * _GAMMA**bucket / (_GAMMA + 1)
+
+
+def sketch_add(sketch: dict, value: float, count: int = 1) -> dict:
+    b = _bucket(value)
+    sketch[b] = sketch.get(b, 0) + count
+    return sketch
+
+
+def sketch_merge(into: dict, other: dict) -> dict:
+    for b, c in other.items():
+        into[b] = into.get(b, 0) + c
+    return into
+
+
+def sketch_count(sketch: dict) -> int:
+    return sum(sketch.values())
+
+
+def sketch_quantile(sketch: dict, q: float):
+    total = sketch_count(sketch)
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for b in sorted(sketch):
+        seen += sketch[b]
+        if seen > rank:
+            return _bucket_value(b)
+    return _bucket_value(max(sketch))
+
+
+def sketch_dumps(sketch: dict) -> str:
+    # sorted, so the same sketch always serialises to the same text however it was built
+    return json.dumps(sketch, separators=(",", ":"), sort_keys=True)
+
+
+def sketch_loads(text: str | None) -> dict:
+    return {int(b): c for b, c in json.loads(text).items()} if text else {}
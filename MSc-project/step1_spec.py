@@ -1,7 +1,7 @@
 import json
-import pandas as pd
 import streamlit as st
 
+from dataset import ingest_csv
 from db import save_spec
 from prompting import generate_pqb_from_spec
 
@@ -22,12 +22,15 @@ def render_step1():
     
         uploaded_csv = st.file_uploader("Upload CSV (optional)", type=["csv"], key="csv_optional")
 
-        if uploaded_csv is not None:
-            st.session_state["uploaded_df"] = pd.read_csv(uploaded_csv)
-            st.success(
-                f"CSV loaded: {st.session_state['uploaded_df'].shape[0]} rows × "
-                f"{st.session_state['uploaded_df'].shape[1]} cols"
-            )
+        # ingest once per upload; reruns reuse the handle instead of re-reading the CSV
+        if uploaded_csv is not None and st.session_state.get("dataset_upload_id") != uploaded_csv.file_id:
+            with st.spinner("Ingesting CSV…"):
+                st.session_state["dataset_handle"] = ingest_csv(uploaded_csv, uploaded_csv.name)
+            st.session_state["dataset_upload_id"] = uploaded_csv.file_id
+
+        handle = st.session_state.get("dataset_handle")
+        if handle is not None:
+            st.success(f"CSV loaded: {handle['rows']} rows × {len(handle['columns'])} cols ({handle['name']})")
 
     if st.button("save TaskSpec JSON", type="primary"):
         spec = {
@@ -38,7 +41,7 @@ def render_step1():
             "output_format": output_format,
         
         }
-        spec_id = save_spec(spec)
+        spec_id = save_spec(spec, dataset_hash=handle["hash"] if handle else None)
         st.session_state.active_spec_id = spec_id
         st.session_state.step = 2
         st.session_state.pqb_text = generate_pqb_from_spec(spec)
@@ -1,8 +1,52 @@
+import itertools
 import streamlit as st
 import json
 
-from db import list_base_prompts, load_base_prompt, list_prompt_variants, save_prompt_variant, load_spec
-from perturbations import PERSONAS, OUTPUT_FORMATS, generate_variants
+from db import (
+    count_prompt_variants,
+    list_base_prompts,
+    load_base_prompt,
+    list_prompt_variants,
+    save_prompt_variant,
+    save_prompt_variants_many,
+    load_spec,
+)
+from perturbations import (
+    PERSONAS,
+    OUTPUT_FORMATS,
+    PARAPHRASE_TEMPLATES,
+    SECTION_ORDERS,
+    count_variants,
+    format_axis,
+    iter_chunks,
+    iter_variants,
+    paraphrase_axis,
+    persona_axis,
+    section_order_axis,
+    task_flip_variant,
+    typo_axis,
+)
+
+PREVIEW_LIMIT = 50
+SAVE_CHUNK = 500
+
+
+def _axes(cfg: dict) -> list[dict]:
+    axes = [persona_axis(cfg["personas"]), format_axis(cfg["formats"])]
+    if cfg["orders"]:
+        axes.append(section_order_axis(cfg["orders"]))
+    if cfg["paraphrases"]:
+        axes.append(paraphrase_axis(cfg["paraphrases"]))
+    if cfg["typo_rates"]:
+        axes.append(typo_axis(cfg["typo_rates"], list(range(cfg["typo_seeds"]))))
+    return axes
+
+
+def _variant_stream(base_prompt_text: str, spec: dict, cfg: dict):
+    variants = iter_variants(base_prompt_text, spec, _axes(cfg))
+    if cfg["flip_task_type"]:
+        variants = itertools.chain(variants, [task_flip_variant(base_prompt_text, spec)])
+    return variants
 
 
 def render_step3():
@@ -47,19 +91,55 @@ def render_step3():
     with cC:
         flip_task_type = st.checkbox("Flip task type (Deterministic ↔ Judgmental)", value=False)
 
+    with st.expander("More perturbation axes"):
+        cD, cE, cF = st.columns(3)
+        with cD:
+            selected_orders = st.multiselect(
+                "Section orders",
+                options=[o["id"] for o in SECTION_ORDERS],
+                format_func=lambda oid: next(o["label"] for o in SECTION_ORDERS if o["id"] == oid),
+            )
+        with cE:
+            selected_paraphrases = st.multiselect(
+                "Task paraphrases",
+                options=[t["id"] for t in PARAPHRASE_TEMPLATES],
+                format_func=lambda tid: next(t["label"] for t in PARAPHRASE_TEMPLATES if t["id"] == tid),
+            )
+        with cF:
+            typo_rates = st.multiselect("Typo rates (share of task words)", options=[0.0, 0.05, 0.1, 0.2, 0.3])
+            typo_seeds = st.number_input("Typo seeds per rate", min_value=1, max_value=100, value=3, step=1)
+
+    cfg = {
+        "personas": selected_personas,
+        "formats": selected_formats,
+        "orders": selected_orders,
+        "paraphrases": selected_paraphrases,
+        "typo_rates": typo_rates,
+        "typo_seeds": int(typo_seeds),
+        "flip_task_type": flip_task_type,
+    }
+    st.caption(f"Grid size before dedup: {count_variants([a for a in _axes(cfg) if a['options']]) + int(flip_task_type)}")
+
     if st.button("Generate variants", type="primary"):
-        generated = generate_variants(
-            base_prompt=base_prompt_text,
-            spec=spec,
-            selected_persona_ids=selected_personas,
-            selected_format_ids=selected_formats,
-            flip_task_type=flip_task_type,
-        )
-        st.session_state.generated_variants = generated
-        st.success(f"Generated {len(generated)} variants. Review below and save.")
+        # only a preview is materialized; saving re-streams the full grid
+        preview = list(itertools.islice(_variant_stream(base_prompt_text, spec, cfg), PREVIEW_LIMIT + 1))
+        st.session_state.generated_variants = preview[:PREVIEW_LIMIT]
+        st.session_state.generated_variants_cfg = cfg
+        more = f" (showing the first {PREVIEW_LIMIT})" if len(preview) > PREVIEW_LIMIT else ""
+        st.success(f"Generated variants{more}. Review below and save.")
 
     if "generated_variants" in st.session_state and st.session_state.generated_variants:
         st.subheader("Generated variants (preview)")
+        if st.button("💾 Save all generated variants"):
+            gen_cfg = st.session_state.get("generated_variants_cfg", cfg)
+            n_before = count_prompt_variants(st.session_state.active_spec_id, base_prompt_id)
+            saved = 0
+            status = st.empty()
+            for chunk in iter_chunks(_variant_stream(base_prompt_text, spec, gen_cfg), SAVE_CHUNK):
+                saved += len(save_prompt_variants_many(st.session_state.active_spec_id, base_prompt_id, chunk))
+                status.text(f"Saved {saved} variants…")
+            n_new = count_prompt_variants(st.session_state.active_spec_id, base_prompt_id) - n_before
+            st.success(f"Saved {n_new} new variants; {saved - n_new} were already stored for this base prompt.")
         for i, v in enumerate(st.session_state.generated_variants, start=1):
             with st.expander(f"Variant {i}: {v['perturbation_type']} • {v['perturbation_id']}"):
                 st.code(v["prompt_text"], language="text")
@@ -1,17 +1,51 @@
 import os
+import time
 import streamlit as st
 
-from db import load_prompt_variant, save_run, list_runs, load_run
-from dataset import dataset_block_for_prompt
-from llm import call_llm_openai, try_parse_json
+from db import cancel_job_batch, count_prompt_variants, list_job_batches, load_prompt_variant, list_runs, load_run
+from dataset import dataset_block_for_prompt, render_dataset_block_settings
+from backends import BACKENDS, get_backend
+from costs import BudgetExceeded, apply_budget, estimate_plan, plan_for_sweep, plan_summary
+from jobs import enqueue_sweep, enqueue_tasks
+from ratelimit import RateLimitedScheduler
+from runner import make_task, pending_tasks, run_k
+from sweep import run_sweep
+
+JOB_POLL_S = 3
+EXECUTION_MODES = {
+    "session": "In this browser session",
+    "queue": "Background workers (start them with `python jobs.py work`)",
+}
 
 
 def render_step4(saved_variant_rows, base_prompt_id, base_prompt_text):
     st.header("Step 4 — Run LLM Executions (k repeats)")
 
-    if not os.getenv("OPENAI_API_KEY"):
-        st.error("OPENAI_API_KEY is not set in your environment. Set it and restart Streamlit.")
-        st.stop()
+    backend_name = st.selectbox(
+        "Backend",
+        options=list(BACKENDS),
+        format_func=lambda b: {"openai": "OpenAI API", "simulated": "Simulated (replays saved runs, no network)"}[b],
+        key="backend_step4",
+    )
+    backend_kwargs = {}
+    if backend_name == "simulated":
+        s1, s2, s3, s4 = st.columns(4)
+        with s1:
+            backend_kwargs["latency_ms_median"] = st.number_input("median latency (ms)", min_value=1, value=800, step=100)
+        with s2:
+            backend_kwargs["latency_sigma"] = st.number_input("latency sigma (lognormal)", min_value=0.0, value=0.5, step=0.1)
+        with s3:
+            backend_kwargs["error_rate"] = st.number_input("error rate", min_value=0.0, max_value=1.0, value=0.0, step=0.01)
+        with s4:
+            backend_kwargs["seed"] = st.number_input("seed", min_value=0, value=0, step=1)
+    execution = st.radio(
+        "Execution", options=list(EXECUTION_MODES), format_func=EXECUTION_MODES.get, horizontal=True,
+        key="execution_step4",
+    )
+    # queued jobs call the API from the worker processes, which need their own key
+    backend_ready = execution == "queue" or backend_name != "openai" or bool(os.getenv("OPENAI_API_KEY"))
+    if not backend_ready:
+        st.error("OPENAI_API_KEY is not set in your environment. Set it and restart Streamlit, or use the simulated backend.")
 
     chosen_variant_id = st.selectbox(
         "Choose a variant to run",
@@ -34,42 +68,173 @@ def render_step4(saved_variant_rows, base_prompt_id, base_prompt_text):
     with c4:
         max_tokens = st.number_input("max_tokens", min_value=64, max_value=4096, value=512, step=64)
 
-    k = st.number_input("k repeats", min_value=1, max_value=20, value=3, step=1)
+    c5, c6, c7, c8 = st.columns(4)
+    with c5:
+        k = st.number_input("k repeats", min_value=1, max_value=20, value=3, step=1)
+    with c6:
+        concurrency = st.number_input("max concurrent calls", min_value=1, max_value=20, value=5, step=1)
+    with c7:
+        bypass_cache = st.checkbox("Bypass response cache", value=False)
+    with c8:
+        stream = st.checkbox("Stream output (records time-to-first-token)", value=True)
+
+    with st.expander("Rate limits and retries"):
+        r1, r2, r3 = st.columns(3)
+        with r1:
+            rpm = st.number_input("requests/min (0 = unlimited)", min_value=0, value=0, step=50)
+        with r2:
+            tpm = st.number_input("tokens/min (0 = unlimited)", min_value=0, value=0, step=10000)
+        with r3:
+            max_retries = st.number_input("max retries per call", min_value=0, max_value=10, value=5, step=1)
+
+    with st.expander("Budget"):
+        b1, b2, b3 = st.columns(3)
+        with b1:
+            max_cost_usd = st.number_input("max cost per run/sweep in USD (0 = none)", min_value=0.0, value=0.0, step=0.5)
+        with b2:
+            max_total_tokens = st.number_input("max tokens per run/sweep (0 = none)", min_value=0, value=0, step=10000)
+        with b3:
+            budget_mode = st.radio(
+                "when over budget",
+                options=["refuse", "trim"],
+                format_func={"refuse": "refuse to start", "trim": "run the variants that fit"}.get,
+                horizontal=True,
+            )
+    budget = None
+    if max_cost_usd or max_total_tokens:
+        budget = {"max_cost_usd": max_cost_usd or None, "max_tokens": int(max_total_tokens) or None, "mode": budget_mode}
+
+    render_dataset_block_settings()
+
+    def make_scheduler():
+        return RateLimitedScheduler(rpm=rpm or None, tpm=tpm or None, max_retries=int(max_retries))
+
+    def make_backend():
+        if backend_name == "openai":
+            # the scheduler owns retries
+            return get_backend("openai", max_retries=0)
+        return get_backend(backend_name, **backend_kwargs)
+
+    job_params = {
+        "backend": backend_name,
+        "backend_kwargs": backend_kwargs,
+        "rpm": rpm or None,
+        "tpm": tpm or None,
+        "max_retries": int(max_retries),
+        "bypass_cache": bypass_cache,
+    }
 
-    if st.button("▶ Run k executions", type="primary"):
-        full_prompt = variant_prompt_text.strip() + dataset_block_for_prompt()
+    full_prompt = variant_prompt_text.strip() + dataset_block_for_prompt()
+    pending, n_stored = pending_tasks(
+        [make_task(chosen_variant_id, full_prompt, model_name, temperature, top_p, max_tokens, i) for i in range(1, int(k) + 1)]
+    )
+    plan = estimate_plan(pending, concurrency=int(concurrency), rpm=rpm or None, tpm=tpm or None)
+    if n_stored:
+        st.caption(
+            f"{n_stored} of the k={k} runs with these settings are already stored and will not run again; "
+            "raise k for more repeats."
+        )
+    st.caption(f"Projected: {plan_summary(plan)}")
 
-        for i in range(1, int(k) + 1):
+    if execution == "queue":
+        if st.button("⏩ Queue k executions", type="primary", disabled=not pending):
             try:
-                resp_text, latency_ms = call_llm_openai(
-                    prompt_text=full_prompt,
-                    model_name=model_name,
-                    temperature=float(temperature),
-                    top_p=float(top_p),
-                    max_tokens=int(max_tokens),
-                )
-                parsed, ok = try_parse_json(resp_text)
-
-                run_id = save_run(
-                    spec_id=st.session_state.active_spec_id,
-                    base_prompt_id=base_prompt_id,
-                    variant_id=chosen_variant_id,
-                    model_name=model_name,
-                    temperature=float(temperature),
-                    top_p=float(top_p),
-                    max_tokens=int(max_tokens),
-                    k_index=i,
-                    full_prompt_text=full_prompt,
-                    response_text=resp_text,
-                    latency_ms=latency_ms,
-                    parsed_json=parsed,
-                    parse_ok=ok,
+                queued = apply_budget(pending, concurrency=int(concurrency), **budget)[0] if budget else pending
+            except BudgetExceeded as e:
+                st.error(str(e))
+            else:
+                enqueue_tasks(
+                    st.session_state.active_spec_id, base_prompt_id, queued,
+                    {**job_params, "concurrency": int(concurrency)}, dataset_block_for_prompt(),
                 )
+                st.success(f"Queued {len(queued)} runs; progress is under Background jobs below.")
+    elif st.button("▶ Run k executions", type="primary", disabled=not backend_ready or not pending):
+        scheduler = make_scheduler()
+
+        n_pending = len(pending)
+        progress = st.progress(0.0, text=f"0/{n_pending} runs finished")
+        done = []
+        slots = {}
+        for i in (t["k_index"] for t in pending):
+            with st.container():
+                slots[i] = (st.empty(), st.empty())
+                slots[i][0].caption(f"Run {i}/{k} • waiting…")
+        partial = {i: "" for i in slots}
+
+        def on_chunk(task, delta, restart):
+            # restart: a retry is streaming the response again from the start
+            i = task["k_index"]
+            partial[i] = delta if restart else partial[i] + delta
+            slots[i][1].code(partial[i], language="text")
+
+        def on_result(r):
+            done.append(r)
+            progress.progress(len(done) / n_pending, text=f"{len(done)}/{n_pending} runs finished")
+            status, body = slots[r["k_index"]]
+            if r["error"] is not None:
+                status.error(f"Run {r['k_index']} failed: {r['error']}")
+                return
+            cached = f" • cache hit (saved {r['saved_latency_ms']}ms)" if r["cache_hit"] else ""
+            speed = ""
+            if r["ttft_ms"] is not None:
+                speed += f" • ttft={r['ttft_ms']}ms"
+            if r["tokens_per_sec"]:
+                speed += f" • {r['tokens_per_sec']:.1f} tok/s"
+            status.success(
+                f"Run {r['k_index']}/{k} saved: {r['run_id'][:8]}… • latency={r['latency_ms']}ms{speed} • parse_ok={r['parse_ok']}{cached}"
+            )
+            body.code(r["response_text"], language="text")
 
-                st.success(f"Run {i}/{k} saved: {run_id[:8]}… • latency={latency_ms}ms • parse_ok={ok}")
-                st.code(resp_text, language="text")
-            except Exception as e:
-                st.error(f"Run {i} failed: {e}")
+        t0 = time.perf_counter()
+        try:
+            run_k(
+                spec_id=st.session_state.active_spec_id,
+                base_prompt_id=base_prompt_id,
+                variant_id=chosen_variant_id,
+                full_prompt=full_prompt,
+                model_name=model_name,
+                temperature=float(temperature),
+                top_p=float(top_p),
+                max_tokens=int(max_tokens),
+                k=int(k),
+                concurrency=int(concurrency),
+                bypass_cache=bypass_cache,
+                stream=stream,
+                on_chunk=on_chunk if stream else None,
+                scheduler=scheduler,
+                backend=make_backend(),
+                on_result=on_result,
+                budget=budget,
+            )
+        except BudgetExceeded as e:
+            st.error(str(e))
+        else:
+            hits = sum(1 for r in done if r["cache_hit"])
+            st.caption(
+                f"{len(done)} runs finished in {time.perf_counter() - t0:.1f}s wall-clock • "
+                f"cache hit rate {hits / max(1, len(done)):.0%} • {scheduler.summary()}"
+            )
+
+    st.divider()
+    render_sweep(
+        base_prompt_id,
+        # saved_variant_rows is capped for the picker; the sweep covers every variant
+        count_prompt_variants(st.session_state.active_spec_id, base_prompt_id),
+        temperature,
+        top_p,
+        max_tokens,
+        k,
+        bypass_cache,
+        stream,
+        make_scheduler,
+        make_backend if backend_ready else None,
+        budget=budget,
+        rpm=rpm or None,
+        tpm=tpm or None,
+        execution=execution,
+        job_params=job_params,
+    )
+    render_job_batches(base_prompt_id)
 
     st.divider()
     st.subheader("Recent runs for this variant")
@@ -90,6 +255,150 @@ def render_step4(saved_variant_rows, base_prompt_id, base_prompt_text):
             st.code(rr["full_prompt_text"], language="text")
             st.markdown("**Response**")
             st.code(rr["response_text"], language="text")
+            ttft = f"{rr['ttft_ms']}ms" if rr["ttft_ms"] is not None else "n/a"
+            tps = f"{rr['tokens_per_sec']:.1f}" if rr["tokens_per_sec"] else "n/a"
+            st.markdown(
+                f"**Latency:** {rr['latency_ms']}ms • **TTFT:** {ttft} • "
+                f"**Output tokens:** {rr['output_tokens'] or 'n/a'} • **Tokens/sec:** {tps}"
+            )
+            st.markdown(
+                f"**Input tokens:** {rr['input_tokens'] or 'n/a'} (estimated {rr['est_input_tokens'] or 'n/a'})"
+            )
+            answer_note = "" if rr["answer_valid"] else f" ⚠️ {rr['answer_error']}"
+            st.markdown(f"**Answer ({rr['answer_format'] or 'free text'}):** `{rr['answer']}`{answer_note}")
             st.markdown(f"**JSON parse ok:** {rr['parse_ok']}")
             if rr["parse_ok"]:
                 st.json(rr["parsed_json"])
+
+
+def render_sweep(
+    base_prompt_id,
+    n_variants,
+    temperature,
+    top_p,
+    max_tokens,
+    k,
+    bypass_cache,
+    stream,
+    make_scheduler,
+    make_backend,
+    budget=None,
+    rpm=None,
+    tpm=None,
+    execution="session",
+    job_params=None,
+):
+    st.subheader("Sweep all saved variants × models × k")
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        models_raw = st.text_input("Models (comma-separated)", value="gpt-4.1-mini", key="sweep_models")
+    with c2:
+        global_cap = st.number_input("global max concurrent calls", min_value=1, max_value=64, value=8, step=1)
+    with c3:
+        model_cap = st.number_input("per-model max concurrent calls", min_value=1, max_value=64, value=4, step=1)
+
+    model_names = [m.strip() for m in models_raw.split(",") if m.strip()]
+    models = [
+        {
+            "model_name": name,
+            "temperature": float(temperature),
+            "top_p": float(top_p),
+            "max_tokens": int(max_tokens),
+            "max_concurrency": int(model_cap),
+        }
+        for name in model_names
+    ]
+    st.caption(
+        f"{n_variants} variants × {len(models)} models × k={k} = {n_variants * len(models) * int(k)} runs "
+        "(settings above apply to every model; runs already stored are skipped)"
+    )
+    dataset_block = dataset_block_for_prompt()
+    if models:
+        plan = plan_for_sweep(
+            st.session_state.active_spec_id,
+            base_prompt_id,
+            models,
+            int(k),
+            dataset_block=dataset_block,
+            concurrency=int(global_cap),
+            rpm=rpm,
+            tpm=tpm,
+        )
+        st.caption(f"Projected: {plan_summary(plan)}")
+
+    if execution == "queue":
+        if st.button("⏩ Queue full sweep", disabled=not models):
+            try:
+                batch_id, n_queued = enqueue_sweep(
+                    st.session_state.active_spec_id,
+                    base_prompt_id,
+                    models,
+                    int(k),
+                    {**(job_params or {}), "concurrency": int(global_cap)},
+                    dataset_block=dataset_block,
+                    budget=budget,
+                )
+            except BudgetExceeded as e:
+                st.error(str(e))
+                return
+            if batch_id is None:
+                st.info("Every run of this sweep is already stored.")
+            else:
+                st.success(f"Queued {n_queued} runs; progress is under Background jobs below.")
+    elif st.button("▶ Run full sweep", disabled=not models or make_backend is None):
+        scheduler = make_scheduler()
+        status = st.empty()
+        progress_bar = st.progress(0.0)
+
+        def on_progress(progress, result):
+            progress_bar.progress(progress.done / max(1, progress.total))
+            status.text(f"{progress.summary()}\n{scheduler.summary()}")
+
+        try:
+            _, progress = run_sweep(
+                spec_id=st.session_state.active_spec_id,
+                base_prompt_id=base_prompt_id,
+                models=models,
+                k=int(k),
+                concurrency=int(global_cap),
+                dataset_block=dataset_block,
+                bypass_cache=bypass_cache,
+                stream=stream,
+                scheduler=scheduler,
+                backend=make_backend(),
+                on_progress=on_progress,
+                budget=budget,
+            )
+        except BudgetExceeded as e:
+            st.error(str(e))
+            return
+        st.success(f"Sweep finished in {progress.elapsed_s:.1f}s • {progress.summary()} • {scheduler.summary()}")
+
+
+def render_job_batches(base_prompt_id):
+    batches = list_job_batches(base_prompt_id)
+    if not batches:
+        return
+    st.subheader("Background jobs")
+    active = any(b["jobs"]["queued"] or b["jobs"]["running"] for b in batches)
+
+    # only this panel reruns while polling, not the whole page
+    @st.fragment(run_every=JOB_POLL_S if active else None)
+    def panel():
+        for b in list_job_batches(base_prompt_id):
+            jobs = b["jobs"]
+            states = " • ".join(f"{n} {status}" for status, n in jobs.items() if n)
+            c1, c2 = st.columns([5, 1])
+            with c1:
+                st.progress(
+                    min(1.0, b["done"] / max(1, b["n_tasks"])),
+                    text=f"{b['created_at'][:19]} • {b['done']}/{b['n_tasks']} runs ({b['failed']} failed, "
+                    f"{b['cache_hits']} cache hits) • jobs: {states}",
+                )
+            with c2:
+                if (jobs["queued"] or jobs["running"]) and st.button("Cancel", key=f"cancel_batch_{b['id']}"):
+                    cancel_job_batch(b["id"])
+                    st.rerun(scope="fragment")
+
+    panel()
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+from costs import apply_budget
+from db import RunWriter, iter_variant_prompts
+from runner import make_task, pending_tasks, run_tasks_async
+
+
+def build_sweep_tasks(
+    spec_id: str,
+    base_prompt_id: str,
+    models: list[dict],
+    k: int,
+    dataset_block: str = "",
+) -> list[dict]:
+    tasks = []
+    for variant_id, prompt_text in iter_variant_prompts(spec_id, base_prompt_id):
+        full_prompt = prompt_text.strip() + dataset_block
+        for m in models:
+            for i in range(1, int(k) + 1):
+                tasks.append(
+                    make_task(variant_id, full_prompt, m["model_name"], m["temperature"], m["top_p"], m["max_tokens"], i)
+                )
+    return tasks
+
+
+class SweepProgress:
+    def __init__(self, total: int, skipped: int = 0):
+        self.total = total
+        # requested runs that were already stored and so not executed again
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.saved_latency_ms = 0
+        self.t0 = time.monotonic()
+
+    def record(self, result: dict):
+        self.done += 1
+        if result["error"] is not None:
+            self.failed += 1
+        if result.get("cache_hit"):
+            self.cache_hits += 1
+            self.saved_latency_ms += result.get("saved_latency_ms") or 0
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.monotonic() - self.t0
+
+    @property
+    def runs_per_min(self) -> float:
+        elapsed = self.elapsed_s
+        return self.done / elapsed * 60 if elapsed > 0 else 0.0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cache_hits / self.done if self.done else 0.0
+
+    @property
+    def eta_s(self) -> float | None:
+        if not self.done:
+            return None
+        return (self.total - self.done) / (self.done / self.elapsed_s)
+
+    def summary(self) -> str:
+        eta = "?" if self.eta_s is None else f"{self.eta_s:.0f}s"
+        skipped = f" • {self.skipped} already stored" if self.skipped else ""
+        return (
+            f"{self.done}/{self.total} runs ({self.failed} failed){skipped} • "
+            f"{self.runs_per_min:.1f} runs/min • ETA {eta} • "
+            f"cache hits {self.cache_hit_rate:.0%} ({self.saved_latency_ms / 1000:.1f}s saved)"
+        )
+
+
+async def run_sweep_async(
+    spec_id: str,
+    base_prompt_id: str,
+    models: list[dict],
+    k: int,
+    concurrency: int = 8,
+    dataset_block: str = "",
+    bypass_cache: bool = False,
+    stream: bool = False,
+    scheduler=None,
+    backend=None,
+    on_progress=None,
+    budget: dict | None = None,
+    resume: bool = True,
+    tasks: list[dict] | None = None,
+):
+    if tasks is None:
+        tasks = build_sweep_tasks(spec_id, base_prompt_id, models, k, dataset_block=dataset_block)
+    skipped = 0
+    if resume:
+        tasks, skipped = pending_tasks(tasks)
+    if budget:
+        tasks, _ = apply_budget(tasks, concurrency=concurrency, **budget)
+    model_concurrency = {m["model_name"]: m.get("max_concurrency") for m in models}
+    progress = SweepProgress(len(tasks), skipped)
+
+    def on_result(result):
+        progress.record(result)
+        if on_progress:
+            on_progress(progress, result)
+
+    with RunWriter() as writer:
+        results = await run_tasks_async(
+            spec_id,
+            base_prompt_id,
+            tasks,
+            concurrency=concurrency,
+            model_concurrency=model_concurrency,
+            bypass_cache=bypass_cache,
+            writer=writer,
+            stream=stream,
+            scheduler=scheduler,
+            backend=backend,
+            on_result=on_result,
+            resume=False,
+        )
+    return results, progress
+
+
+def run_sweep(*args, **kwargs):
+    return asyncio.run(run_sweep_async(*args, **kwargs))
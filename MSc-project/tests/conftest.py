@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# the app modules live flat in MSc-project/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # an initialized SQLite store in a temp dir, standing in for spec_store.db
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "store.db"))
+    db.clear_read_cache()
+    db.init_db()
+    yield db
+    db.close_conn()
+    db.clear_read_cache()
@@ -0,0 +1,52 @@
+def _variants(db):
+    return db.save_prompt_variants_many(
+        "spec", "base",
+        [
+            {"perturbation_type": "format", "perturbation_id": f"fmt-{i}", "strength": "medium",
+             "prompt_text": f"Variant {i}: return ONLY YES or NO.", "metadata": {"format_id": "fmt_binary_only"}}
+            for i in range(3)
+        ],
+    )
+
+
+def _run(variant_id, model_name, k_index):
+    response = ["YES", "NO", "YES because", "", "no"][k_index % 5]
+    return {
+        "spec_id": "spec",
+        "base_prompt_id": "base",
+        "variant_id": variant_id,
+        "model_name": model_name,
+        "temperature": 0.2,
+        "top_p": 1.0,
+        "max_tokens": 64,
+        "k_index": k_index,
+        "full_prompt_text": "prompt",
+        "response_text": response,
+        "latency_ms": 37 * k_index + 5,
+        "parse_ok": False,
+        "cache_hit": k_index % 4 == 0,
+    }
+
+
+def _aggregate_rows(db):
+    return db.get_conn().execute(
+        """
+        SELECT variant_id, model_name, spec_id, base_prompt_id, n_runs, n_parse_ok, n_answer_valid,
+               n_cache_hit, latency_sum_ms, latency_sketch, answer_counts_json
+        FROM variant_aggregates
+        ORDER BY variant_id, model_name
+        """
+    ).fetchall()
+
+
+def test_incremental_aggregates_match_a_rebuild(store):
+    variant_ids = _variants(store)
+    runs = [_run(v, m, k) for k in range(1, 13) for m in ("m-b", "m-a") for v in reversed(variant_ids)]
+    # saved in uneven batches, so each aggregate is merged several times in varying order
+    for start, size in ((0, 5), (5, 17), (22, 1), (23, 49)):
+        store.save_runs_many(runs[start : start + size])
+    incremental = _aggregate_rows(store)
+    assert len(incremental) == 6
+
+    assert store.rebuild_variant_aggregates() == 6
+    assert _aggregate_rows(store) == incremental
@@ -0,0 +1,41 @@
+import pytest
+
+from answers import extract_answer
+
+CASES = [
+    # format_id, response, (answer, valid, error)
+    ("fmt_free_text", "Yes, the revenue grew.\nMore detail.", ("YES, THE REVENUE GREW", True, None)),
+    ("fmt_free_text", "**No.**", ("NO", True, None)),
+    ("fmt_free_text", '{"answer": "yes"}', ("YES", True, None)),
+    ("fmt_free_text", "", ("", False, "empty response")),
+    ("fmt_free_text", "  \n ", ("", False, "empty response")),
+    ("fmt_binary_only", "YES", ("YES", True, None)),
+    ("fmt_binary_only", " **no**.\n", ("NO", True, None)),
+    ("fmt_binary_only", "YES because revenue grew", ("YES", False, "extra text after YES/NO")),
+    ("fmt_binary_only", "Maybe", ("MAYBE", False, "no YES/NO answer")),
+    ("fmt_binary_only", '```json\n{"answer": "NO"}\n```', ("NO", False, "no YES/NO answer")),
+    ("fmt_binary_only", "", ("", False, "no YES/NO answer")),
+    ("fmt_binary_reason", "YES - revenue grew", ("YES", True, None)),
+    ("fmt_binary_reason", "No — the margin fell", ("NO", True, None)),
+    ("fmt_binary_reason", "YES", ("YES", False, "no hyphen and rationale after YES/NO")),
+    ("fmt_binary_reason", "NO, the margin fell", ("NO", False, "no hyphen and rationale after YES/NO")),
+    ("fmt_binary_reason", "The margin fell - NO", ("THE MARGIN FELL - NO", False, "no leading YES/NO answer")),
+    ("fmt_binary_reason", "", ("", False, "no leading YES/NO answer")),
+    ("fmt_json_strict", '{"answer": "yes", "reason": "grew"}', ("YES", True, None)),
+    ("fmt_json_strict", ' {"verdict": "No."} \n', ("NO", True, None)),
+    ("fmt_json_strict", '```json\n{"answer": "NO"}\n```', ("NO", False, "JSON wrapped in a code fence")),
+    ("fmt_json_strict", '```\n{"decision": "YES"}\n```', ("YES", False, "JSON wrapped in a code fence")),
+    ("fmt_json_strict", '{"answer": "YES"', ('{"ANSWER": "YES', False, "invalid JSON")),
+    ("fmt_json_strict", "YES", ("YES", False, "invalid JSON")),
+    ("fmt_json_strict", '["YES"]', ('["YES"]', False, "JSON is not an object")),
+    ("fmt_json_strict", '{"reason": "grew"}', ('{"reason":"grew"}', False, "no answer/decision/label/verdict/result field")),
+    ("fmt_json_strict", "", ("", False, "invalid JSON")),
+    # unknown or missing formats fall back to free text
+    ("fmt_unknown", "yes.", ("YES", True, None)),
+    (None, None, ("", False, "empty response")),
+]
+
+
+@pytest.mark.parametrize("format_id, response, expected", CASES)
+def test_extract_answer(format_id, response, expected):
+    assert extract_answer(format_id, response) == expected
@@ -0,0 +1,43 @@
+import asyncio
+
+from backends import SimulatedBackend
+from cache import _inflight, call_llm_cached_async
+
+
+def _call(backend):
+    return call_llm_cached_async("Return ONLY YES or NO.", "m", 0.2, 1.0, 64, 1, backend=backend)
+
+
+def test_waiters_survive_a_cancelled_shared_call(store):
+    backend = SimulatedBackend(latency_ms_median=50, latency_sigma=0.01, seed=1)
+
+    async def scenario():
+        first = asyncio.create_task(_call(backend))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(_call(backend))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        # the second call was waiting on the first; it makes its own call instead of hanging
+        return await asyncio.wait_for(second, timeout=5), first
+
+    (resp_text, _, cache_hit, _), first = asyncio.run(scenario())
+    assert first.cancelled()
+    assert resp_text and not cache_hit
+    assert not _inflight
+    # and its response was cached
+    assert asyncio.run(_call(backend))[2]
+
+
+def test_cache_hits_touch_last_used_at_sparingly(store):
+    store.put_cached_response("k", "m", "YES", 120)
+    conn = store.get_conn()
+    conn.execute("UPDATE llm_cache SET last_used_at = '2000-01-01T00:00:00+00:00'")
+
+    assert store.get_cached_response("k") == ("YES", 120)
+    touched = conn.execute("SELECT last_used_at FROM llm_cache").fetchone()[0]
+    assert touched > "2000-01-01"
+    total_changes = conn.total_changes
+    for _ in range(10):
+        assert store.get_cached_response("k") == ("YES", 120)
+    assert conn.total_changes == total_changes
+    assert conn.execute("SELECT last_used_at FROM llm_cache").fetchone()[0] == touched
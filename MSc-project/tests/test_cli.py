@@ -0,0 +1,33 @@
+import json
+
+import cli
+
+SPEC = {
+    "task_type": "Deterministic",
+    "decision_format": "Binary",
+    "domain_context": "Geography",
+    "task_description": "Is Paris the capital of France?",
+    "output_format": "Return ONLY YES or NO.",
+}
+
+
+def _counts(db):
+    conn = db.get_conn()
+    tables = ("specs", "base_prompts", "prompt_variants", "runs")
+    return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in tables}
+
+
+def test_rerunning_a_command_resumes_instead_of_duplicating(store, tmp_path):
+    spec_file = tmp_path / "spec.json"
+    spec_file.write_text(json.dumps(SPEC))
+    argv = [
+        "run", "--db", store.DB_PATH, "--spec-file", str(spec_file),
+        "--personas", "persona_default", "--formats", "fmt_binary_only", "fmt_json_strict",
+        "--models", "m-a", "--k", "2", "--backend", "simulated", "--no-dataset",
+    ]
+    assert cli.main(argv) == 0
+    first = _counts(store)
+    assert first == {"specs": 1, "base_prompts": 1, "prompt_variants": 2, "runs": 4}
+
+    assert cli.main(argv) == 0
+    assert _counts(store) == first
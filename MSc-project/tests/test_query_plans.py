@@ -0,0 +1,52 @@
+def _seed(db):
+    spec_id = db.save_spec({"task_type": "Deterministic"})
+    base_prompt_id = db.save_base_prompt(spec_id, "Return ONLY YES or NO.")
+    variant_ids = db.save_prompt_variants_many(
+        spec_id,
+        base_prompt_id,
+        [
+            {
+                "perturbation_type": "format",
+                "perturbation_id": f"fmt_{i}",
+                "strength": "medium",
+                "prompt_text": f"variant {i}",
+                "metadata": {"format_id": "fmt_binary_only"},
+            }
+            for i in range(3)
+        ],
+    )
+    for variant_id in variant_ids:
+        for k in (1, 2):
+            db.save_run(
+                spec_id, base_prompt_id, variant_id, "m", 0.2, 1.0, 64, k,
+                "variant", "YES", 100, {}, False,
+            )
+    db.enqueue_job_batch(spec_id, base_prompt_id, {"models": []}, "", [[[variant_ids[0], 0, 1]]])
+
+
+def test_read_queries_use_indexes(store):
+    _seed(store)
+    assert store.find_table_scans() == {}
+
+
+def test_table_scans_are_detected(store, monkeypatch):
+    # the check itself must flag a lookup no index serves, aliased or not
+    _seed(store)
+
+    def by_response():
+        return store.get_conn().execute("SELECT r.id FROM runs r WHERE r.response_text = 'YES'").fetchall()
+
+    monkeypatch.setattr(store, "_read_queries", lambda: {"by_response": by_response})
+    assert "by_response" in store.find_table_scans()
+
+
+def test_unindexed_sorts_are_detected(store, monkeypatch):
+    _seed(store)
+
+    def runs_by_latency():
+        return store.get_conn().execute(
+            "SELECT id FROM runs WHERE base_prompt_id = 'x' ORDER BY latency_ms LIMIT 20"
+        ).fetchall()
+
+    monkeypatch.setattr(store, "_read_queries", lambda: {"runs_by_latency": runs_by_latency})
+    assert "USE TEMP B-TREE FOR ORDER BY" in store.find_table_scans()["runs_by_latency"]
@@ -0,0 +1,99 @@
+from runner import make_task, pending_tasks
+
+
+def _variant(db, text="Return ONLY YES or NO."):
+    return db.save_prompt_variants_many(
+        "spec", "base",
+        [{"perturbation_type": "format", "perturbation_id": "fmt", "strength": "medium", "prompt_text": text,
+          "metadata": {"format_id": "fmt_binary_only"}}],
+    )[0]
+
+
+def _run(variant_id, k_index, response="YES", prompt="Return ONLY YES or NO."):
+    return {
+        "spec_id": "spec",
+        "base_prompt_id": "base",
+        "variant_id": variant_id,
+        "model_name": "m",
+        "temperature": 0.2,
+        "top_p": 1.0,
+        "max_tokens": 64,
+        "k_index": k_index,
+        "full_prompt_text": prompt,
+        "response_text": response,
+        "latency_ms": 100,
+        "parse_ok": False,
+    }
+
+
+def _n_runs(db):
+    return db.get_conn().execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+
+def test_saving_a_batch_again_only_inserts_new_runs(store):
+    vid = _variant(store)
+    first = store.save_runs_many([_run(vid, k) for k in (1, 2, 3)])
+    assert _n_runs(store) == 3
+
+    # the same three (with different responses, as a retry would give) plus two new
+    again = store.save_runs_many([_run(vid, k, response="NO") for k in (1, 2, 3, 4, 5)])
+    assert again[:3] == first
+    assert _n_runs(store) == 5
+    stored = dict(store.get_conn().execute("SELECT k_index, response_text FROM runs"))
+    assert stored == {1: "YES", 2: "YES", 3: "YES", 4: "NO", 5: "NO"}
+    # aggregates count each run once
+    assert store.load_variant_aggregates([vid])[vid][0]["n_runs"] == 5
+
+
+def test_duplicates_within_a_batch_are_inserted_once(store):
+    vid = _variant(store)
+    ids = store.save_runs_many([_run(vid, 1), _run(vid, 1), _run(vid, 2)])
+    assert ids[0] == ids[1] != ids[2]
+    assert _n_runs(store) == 2
+
+
+def test_run_writer_flushes_are_idempotent(store):
+    vid = _variant(store)
+    with store.RunWriter(batch_size=2) as writer:
+        for k in (1, 2, 2, 3):
+            writer.add(**_run(vid, k))
+    assert _n_runs(store) == 3
+
+
+def test_resume_runs_only_the_missing_tasks(store):
+    prompt = "Return ONLY YES or NO."
+    vid = _variant(store, prompt)
+    tasks = [make_task(vid, prompt, "m", 0.2, 1.0, 64, k) for k in range(1, 6)]
+    # an interrupted batch stored the first two runs
+    store.save_runs_many([dict(_run(vid, t["k_index"], prompt=prompt), run_key=t["run_key"]) for t in tasks[:2]])
+
+    pending, n_done = pending_tasks(tasks + tasks[:1])
+    assert n_done == 3
+    assert [t["k_index"] for t in pending] == [3, 4, 5]
+
+
+def test_backfill_keys_a_store_saved_before_run_keys(store):
+    vid = _variant(store)
+    store.save_runs_many([_run(vid, 1), _run(vid, 2)])
+    conn = store.get_conn()
+    # a pre-run_key store: no keys, and k=1 stored twice by a re-run batch
+    conn.execute(
+        """
+        INSERT INTO runs (id, created_at, spec_id, base_prompt_id, variant_id, model_name, temperature, top_p,
+                          max_tokens, k_index, full_prompt_text, prompt_hash, response_text, latency_ms,
+                          parsed_json, parse_ok, answer, answer_valid)
+        SELECT 'older-copy', '2000-01-01T00:00:00+00:00', spec_id, base_prompt_id, variant_id, model_name,
+               temperature, top_p, max_tokens, k_index, full_prompt_text, prompt_hash, response_text, latency_ms,
+               parsed_json, parse_ok, answer, answer_valid
+        FROM runs WHERE k_index = 1
+        """
+    )
+    expected = dict(conn.execute("SELECT id, run_key FROM runs WHERE run_key IS NOT NULL"))
+    conn.execute("UPDATE runs SET run_key = NULL")
+
+    assert store.backfill_run_keys() == 3
+    keys = dict(conn.execute("SELECT id, run_key FROM runs"))
+    # the newest copy of k=1 takes the key, the older one is set aside
+    assert keys.pop("older-copy") == "superseded:older-copy"
+    assert keys == expected
+    assert store.backfill_run_keys() == 0
@@ -0,0 +1,49 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# Offline token estimate shaped after the GPT BPE vocabularies: a space-prefixed
+# common word is one token, long words split every ~6 letters, numbers split into
+# groups of up to 3 digits, punctuation and other symbols are mostly one token
+# each, and a run of newlines/indentation is one token. Runs store the actual
+# input_tokens next to this estimate so costs.calibration_factor() can correct
+# it from history.
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d+|[^\S\n]*\n\s*|[^\S\n]{2,}|[^\sA-Za-z\d]")
+
+LETTERS_PER_TOKEN = 6
+DIGITS_PER_TOKEN = 3
+
+# the same prompts are estimated over and over (sweeps, cost plans, reruns);
+# entries are keyed by a digest so the cache never holds the texts themselves
+ESTIMATE_CACHE_MAX = 4096
+_estimates = OrderedDict()
+_estimates_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    with _estimates_lock:
+        n = _estimates.get(key)
+        if n is not None:
+            _estimates.move_to_end(key)
+            return n
+    n = _count_tokens(text)
+    with _estimates_lock:
+        _estimates[key] = n
+        if len(_estimates) > ESTIMATE_CACHE_MAX:
+            _estimates.popitem(last=False)
+    return n
+
+
+def _count_tokens(text: str) -> int:
+    n = 0
+    for piece in _PIECE_RE.findall(text):
+        c = piece[0]
+        if c.isalpha() and c.isascii():
+            n += (len(piece) + LETTERS_PER_TOKEN - 1) // LETTERS_PER_TOKEN
+        elif c.isdigit():
+            n += (len(piece) + DIGITS_PER_TOKEN - 1) // DIGITS_PER_TOKEN
+        else:
+            n += 1
+    return n + 1